@@ -2,9 +2,9 @@
 import sys
 import os
 import json
+import argparse
 import numpy as np
 import math
-import pandas as pd
 
 try:
     import xarray as xr
@@ -12,6 +12,28 @@ except Exception as exc:
     print(json.dumps({"error": f"xarray not available: {exc}"}))
     sys.exit(1)
 
+from cache import ResultCache, file_sha256
+from encoding import FORMATS, dumps_json, encode, unavailable, write
+from sniff import sniff_file
+from timings import NULL_TIMER, StageTimer, dumps_with_timings, profiled
+
+# Bump whenever summarize_dataset output changes so cached results are not reused
+ANALYZER_VERSION = "3"
+CACHE_DIR = os.environ.get("ANALYZER_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+CACHE_MAX_BYTES = int(os.environ.get("ANALYZER_CACHE_MAX_MB", "512")) * 1024 * 1024
+# Numeric variables larger than this are reduced in slices (see _variable_stats)
+STATS_BUDGET_BYTES = int(os.environ.get("ANALYZER_STATS_BUDGET_MB", "256")) * 1024 * 1024
+
+# Preview records: at most PREVIEW_POINTS, with at least PREVIEW_MIN_LEVELS levels per previewed profile
+PREVIEW_POINTS = 1000
+PREVIEW_MIN_LEVELS = 8
+
+# Per-stage timings in every result (--timings, or "timings": true per --serve request)
+TIMINGS = os.environ.get("ANALYZER_TIMINGS", "") not in ("", "0")
+
+# Set by main(); None disables caching
+result_cache = None
+
 
 def _clean_number(value):
     try:
@@ -25,28 +47,168 @@ def _clean_number(value):
         return None
 
 
-def summarize_dataset(ds: "xr.Dataset") -> dict:
+def _flat_size(da) -> int:
+    return int(da.size) if da.ndim else 1
+
+
+def _take1d(da, positions: np.ndarray) -> np.ndarray:
+    """Values of da flattened in C order at positions, reading only the leading rows needed."""
+    if da.ndim == 0:
+        return np.array([da.values])[positions[positions < 1]]
+    positions = positions[positions < da.size]
+    row_size = int(np.prod(da.shape[1:], dtype=np.int64))
+    rows, inverse = np.unique(positions // row_size, return_inverse=True)
+    block = da.isel({da.dims[0]: rows}).values.reshape(len(rows), -1)
+    return block[inverse, positions % row_size]
+
+
+def _even_positions(total: int, n: int) -> np.ndarray:
+    """Up to n evenly spaced positions in range(total), all of them when total <= n."""
+    if total <= n:
+        return np.arange(total)
+    return np.unique(np.linspace(0, total - 1, n).round().astype(np.int64))
+
+
+def _profile_preview(ds: "xr.Dataset", keys: dict, n_points: int) -> dict:
+    """Preview columns for (profile, level) variables, covering the whole file.
+
+    Evenly spaced profiles are read, and their levels are reduced to the
+    minimum and maximum of temperature (pressure if absent) in each of
+    levels // 2 buckets, so profile shapes survive the point budget.
+    """
+    pres = ds[keys["pressure"]]
+    profile_dim = pres.dims[0]
+    n_profiles, n_levels = pres.shape
+    levels = n_levels if n_profiles * n_levels <= n_points else \
+        min(n_levels, max(PREVIEW_MIN_LEVELS, n_points // n_profiles))
+    profiles = _even_positions(n_profiles, max(1, n_points // levels))
+
+    block = {field: (ds[key].isel({profile_dim: profiles}).values.astype(np.float64) if key and key in ds else None)
+             for field, key in keys.items()}
+    pressure = block["pressure"].reshape(len(profiles), -1)
+    # Trailing fill levels that no previewed profile uses
+    used = np.flatnonzero(np.isfinite(pressure).any(axis=0))
+    width = int(used[-1]) + 1 if used.size else 0
+    grid = {}
+    for field, values in block.items():
+        if values is None:
+            grid[field] = np.full((len(profiles), width), np.nan)
+        elif values.ndim == 1:
+            grid[field] = np.repeat(values[:, None], width, axis=1)
+        else:
+            grid[field] = values.reshape(len(profiles), -1)[:, :width]
+
+    keep = np.ones((len(profiles), width), dtype=bool)
+    if width > levels:
+        shape = grid["temperature"] if np.isfinite(grid["temperature"]).any() else grid["pressure"]
+        bucket = np.arange(width) * (levels // 2) // width
+        starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+        low = np.where(np.isnan(shape), np.inf, shape)
+        high = np.where(np.isnan(shape), -np.inf, shape)
+        index = np.arange(width)
+        # First level at each bucket's minimum and last level at its maximum
+        first = np.minimum.reduceat(np.where(low == np.minimum.reduceat(low, starts, axis=1)[:, bucket], index, width),
+                                    starts, axis=1)
+        last = np.maximum.reduceat(np.where(high == np.maximum.reduceat(high, starts, axis=1)[:, bucket], index, -1),
+                                   starts, axis=1)
+        keep[:] = False
+        rows = np.arange(len(profiles))[:, None]
+        keep[rows, first] = True
+        keep[rows, last] = True
+    keep &= np.isfinite(grid["pressure"]) | np.isfinite(grid["temperature"]) | np.isfinite(grid["salinity"])
+    return {field: values[keep] for field, values in grid.items()}
+
+
+def _single_profile(ds: "xr.Dataset", keys: dict) -> "xr.Dataset":
+    """keys' variables of a one-profile file shaped for _profile_preview.
+
+    Variables along the 1-D pressure's level dimension gain a leading profile
+    dimension of length 1; the others (lat/lon) keep their first value.
+    """
+    level_dim = ds[keys["pressure"]].dims[0]
+    variables = {}
+    for key in keys.values():
+        if key and key in ds:
+            da = ds[key]
+            if da.dims == (level_dim,):
+                variables[key] = da.expand_dims("profile")
+            else:
+                variables[key] = xr.DataArray(da.values.reshape(-1)[:1], dims=("profile",))
+    return xr.Dataset(variables)
+
+
+def _clean_column(values: np.ndarray, n: int) -> list:
+    """Python floats for finite values; None for NaN/inf and for rows past the end."""
+    finite = np.isfinite(values)
+    cleaned = np.where(finite, values.astype(np.float64), None).tolist()
+    return cleaned + [None] * (n - len(cleaned))
+
+
+def _variable_stats(da, budget_bytes: int):
+    """(min, max, mean) of a numeric variable, ignoring NaN.
+
+    Variables that fit in budget_bytes are loaded whole; larger ones are read
+    in slices along their leading dimension and reduced incrementally, so
+    memory stays around budget_bytes regardless of file size.
+    """
+    if da.size == 0:
+        return None, None, None
+    if da.ndim == 0 or da.nbytes <= budget_bytes:
+        dd = da.to_numpy()
+        with np.errstate(all='ignore'):
+            return (
+                _clean_number(np.nanmin(dd)),
+                _clean_number(np.nanmax(dd)),
+                _clean_number(np.nanmean(dd)),
+            )
+
+    row_bytes = max(1, da.nbytes // da.shape[0])
+    rows = max(1, budget_bytes // row_bytes)
+    low = high = None
+    total = 0.0
+    count = 0
+    for start in range(0, da.shape[0], rows):
+        chunk = da.isel({da.dims[0]: slice(start, start + rows)}).to_numpy()
+        values = chunk[~np.isnan(chunk)] if np.issubdtype(chunk.dtype, np.floating) else chunk.reshape(-1)
+        if values.size == 0:
+            continue
+        chunk_low, chunk_high = values.min(), values.max()
+        low = chunk_low if low is None else min(low, chunk_low)
+        high = chunk_high if high is None else max(high, chunk_high)
+        total += float(values.sum(dtype=np.float64))
+        count += values.size
+    if count == 0:
+        return None, None, None
+    return _clean_number(low), _clean_number(high), _clean_number(total / count)
+
+
+def summarize_dataset(ds: "xr.Dataset", stats_budget_bytes: int = None, timer=NULL_TIMER,
+                      columnar: bool = False) -> dict:
+    """Summary, preview keys and preview records of ds.
+
+    records is a list of per-row dicts, or with columnar one list per field
+    (see encoding.py).
+    """
+    if stats_budget_bytes is None:
+        stats_budget_bytes = STATS_BUDGET_BYTES
     info = {
         "dims": {k: int(v) for k, v in ds.dims.items()},
         "coords": list(ds.coords.keys()),
         "vars": {},
     }
 
-    for name, da in ds.data_vars.items():
-        v = {
-            "dtype": str(da.dtype),
-            "dims": list(da.dims),
-            "shape": [int(s) for s in da.shape],
-            "attrs": {k: (str(v) if not isinstance(v, (int, float, bool)) else v) for k, v in da.attrs.items()},
-        }
-        # simple stats for numeric variables
-        if np.issubdtype(da.dtype, np.number):
-            dd = da.to_numpy()
-            with np.errstate(all='ignore'):
-                v["min"] = _clean_number(np.nanmin(dd) if dd.size else None)
-                v["max"] = _clean_number(np.nanmax(dd) if dd.size else None)
-                v["mean"] = _clean_number(np.nanmean(dd) if dd.size else None)
-        info["vars"][name] = v
+    with timer.stage("variable_stats"):
+        for name, da in ds.data_vars.items():
+            v = {
+                "dtype": str(da.dtype),
+                "dims": list(da.dims),
+                "shape": [int(s) for s in da.shape],
+                "attrs": {k: (str(v) if not isinstance(v, (int, float, bool)) else v) for k, v in da.attrs.items()},
+            }
+            # simple stats for numeric variables
+            if np.issubdtype(da.dtype, np.number):
+                v["min"], v["max"], v["mean"] = _variable_stats(da, stats_budget_bytes)
+            info["vars"][name] = v
 
     # detect likely time/lat/lon/pressure variables
     def find(keys):
@@ -59,93 +221,174 @@ def summarize_dataset(ds: "xr.Dataset") -> dict:
                 return lower[k.lower()]
         return None
 
-    time_key = find(["time", "TIME", "JULD"]) or find(list(ds.coords.keys()))
-    lat_key = find(["latitude", "LATITUDE", "lat", "LAT"]) 
-    lon_key = find(["longitude", "LONGITUDE", "lon", "LON"]) 
-    pres_key = find(["pressure", "PRES", "PRES_ADJUSTED"]) 
-    temp_key = find(["TEMP", "TEMP_ADJUSTED"]) 
-    sal_key = find(["PSAL", "PSAL_ADJUSTED"]) 
-    platform_key = find(["platform_number", "PLATFORM_NUMBER", "float_serial_no", "FLOAT_SERIAL_NO"]) 
+    with timer.stage("variable_lookup"):
+        time_key = find(["time", "TIME", "JULD"]) or find(list(ds.coords.keys()))
+        lat_key = find(["latitude", "LATITUDE", "lat", "LAT"])
+        lon_key = find(["longitude", "LONGITUDE", "lon", "LON"])
+        pres_key = find(["pressure", "PRES", "PRES_ADJUSTED"])
+        temp_key = find(["TEMP", "TEMP_ADJUSTED"])
+        sal_key = find(["PSAL", "PSAL_ADJUSTED"])
+        platform_key = find(["platform_number", "PLATFORM_NUMBER", "float_serial_no", "FLOAT_SERIAL_NO"])
 
     preview = {"time": time_key, "lat": lat_key, "lon": lon_key, "pressure": pres_key, "temperature": temp_key, "salinity": sal_key, "platform": platform_key}
 
-    sample = []
-    records = []
-    try:
-        # Build a simple flattened preview of up to 1000 rows if axes are present
-        if time_key and lat_key and lon_key:
-            time_vals = ds[time_key]
-            lat_vals = ds[lat_key]
-            lon_vals = ds[lon_key]
-            # Broadcast where possible, else take first along extra dims
-            def as1d(da):
-                arr = da.values
-                if arr.ndim == 0:
-                    return np.array([arr])
-                return arr.reshape(-1)
-            t = as1d(time_vals)
-            la = as1d(lat_vals)
-            lo = as1d(lon_vals)
-            n = int(min(1000, max(len(t), len(la), len(lo))))
-            # Resolve platform once
-            platform_value = None
-            if platform_key and platform_key in ds:
-                try:
-                    pv = ds[platform_key].values
-                    if pv.size == 0:
+    records = {} if columnar else []
+    n = 0
+    with timer.stage("preview"):
+        try:
+            # Build a flattened preview of up to PREVIEW_POINTS rows spread over the file if axes are present
+            if time_key and lat_key and lon_key:
+                # Resolve platform once
+                platform_value = None
+                if platform_key and platform_key in ds:
+                    try:
+                        pv = ds[platform_key].values
+                        if pv.size == 0:
+                            platform_value = None
+                        else:
+                            platform_value = str(pv.flat[0]).strip()
+                    except Exception:
                         platform_value = None
-                    else:
-                        platform_value = str(pv.flat[0]).strip()
-                except Exception:
-                    platform_value = None
-
-            for i in range(n):
-                item = {
-                    "time": str(pd.to_datetime(t[i], errors="coerce")),
-                    "lat": _clean_number(la[i]) if i < len(la) and np.isfinite(la[i]) else None,
-                    "lon": _clean_number(lo[i]) if i < len(lo) and np.isfinite(lo[i]) else None,
-                }
-                if platform_value is not None:
-                    item["platform"] = platform_value
-                if pres_key and pres_key in ds:
-                    pa = as1d(ds[pres_key])
-                    item["pressure"] = _clean_number(pa[i]) if i < len(pa) and np.isfinite(pa[i]) else None
-                if temp_key and temp_key in ds:
-                    ta = as1d(ds[temp_key])
-                    item["temperature"] = _clean_number(ta[i]) if i < len(ta) and np.isfinite(ta[i]) else None
-                if sal_key and sal_key in ds:
-                    sa = as1d(ds[sal_key])
-                    item["salinity"] = _clean_number(sa[i]) if i < len(sa) and np.isfinite(sa[i]) else None
-                sample.append(item)
-
-                # Records limited to requested fields
-                records.append({
-                    "platform": item.get("platform"),
-                    "lat": item.get("lat"),
-                    "lon": item.get("lon"),
-                    "pressure": item.get("pressure"),
-                    "temperature": item.get("temperature"),
-                    "salinity": item.get("salinity"),
-                })
-    except Exception:
-        pass
 
-    # Cap records to 1000 entries for payload size
-    return {"summary": info, "preview_keys": preview, "records": records[:1000]}
+                fields = {"lat": lat_key, "lon": lon_key, "pressure": pres_key,
+                          "temperature": temp_key, "salinity": sal_key}
+                pres = ds[pres_key] if pres_key and pres_key in ds else None
+                profile_ds = None
+                if (pres is not None and pres.ndim == 2 and ds[lat_key].ndim == 1
+                        and ds[lat_key].dims[0] == pres.dims[0]):
+                    # Profile files: lat/lon per profile, pressure/temperature/salinity per level
+                    profile_ds = ds
+                elif (pres is not None and pres.ndim == 1 and pres.dims[0] not in ds[time_key].dims
+                        and _flat_size(ds[lat_key]) == 1):
+                    # One-cycle files: a single position and 1-D level variables
+                    profile_ds = _single_profile(ds, fields)
+                if profile_ds is not None:
+                    values = _profile_preview(profile_ds, fields, PREVIEW_POINTS)
+                    n = len(values["pressure"])
+                    columns = {"platform": [platform_value] * n}
+                    columns.update((field, _clean_column(values[field], n)) for field in fields)
+                else:
+                    sizes = [_flat_size(ds[k]) for k in (time_key, lat_key, lon_key)]
+                    # Rows pair the i-th flattened value of every variable; stop where time runs out
+                    positions = _even_positions(int(min(max(sizes), sizes[0])), PREVIEW_POINTS)
+                    n = len(positions)
+                    columns = {"platform": [platform_value] * n}
+                    for field, key in fields.items():
+                        if key and key in ds:
+                            columns[field] = _clean_column(_take1d(ds[key], positions), n)
+                        else:
+                            columns[field] = [None] * n
+
+                if columnar:
+                    records = columns
+                else:
+                    fields = list(columns)
+                    records = [dict(zip(fields, row)) for row in zip(*columns.values())]
+        except Exception:
+            records = {} if columnar else []
+            n = 0
+        timer.add_rows("preview", n)
+
+    return {"summary": info, "preview_keys": preview, "records": records}
+
+
+def analyze_file(file_path: str, timer=NULL_TIMER, columnar: bool = False) -> dict:
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    key = None
+    if result_cache is not None:
+        with timer.stage("cache_lookup"):
+            key = f"{file_sha256(file_path)}:{ANALYZER_VERSION}" + (":columnar" if columnar else "")
+            cached = result_cache.get(key)
+        if cached is not None:
+            timer.add_rows("cache_lookup", 1)
+            return json.loads(cached)
+    with timer.stage("open"):
+        ds = xr.open_dataset(file_path)
+    with ds:
+        result = summarize_dataset(ds, timer=timer, columnar=columnar)
+    if key is not None:
+        with timer.stage("cache_store"):
+            result_cache.put(key, json.dumps(result, allow_nan=False))
+    return result
+
+
+def _serve_analyze(request: dict) -> dict:
+    columnar = request.get("format") == "columnar"
+    if not (request.get("timings") or TIMINGS):
+        return analyze_file(request["path"], columnar=columnar)
+    timer = StageTimer()
+    result = analyze_file(request["path"], timer, columnar)
+    return dict(result, timings=timer.to_json())
+
+
+def _serve_sniff(request: dict) -> dict:
+    if not os.path.exists(request["path"]):
+        raise FileNotFoundError(f"File not found: {request['path']}")
+    return sniff_file(request["path"], STATS_BUDGET_BYTES)
+
+
+def _serve_cache_stats(request: dict) -> dict:
+    return result_cache.stats() if result_cache is not None else {"enabled": False}
 
 
 def main() -> int:
-    if len(sys.argv) < 2:
+    global result_cache, STATS_BUDGET_BYTES, TIMINGS
+    parser = argparse.ArgumentParser(description="Summarize a NetCDF upload as JSON.")
+    parser.add_argument("file", nargs="?", help="NetCDF file to analyze")
+    parser.add_argument("--serve", action="store_true",
+                        help="run as a long-lived JSON-lines service on stdin/stdout (see service.py)")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes in --serve mode")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="result cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="always recompute, bypassing the result cache")
+    parser.add_argument("--cache-stats", action="store_true", help="print result cache counters and exit")
+    parser.add_argument("--stats-budget-mb", type=int, default=STATS_BUDGET_BYTES // (1024 * 1024),
+                        help="memory budget for per-variable statistics; larger variables are read in slices")
+    parser.add_argument("--timings", action="store_true", default=TIMINGS,
+                        help="add per-stage wall time, peak RSS and row counts as a \"timings\" block")
+    parser.add_argument("--profile", metavar="FILE", help="write cProfile stats of the analysis to FILE (pstats format)")
+    parser.add_argument("--sniff", action="store_true",
+                        help="print the file's format, layout and size estimates from its header only (see sniff.py)")
+    parser.add_argument("--format", choices=FORMATS, default="json",
+                        help="json: per-row records (default); columnar: one array per field; "
+                             "msgpack: columnar as MessagePack (see encoding.py)")
+    args = parser.parse_args()
+
+    STATS_BUDGET_BYTES = max(1, args.stats_budget_mb) * 1024 * 1024
+    TIMINGS = args.timings
+    if not args.no_cache:
+        result_cache = ResultCache(args.cache_dir, CACHE_MAX_BYTES)
+
+    if args.cache_stats:
+        print(json.dumps(_serve_cache_stats({})))
+        return 0
+
+    if args.serve:
+        from service import serve
+        handlers = {"analyze": _serve_analyze, "sniff": _serve_sniff, "cache_stats": _serve_cache_stats}
+        return serve(handlers, workers=args.workers, dumps=dumps_json)
+
+    if not args.file:
         print(json.dumps({"error": "No file path provided"}))
         return 1
-    file_path = sys.argv[1]
+    file_path = args.file
     if not os.path.exists(file_path):
         print(json.dumps({"error": f"File not found: {file_path}"}))
         return 1
+    if args.sniff:
+        print(json.dumps(sniff_file(file_path, STATS_BUDGET_BYTES)))
+        return 0
+    if unavailable(args.format):
+        print(json.dumps({"error": unavailable(args.format)}))
+        return 1
     try:
-        with xr.open_dataset(file_path) as ds:
-            result = summarize_dataset(ds)
-        print(json.dumps(result, allow_nan=False))
+        timer = StageTimer() if args.timings else NULL_TIMER
+        with profiled(args.profile):
+            result = analyze_file(file_path, timer, columnar=args.format != "json")
+        if args.format == "json":
+            print(dumps_with_timings(result, timer, lambda payload: json.dumps(payload, allow_nan=False)))
+        else:
+            write(dumps_with_timings(result, timer, lambda payload: encode(payload, args.format)))
         return 0
     except Exception as exc:
         print(json.dumps({"error": str(exc)}))
@@ -154,5 +397,3 @@ def main() -> int:
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
-
@@ -0,0 +1,82 @@
+"""
+Output encodings for analysis results (`app.py --format`, here and in python/).
+
+  json      per-row dicts ("records", "sample") via the stdlib encoder (default)
+  columnar  the same payload with those row lists stored as one array per
+            field, {"pressure": [...], "temperature": [...], ...}, as JSON
+  msgpack   the columnar payload as MessagePack (needs the msgpack package)
+
+Columnar payloads may hold numpy arrays. orjson, when installed, serializes
+them natively; otherwise (and for arrays orjson can't take, like non-contiguous
+ones) they are converted to lists. Either way non-finite floats in arrays
+become null, as in the json format. Errors are always reported as a JSON line,
+whatever the format.
+"""
+
+import json
+import math
+import sys
+
+import numpy as np
+
+try:
+    import orjson
+except Exception:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except Exception:  # pragma: no cover
+    msgpack = None
+
+
+FORMATS = ("json", "columnar", "msgpack")
+
+
+def unavailable(fmt):
+    """Error message if fmt cannot be produced in this environment, else None."""
+    if fmt == "msgpack" and msgpack is None:
+        return "msgpack not available: install the msgpack package or use --format columnar"
+    return None
+
+
+def _plain(value):
+    """Lists/Python scalars for numpy values (non-finite floats as None)."""
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == "f":
+            return np.where(np.isfinite(value), value.astype(np.float64), None).tolist()
+        return value.tolist()
+    if isinstance(value, np.generic):
+        value = value.item()
+        return None if isinstance(value, float) and not math.isfinite(value) else value
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def dumps_json(payload):
+    """JSON text of payload, numpy values included, with the fastest available encoder."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_plain, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(payload, default=_plain, allow_nan=False)
+
+
+def encode(payload, fmt):
+    """payload in a non-default format: JSON text for "columnar", bytes for "msgpack"."""
+    if fmt == "columnar":
+        return dumps_json(payload)
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise RuntimeError(unavailable(fmt))
+        return msgpack.packb(payload, default=_plain, use_bin_type=True)
+    raise ValueError(f"Unknown format: {fmt}")
+
+
+def write(payload, out=None):
+    """Write an encoded payload to stdout: text as one line, bytes as they are."""
+    out = out or sys.stdout
+    if isinstance(payload, str):
+        out.write(payload + "\n")
+        out.flush()
+        return
+    out.flush()
+    out.buffer.write(payload)
+    out.buffer.flush()
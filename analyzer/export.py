@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Stream a NetCDF file as CSV, NDJSON or a JSON array on stdout (used by the
+server's /export-readable).
+
+  python3 export.py SRC [--format csv|ndjson|json] [--variable V] [--start D] [--end D]
+
+One output row per element of the widest exported variable (per profile and
+level for ARGO files), with its dimension indices, platform, time, position,
+pressure, temperature, salinity and the requested variable. Rows are read and
+written chunk_rows at a time, so output starts immediately and memory does
+not grow with the file. Errors are reported as JSON on stderr with exit 1.
+"""
+import sys
+import os
+import io
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+try:
+    import xarray as xr
+except Exception as exc:
+    print(json.dumps({"error": f"xarray not available: {exc}"}), file=sys.stderr)
+    sys.exit(1)
+
+from subset import time_indexer
+
+CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "50000"))
+
+# (output column, candidate variable names)
+COLUMNS = [
+    ("platform", ["platform_number", "PLATFORM_NUMBER", "float_serial_no", "FLOAT_SERIAL_NO", "platform"]),
+    ("time", ["time", "TIME", "JULD", "juld"]),
+    ("lat", ["latitude", "LATITUDE", "lat", "LAT"]),
+    ("lon", ["longitude", "LONGITUDE", "lon", "LON"]),
+    ("pressure", ["pressure", "PRES", "PRES_ADJUSTED"]),
+    ("temperature", ["TEMP", "TEMP_ADJUSTED", "temperature"]),
+    ("salinity", ["PSAL", "PSAL_ADJUSTED", "salinity"]),
+]
+
+
+def find(ds: "xr.Dataset", keys):
+    for k in keys:
+        if k in ds.variables or k in ds.coords:
+            return k
+    lower = {k.lower(): k for k in ds.variables.keys()}
+    for k in keys:
+        if k.lower() in lower:
+            return lower[k.lower()]
+    return None
+
+
+def export_columns(ds: "xr.Dataset", var=None):
+    """[(variable, column)] to export, in output order."""
+    cols = []
+    for alias, keys in COLUMNS:
+        key = find(ds, keys)
+        if key and key in ds and all(key != c[0] for c in cols):
+            cols.append((key, alias))
+    if var and var in ds and all(var != c[0] for c in cols):
+        cols.append((var, var))
+    return cols
+
+
+def row_dims(ds: "xr.Dataset", cols):
+    """Union of the columns' dimensions, in order of first use; each column is
+    broadcast over the ones it lacks (profile values repeat on every level)."""
+    return tuple(dict.fromkeys(d for k, _ in cols for d in ds[k].dims))
+
+
+def _column_values(values: np.ndarray) -> np.ndarray:
+    """Text for bytes and datetimes, converted before broadcasting so each
+    profile-level value is formatted once rather than once per level."""
+    if values.dtype.kind == "S":
+        return np.char.strip(np.char.decode(values, "utf-8", errors="replace")).astype(object)
+    if values.dtype.kind == "O" and values.size and isinstance(values.flat[0], bytes):
+        return np.char.strip(np.char.decode(values.astype("S"), "utf-8", errors="replace")).astype(object)
+    if values.dtype.kind == "M":
+        text = np.datetime_as_string(values, unit="s").astype(object)
+        text[np.isnat(values)] = None
+        return text
+    return values
+
+
+def iter_frames(ds: "xr.Dataset", cols, dims, positions, chunk_rows: int = CHUNK_ROWS):
+    """Yield DataFrames of about chunk_rows rows covering positions along dims[0]."""
+    inner = [ds.sizes[d] for d in dims[1:]]
+    step = max(1, chunk_rows // max(1, int(np.prod(inner))))
+    total = len(range(ds.sizes[dims[0]])[positions]) if isinstance(positions, slice) else len(positions)
+    for offset in range(0, total, step):
+        if isinstance(positions, slice):
+            start = (positions.start or 0) + offset
+            index = slice(start, start + min(step, total - offset))
+        else:
+            index = positions[offset:offset + step]
+        chunk = ds[[k for k, _ in cols]].isel({dims[0]: index})
+        # Dimension index columns (coordinate values where present), C-ordered over dims
+        labels = []
+        for d in dims:
+            if d in chunk.coords:
+                labels.append(np.asarray(chunk[d].values))
+            elif d == dims[0]:
+                labels.append(np.arange(index.start, index.stop) if isinstance(index, slice) else np.asarray(index))
+            else:
+                labels.append(np.arange(chunk.sizes[d]))
+        frame = {d: grid.ravel() for d, grid in zip(dims, np.meshgrid(*labels, indexing="ij"))}
+        shape = [chunk.sizes[d] for d in dims]
+        for key, alias in cols:
+            da = chunk[key].transpose(*[d for d in dims if d in chunk[key].dims])
+            values = _column_values(np.asarray(da.values))
+            frame[alias] = np.broadcast_to(values.reshape([n if d in da.dims else 1 for d, n in zip(dims, shape)]),
+                                           shape).ravel()
+        yield pd.DataFrame(frame)
+
+
+def write_frames(frames, fmt: str, out, columns=()) -> int:
+    rows = 0
+    if fmt == "json":
+        out.write("[")
+    for frame in frames:
+        if frame.empty:
+            continue
+        if fmt == "csv":
+            frame.to_csv(out, index=False, header=rows == 0)
+        elif fmt == "ndjson":
+            out.write(frame.to_json(orient="records", lines=True).rstrip("\n") + "\n")
+        else:
+            out.write(("," if rows else "") + frame.to_json(orient="records")[1:-1])
+        rows += len(frame)
+        out.flush()
+    if fmt == "json":
+        out.write("]\n")
+    elif fmt == "csv" and rows == 0:
+        pd.DataFrame(columns=list(columns)).to_csv(out, index=False)
+    return rows
+
+
+def export_file(src: str, fmt: str = "csv", var=None, start=None, end=None,
+                chunk_rows: int = CHUNK_ROWS, out=None) -> int:
+    out = out or sys.stdout
+    with xr.open_dataset(src) as ds:
+        cols = export_columns(ds, var)
+        if not cols:
+            raise ValueError("No recognizable variables to export")
+        dims = row_dims(ds, cols)
+        if not dims:
+            return write_frames([pd.DataFrame({alias: _column_values(ds[k].values.reshape(1)) for k, alias in cols})],
+                                fmt, out)
+
+        positions = slice(0, ds.sizes[dims[0]])
+        time_key = next((k for k, alias in cols if alias == "time"), None)
+        if time_key and (start or end) and ds[time_key].ndim == 1 and ds[time_key].dims[0] == dims[0]:
+            positions = time_indexer(ds[time_key].values, start, end)
+        columns = list(dims) + [alias for _, alias in cols]
+        return write_frames(iter_frames(ds, cols, dims, positions, chunk_rows), fmt, out, columns)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Stream a NetCDF file as CSV/NDJSON/JSON on stdout.")
+    parser.add_argument("src", help="source NetCDF file")
+    parser.add_argument("--format", choices=["csv", "ndjson", "json"], default="csv")
+    parser.add_argument("--variable", help="extra variable to include as a column")
+    parser.add_argument("--start", help="first day to keep (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last day to keep, inclusive (YYYY-MM-DD)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows read and written per chunk")
+    args = parser.parse_args()
+
+    out = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="\n", write_through=False)
+    try:
+        export_file(args.src, args.format, args.variable, args.start, args.end, max(1, args.chunk_rows), out)
+        out.flush()
+        return 0
+    except BrokenPipeError:
+        return 1
+    except Exception as exc:
+        print(json.dumps({"error": str(exc)}), file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,168 @@
+"""
+Long-running JSON-lines service used by `app.py --serve` (here and in python/).
+
+Each line on stdin is a request object, each line on stdout a response:
+
+  {"id": 1, "op": "analyze", "path": "/abs/file.nc"}
+  {"id": 1, "result": {...}}          or  {"id": 1, "error": "..."}
+
+Requests run in a bounded pool of worker processes forked from this one, so
+numpy/pandas/xarray are imported once and stay warm. Responses are written in
+completion order; clients match them by id. Built-in ops:
+
+  health   - pid, uptime, worker count and request counters
+  restart  - replace the worker pool (in-flight requests still finish)
+
+A crashed worker fails only the requests it held and the pool is rebuilt.
+The service exits when stdin closes; on SIGTERM it also terminates its
+workers so a restarted service leaves no orphans behind.
+"""
+
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def _run_handler(handler, request):
+    return handler(request)
+
+
+class JsonLineService:
+    def __init__(self, handlers, workers=2, dumps=json.dumps, outfile=None):
+        self.handlers = handlers
+        self.workers = max(1, int(workers))
+        self.dumps = dumps
+        self.outfile = outfile or sys.stdout
+        self.started = time.time()
+        self.counters = {"handled": 0, "failed": 0, "restarts": 0}
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        # At most two queued requests per worker; reading stdin blocks beyond that
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"))
+
+    def _write(self, payload):
+        try:
+            line = self.dumps(payload)
+        except Exception as exc:
+            line = json.dumps({"id": payload.get("id"), "error": f"Unserializable result: {exc}"})
+        with self._lock:
+            self.outfile.write(line + "\n")
+            self.outfile.flush()
+
+    def health(self):
+        with self._lock:
+            return {
+                "ok": True,
+                "pid": os.getpid(),
+                "uptime_s": round(time.time() - self.started, 3),
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                **self.counters,
+            }
+
+    def restart(self, broken_pool=None):
+        with self._lock:
+            if broken_pool is not None and broken_pool is not self._pool:
+                return  # already replaced by another failed request
+            old = self._pool
+            self._pool = self._new_pool()
+            self.counters["restarts"] += 1
+        old.shutdown(wait=False)
+
+    def _submit(self, handler, request):
+        pool = self._pool
+        try:
+            return pool, pool.submit(_run_handler, handler, request)
+        except (BrokenProcessPool, RuntimeError):
+            self.restart(broken_pool=pool)
+            pool = self._pool
+            return pool, pool.submit(_run_handler, handler, request)
+
+    def _finish(self, request_id, pool, future):
+        payload = {"id": request_id}
+        try:
+            payload["result"] = future.result()
+            failed = False
+        except BrokenProcessPool:
+            self.restart(broken_pool=pool)
+            payload["error"] = "Analyzer worker crashed; pool restarted"
+            failed = True
+        except Exception as exc:
+            payload["error"] = str(exc)
+            failed = True
+        with self._lock:
+            self.in_flight -= 1
+            self.counters["failed" if failed else "handled"] += 1
+        self._slots.release()
+        self._write(payload)
+
+    def handle_line(self, line):
+        line = line.strip()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except Exception as exc:
+            self._write({"id": None, "error": f"Invalid request: {exc}"})
+            return
+
+        request_id = request.get("id")
+        op = request.get("op", "analyze")
+        if op == "health":
+            self._write({"id": request_id, "result": self.health()})
+            return
+        if op == "restart":
+            self.restart()
+            self._write({"id": request_id, "result": {"ok": True}})
+            return
+        handler = self.handlers.get(op)
+        if handler is None:
+            self._write({"id": request_id, "error": f"Unknown op: {op}"})
+            return
+
+        self._slots.acquire()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            pool, future = self._submit(handler, request)
+        except Exception as exc:
+            with self._lock:
+                self.in_flight -= 1
+                self.counters["failed"] += 1
+            self._slots.release()
+            self._write({"id": request_id, "error": str(exc)})
+            return
+        future.add_done_callback(lambda f: self._finish(request_id, pool, f))
+
+    def _terminate(self, signum, frame):
+        # Forked workers share our stdout pipe; kill them so the client sees EOF
+        for process in list((getattr(self._pool, "_processes", None) or {}).values()):
+            process.terminate()
+        os._exit(128 + signum)
+
+    def serve(self, infile=None):
+        infile = infile or sys.stdin
+        signal.signal(signal.SIGTERM, self._terminate)
+        try:
+            for line in infile:
+                self.handle_line(line)
+        finally:
+            self._pool.shutdown(wait=True)
+        return 0
+
+
+def serve(handlers, workers=2, dumps=json.dumps):
+    """Run a JSON-lines service on stdin/stdout until stdin closes."""
+    return JsonLineService(handlers, workers=workers, dumps=dumps).serve()
@@ -0,0 +1,183 @@
+"""
+Header-only inspection of uploads (`app.py --sniff`, and the "sniff" op in --serve mode).
+
+  sniff_file(path) -> {
+    "kind":      "argo_profiles" | "argo_incomplete" | "netcdf" | "not_netcdf" | "unreadable",
+    "format":    NetCDF data model (NETCDF4, NETCDF3_CLASSIC, ...),
+    "dims", "vars" (dtype, dims, shape, chunking, compression, attrs), "attrs",
+    "argo":      variables found for the Argo fields, layout and missing fields,
+    "estimate":  profiles, levels, rows, read_bytes, memory_bytes,
+    "route":     "interactive" | "background" | "reject",
+    "elapsed_ms"
+  }
+
+Only the file's signature (at offset 0, or for HDF5 after a user block at a
+power of two from 512 bytes) and its header (dimensions, variables,
+attributes, chunking and filters) are read, never variable data, so a sniff
+takes milliseconds whatever the file size. Estimates are upper bounds from
+the shapes: rows counts fill levels too, read_bytes is the uncompressed size
+of the numeric variables a summary reads, and memory_bytes the largest array
+held at once (bounded by the stats budget, see app._variable_stats).
+Files that are not NetCDF, and Argo-like files missing required fields, are
+routed to "reject". A NetCDF file whose header netCDF4 can't open is
+"unreadable" but routed to "interactive": the analyzer opens files with
+xarray, which may still read it, and reports its own error otherwise. Files
+whose read_bytes exceed ANALYZER_INTERACTIVE_MAX_MB go to "background".
+"""
+
+import os
+import time
+
+import numpy as np
+
+try:
+    import netCDF4
+except Exception:  # pragma: no cover
+    netCDF4 = None
+
+
+INTERACTIVE_MAX_BYTES = int(os.environ.get("ANALYZER_INTERACTIVE_MAX_MB", "512")) * 1024 * 1024
+
+# Leading bytes of NetCDF classic/64-bit/CDF5 and of NetCDF-4 (HDF5) files
+MAGIC = (b"CDF\x01", b"CDF\x02", b"CDF\x05", b"\x89HDF\r\n\x1a\n")
+HDF5_SIGNATURE = MAGIC[-1]
+# After a user block, the HDF5 superblock starts at 512, 1024, 2048, ... bytes
+HDF5_USER_BLOCK_MIN = 512
+
+# Argo field -> candidate variable names, as looked up by python/app.py
+ARGO_FIELDS = {
+    "pressure": ["PRES_ADJUSTED", "PRES"],
+    "platform": ["PLATFORM_NUMBER", "FLOAT_SERIAL_NO", "WMO_INST_TYPE"],
+    "juld": ["JULD"],
+    "latitude": ["LATITUDE"],
+    "longitude": ["LONGITUDE"],
+    "temperature": ["TEMP_ADJUSTED", "TEMP"],
+    "salinity": ["PSAL_ADJUSTED", "PSAL"],
+}
+# Without these python/app.py extracts nothing from a file
+ARGO_REQUIRED = ("pressure", "platform", "juld", "latitude", "longitude")
+
+
+def _find(names, available):
+    lower = {name.lower(): name for name in available}
+    for name in names:
+        if name.lower() in lower:
+            return lower[name.lower()]
+    return None
+
+
+def _attrs(obj):
+    attrs = {}
+    for key in obj.ncattrs():
+        value = obj.getncattr(key)
+        attrs[key] = value if isinstance(value, (int, float, bool, str)) else str(value)
+    return attrs
+
+
+def _nbytes(var):
+    try:
+        itemsize = np.dtype(var.dtype).itemsize
+    except TypeError:
+        return 0  # variable-length types
+    return int(np.prod(var.shape, dtype=np.int64)) * itemsize
+
+
+def _variable(var):
+    chunking = var.chunking()
+    filters = var.filters() or {}
+    return {
+        "dtype": str(var.dtype),
+        "dims": list(var.dimensions),
+        "shape": [int(s) for s in var.shape],
+        "chunking": chunking if isinstance(chunking, list) else chunking or "contiguous",
+        "compression": {key: value for key, value in filters.items() if value},
+        "attrs": _attrs(var),
+    }
+
+
+def _is_numeric(var):
+    try:
+        return np.issubdtype(np.dtype(var.dtype), np.number)
+    except TypeError:
+        return False
+
+
+def _is_netcdf(fh, size):
+    """Whether fh starts with a NetCDF signature, or an HDF5 one after a user block."""
+    if fh.read(8).startswith(MAGIC):
+        return True
+    offset = HDF5_USER_BLOCK_MIN
+    while offset + len(HDF5_SIGNATURE) <= size:
+        fh.seek(offset)
+        if fh.read(len(HDF5_SIGNATURE)) == HDF5_SIGNATURE:
+            return True
+        offset *= 2
+    return False
+
+
+def sniff_file(path, stats_budget_bytes=None):
+    started = time.perf_counter()
+    result = {"path": path, "size_bytes": os.path.getsize(path)}
+
+    def finish(kind, route, **fields):
+        result.update(kind=kind, route=route, **fields)
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    with open(path, "rb") as fh:
+        netcdf = _is_netcdf(fh, result["size_bytes"])
+    if not netcdf:
+        return finish("not_netcdf", "reject", error="Not a NetCDF file")
+    if netCDF4 is None:
+        return finish("unreadable", "interactive", error="netCDF4 not available")
+    try:
+        ds = netCDF4.Dataset(path, "r")
+    except Exception as exc:
+        return finish("unreadable", "interactive", error=str(exc))
+
+    with ds:
+        variables = ds.variables
+        result["format"] = ds.data_model
+        result["dims"] = {name: len(dim) for name, dim in ds.dimensions.items()}
+        result["unlimited"] = [name for name, dim in ds.dimensions.items() if dim.isunlimited()]
+        result["vars"] = {name: _variable(var) for name, var in variables.items()}
+        result["attrs"] = _attrs(ds)
+
+        found = {field: _find(names, variables) for field, names in ARGO_FIELDS.items()}
+        missing = [field for field in ARGO_REQUIRED if found[field] is None]
+        profile_dim = _find(["N_PROF"], ds.dimensions)
+        level_dim = _find(["N_LEVELS"], ds.dimensions)
+        numeric = [var for var in variables.values() if _is_numeric(var)]
+        largest = max((_nbytes(var) for var in numeric), default=0)
+        if stats_budget_bytes is not None:
+            largest = min(largest, stats_budget_bytes)
+
+        if not missing:
+            kind = "argo_profiles"
+            profiles = len(ds.dimensions[profile_dim]) if profile_dim else 1
+            pressure = variables[found["pressure"]]
+            levels = int(pressure.shape[-1]) if pressure.ndim else 1
+            rows = profiles * levels if profile_dim else int(np.prod(pressure.shape, dtype=np.int64))
+        else:
+            # LATITUDE/LONGITUDE alone are common to many NetCDF files; the others are Argo's
+            argo_like = any(found[field] for field in ("pressure", "platform", "juld"))
+            kind = "argo_incomplete" if argo_like else "netcdf"
+            profiles = len(ds.dimensions[profile_dim]) if profile_dim else None
+            levels = len(ds.dimensions[level_dim]) if level_dim else None
+            rows = max((int(np.prod(var.shape, dtype=np.int64)) for var in numeric), default=0)
+        result["argo"] = {
+            "variables": found,
+            "layout": ("multi_profile" if profile_dim else "single_profile") if kind == "argo_profiles" else None,
+            "missing": missing,
+        }
+        read_bytes = sum(_nbytes(var) for var in numeric)
+        result["estimate"] = {
+            "profiles": profiles,
+            "levels": levels,
+            "rows": rows,
+            "read_bytes": read_bytes,
+            "memory_bytes": largest,
+        }
+    if kind == "argo_incomplete":
+        return finish(kind, "reject", error=f"Argo file without {', '.join(missing)}")
+    return finish(kind, "background" if read_bytes > INTERACTIVE_MAX_BYTES else "interactive")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Subset a NetCDF file by variable and time range and write the result as
+compressed, chunked NetCDF (used by the server's /export-netcdf).
+
+  python3 subset.py SRC DST [--variable PSAL] [--start 2023-03-01] [--end 2023-03-31]
+
+Variables are pruned before anything is read, and the time window is located
+on the time coordinate alone (searchsorted when it is sorted), so only the
+selected slices of the selected variables are loaded from SRC. Prints
+{"ok": true, ...} or {"error": ...} as JSON on stdout.
+"""
+import sys
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+try:
+    import xarray as xr
+except Exception as exc:
+    print(json.dumps({"error": f"xarray not available: {exc}"}))
+    sys.exit(1)
+
+TIME_KEYS = ["time", "TIME", "JULD", "juld"]
+# Kept alongside a requested variable
+COORD_KEYS = ["lat", "latitude", "LATITUDE", "lon", "longitude", "LONGITUDE", "PRES", "PRES_ADJUSTED"]
+
+COMPLEVEL = int(os.environ.get("EXPORT_NC_COMPLEVEL", "4"))
+CHUNK_ROWS = int(os.environ.get("EXPORT_NC_CHUNK_ROWS", "1024"))
+# Source storage settings that do not carry over to a differently shaped subset
+_STORAGE_ENCODING = ("chunksizes", "contiguous", "zlib", "complevel", "shuffle", "fletcher32",
+                     "compression", "original_shape", "blosc_shuffle", "szip_coding", "szip_pixels_per_block")
+
+
+def find_time_key(ds: "xr.Dataset"):
+    for k in TIME_KEYS:
+        if k in ds.variables or k in ds.coords:
+            return k
+    return None
+
+
+def select_variables(ds: "xr.Dataset", var, time_key) -> "xr.Dataset":
+    """Keep var plus its likely coordinates; everything if var is absent."""
+    if not var or var not in ds:
+        return ds
+    keep = [var] + [k for k in COORD_KEYS + [time_key] if k and k in ds and k != var]
+    return ds[list(dict.fromkeys(keep))]
+
+
+def time_indexer(times: np.ndarray, start=None, end=None):
+    """Positions with start <= t <= end + 1 day, as a slice when times are sorted."""
+    times = np.asarray(times)
+    if not np.issubdtype(times.dtype, np.datetime64):
+        times = pd.to_datetime(pd.Series(times), errors="coerce").to_numpy()
+    times = times.astype("datetime64[ns]")
+    lo = np.datetime64(pd.to_datetime(start), "ns") if start else None
+    hi = np.datetime64(pd.to_datetime(end) + pd.Timedelta(days=1), "ns") if end else None
+
+    if not np.isnat(times).any() and np.all(times[1:] >= times[:-1]):
+        i0 = int(np.searchsorted(times, lo, side="left")) if lo is not None else 0
+        i1 = int(np.searchsorted(times, hi, side="right")) if hi is not None else len(times)
+        return slice(i0, max(i0, i1))
+
+    mask = ~np.isnat(times)
+    if lo is not None:
+        mask &= times >= lo
+    if hi is not None:
+        mask &= times <= hi
+    return np.flatnonzero(mask)
+
+
+def subset_dataset(ds: "xr.Dataset", var=None, start=None, end=None) -> "xr.Dataset":
+    time_key = find_time_key(ds)
+    ds = select_variables(ds, var, time_key)
+    if time_key and (start or end) and ds[time_key].ndim == 1:
+        # Only the time coordinate is read here; other variables stay lazy
+        index = time_indexer(ds[time_key].values, start, end)
+        ds = ds.isel({ds[time_key].dims[0]: index})
+    return ds
+
+
+def output_encoding(ds: "xr.Dataset", complevel: int = COMPLEVEL, chunk_rows: int = CHUNK_ROWS) -> dict:
+    encoding = {}
+    for name, da in ds.variables.items():
+        for key in _STORAGE_ENCODING:
+            da.encoding.pop(key, None)
+        # Strings and char arrays are small metadata; netCDF4 stores them with
+        # an extra character dimension, so leave their layout to the library
+        if da.dtype.kind in "OSU" or complevel <= 0:
+            continue
+        enc = {"zlib": True, "complevel": complevel, "shuffle": True}
+        if da.ndim and all(da.shape):
+            enc["chunksizes"] = (min(da.shape[0], chunk_rows),) + tuple(da.shape[1:])
+        encoding[name] = enc
+    return encoding
+
+
+def write_subset(src: str, dst: str, var=None, start=None, end=None,
+                 complevel: int = COMPLEVEL, chunk_rows: int = CHUNK_ROWS) -> dict:
+    with xr.open_dataset(src) as ds:
+        sub = subset_dataset(ds, var, start, end)
+        sub.to_netcdf(dst, encoding=output_encoding(sub, complevel, chunk_rows))
+        return {"ok": True, "path": dst, "dims": {k: int(v) for k, v in sub.sizes.items()},
+                "variables": list(sub.data_vars)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Subset a NetCDF file by variable and time range.")
+    parser.add_argument("src", help="source NetCDF file")
+    parser.add_argument("dst", help="output NetCDF file")
+    parser.add_argument("--variable", help="variable to keep (with its coordinates)")
+    parser.add_argument("--start", help="first day to keep (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last day to keep, inclusive (YYYY-MM-DD)")
+    parser.add_argument("--complevel", type=int, default=COMPLEVEL, help="zlib level 1-9, 0 disables compression")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                        help="chunk length along each variable's first dimension")
+    args = parser.parse_args()
+
+    try:
+        result = write_subset(args.src, args.dst, args.variable, args.start, args.end,
+                              args.complevel, max(1, args.chunk_rows))
+        print(json.dumps(result))
+        return 0
+    except Exception as exc:
+        print(json.dumps({"error": str(exc)}))
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,155 @@
+"""
+Opt-in per-stage instrumentation for `app.py --timings` (here and in python/).
+
+  timer = StageTimer()
+  with timer.stage("open"):
+      ...
+  timer.add_rows("levels", n)
+  result["timings"] = timer.to_json()
+
+  for profile in profiles:          # consecutive stages inside a loop body:
+      timer.mark()                  # lap(name) charges the time since the
+      ...; timer.lap("read")        # previous mark/lap to name
+      ...; timer.lap("decode")
+
+Stages with the same name accumulate, so a stage entered once per profile
+reports its total wall time and number of calls. Each stage also records the
+process's peak RSS as of its last exit. The high-water mark only grows, so
+the first stage where it jumps is where memory went. Code is always
+instrumented and takes NULL_TIMER when timings are off; its stage() returns
+one shared no-op context manager, so the cost is a method call per stage.
+"""
+
+import contextlib
+import cProfile
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        entry = self.timer._entry(self.name)
+        entry["wall_s"] += time.perf_counter() - self.start
+        entry["calls"] += 1
+        entry["peak_rss_mb"] = peak_rss_mb()
+        return False
+
+
+class StageTimer:
+    enabled = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages = {}
+        self._mark = self.started
+
+    def _entry(self, name):
+        entry = self._stages.get(name)
+        if entry is None:
+            entry = self._stages[name] = {"stage": name, "wall_s": 0.0, "calls": 0, "peak_rss_mb": None}
+        return entry
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def mark(self):
+        self._mark = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        entry = self._entry(name)
+        entry["wall_s"] += now - self._mark
+        entry["calls"] += 1
+        entry["peak_rss_mb"] = peak_rss_mb()
+        self._mark = now
+
+    def add_rows(self, name, rows):
+        entry = self._entry(name)
+        entry["rows"] = entry.get("rows", 0) + int(rows)
+
+    def to_json(self):
+        stages = [dict(entry, wall_s=round(entry["wall_s"], 6)) for entry in self._stages.values()]
+        return {
+            "total_s": round(time.perf_counter() - self.started, 6),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stages,
+        }
+
+
+class _NullTimer:
+    enabled = False
+    _stage = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._stage
+
+    def mark(self):
+        pass
+
+    def lap(self, name):
+        pass
+
+    def add_rows(self, name, rows):
+        pass
+
+    def to_json(self):
+        return None
+
+
+NULL_TIMER = _NullTimer()
+
+
+@contextlib.contextmanager
+def profiled(path):
+    """Run the block under cProfile and dump pstats-format stats to path (no-op if path is None)."""
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def dumps_with_timings(result, timer, dumps):
+    """Serialize result with the timer's "timings" block, timing the serialization itself.
+
+    The result is serialized once (as the "serialize" stage) and the timings
+    object is spliced in after it, so the reported serialize time is that of
+    the real payload. Binary payloads (see encoding.py) can't be spliced and
+    are serialized again with the block added.
+    """
+    with timer.stage("serialize"):
+        text = dumps(result)
+    if not timer.enabled or not isinstance(result, dict):
+        return text
+    if not isinstance(text, str):
+        return dumps(dict(result, timings=timer.to_json()))
+    timings = dumps(timer.to_json())
+    return text[:-1] + ("" if text == "{}" else ", ") + '"timings": ' + timings + "}"
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Benchmark the extraction and analysis paths on synthetic Argo files.
+
+  python3 run.py [--out results.json] [--baseline baseline.json] [--mad-factor 5] [--tolerance 0.1]
+                 [--repeat 5] [--case NAME:N_PROF:N_LEVELS:FILL:LAYOUT ...]
+
+For every case a file is generated with synthetic.py and these are timed:
+
+  process_argo_file    python/app.py row extraction
+  summarize_to_json    python/app.py summary of the extracted rows
+  summarize_dataset    analyzer/app.py summary (open + summarize, no cache)
+  ingest_insert        python/app.py directory ingestion, INSERT loader
+  ingest_copy          python/app.py directory ingestion, COPY loader
+
+Ingestion runs against an in-process stand-in for psycopg2 that accepts every
+statement without a database: execute_values renders its VALUES pages as
+psycopg2 would and COPY data is read to the end, so both loaders pay for
+turning rows into what is sent, and the two ingest timings compare the Python
+side of ingestion (extraction, rendering, rollups), not Postgres. The stand-in
+reports the standard floats column types, so the COPY loader takes its binary
+path.
+
+Before timing, each case checks that SummaryAccumulator.merge of partial
+summaries over the file's batches, split at a few batch boundaries, renders the
+same summary as one accumulator fed all the batches; a mismatch exits with 1.
+
+Each benchmark reports its best and median time and the median absolute
+deviation (MAD) of its --repeat runs. Results are written as JSON (stdout
+unless --out). With --baseline (e.g. the reference run committed as
+bench/baseline.json) medians are compared: a benchmark whose median exceeds the
+baseline's by more than --mad-factor times the larger MAD of the two, and by
+more than --tolerance of the baseline median and --min-delta seconds, is
+reported on stderr as a REGRESSION and the exit status is 1. A baseline
+recorded on another machine (see its "meta") is still compared, with a
+warning.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import runpy
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+
+from synthetic import write_argo_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PYTHON_APP = os.path.join(ROOT, "python", "app.py")
+# meta fields that must match for baseline timings to be comparable
+MACHINE_META = ("python", "numpy", "platform", "cpus")
+ANALYZER_APP = os.path.join(ROOT, "analyzer", "app.py")
+
+# name, N_PROF, N_LEVELS, fill fraction, layout
+CASES = [
+    ("single", 1, 2000, 0.05, "single"),
+    ("multi", 200, 500, 0.1, "multi"),
+    ("multi_sparse", 200, 500, 0.6, "multi"),
+    ("multi_large", 1000, 500, 0.1, "multi"),
+]
+
+
+# Column types of the floats table, as bulk_load.binary_compatible reads them
+FLOATS_COLUMN_TYPES = [
+    ("platform_id", "text"),
+    ("measurement_date", "timestamp without time zone"),
+] + [(column, "double precision")
+     for column in ("latitude", "longitude", "pressure_dbar", "temperature_celsius", "salinity_psu")]
+
+
+class _StandInCursor:
+    def __init__(self):
+        self.rows = 0
+        self.sent_bytes = 0
+        self._sql = ""
+
+    def execute(self, sql, params=None):
+        self._sql = sql
+
+    def fetchone(self):
+        # Only reached through to_regclass() lookups: report the table as missing
+        return (None,)
+
+    def fetchall(self):
+        return FLOATS_COLUMN_TYPES if "pg_attribute" in self._sql else []
+
+    def copy_expert(self, sql, file, size=8192):
+        # read(0) is "" or b"" for text and binary COPY data
+        for chunk in iter(lambda: file.read(1 << 20), file.read(0)):
+            self.sent_bytes += len(chunk)
+
+
+class _StandInConnection:
+    def cursor(self):
+        return _StandInCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _sql_literal(value):
+    """value as psycopg2 adapts it into statement text."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    if isinstance(value, datetime.datetime):
+        return f"'{value.isoformat()}'::timestamp"
+    if isinstance(value, float) and not math.isfinite(value):
+        return f"'{value!r}'::float"
+    return repr(value)
+
+
+def _stand_in_execute_values(cursor, sql, argslist, template=None, page_size=100, fetch=False):
+    # Render one statement per page of rows, as psycopg2 does, without sending it
+    head, tail = sql.split("%s", 1)
+    rows = iter(argslist)
+    for page in iter(lambda: list(itertools.islice(rows, page_size)), []):
+        literals = [tuple(_sql_literal(value) for value in row) for row in page]
+        values = ",".join(template % row if template else f"({','.join(row)})" for row in literals)
+        cursor.sent_bytes += len((head + values + tail).encode())
+        cursor.rows += len(page)
+
+
+def install_stand_in_db():
+    """Register stand-in psycopg2 modules; must run before python/app.py is loaded."""
+    psycopg2 = types.ModuleType("psycopg2")
+    extras = types.ModuleType("psycopg2.extras")
+    psycopg2.connect = lambda *args, **kwargs: _StandInConnection()
+    extras.execute_values = _stand_in_execute_values
+    psycopg2.extras = extras
+    sys.modules["psycopg2"] = psycopg2
+    sys.modules["psycopg2.extras"] = extras
+
+
+def load_modules():
+    for directory in (os.path.join(ROOT, "python"), os.path.join(ROOT, "analyzer")):
+        if directory not in sys.path:
+            sys.path.append(directory)
+    argo_app = runpy.run_path(PYTHON_APP, run_name="argo_app")
+    analyzer_app = runpy.run_path(ANALYZER_APP, run_name="analyzer_app")
+    return argo_app, analyzer_app
+
+
+def run_ingestion(workdir, loader):
+    """Run python/app.py's directory ingestion of workdir/test/ as __main__."""
+    argv = sys.argv
+    out = io.StringIO()
+    sys.argv = [PYTHON_APP, "--no-manifest", "--loader", loader]
+    try:
+        with contextlib.chdir(workdir), contextlib.redirect_stdout(out):
+            runpy.run_path(PYTHON_APP, run_name="__main__")
+    except SystemExit as exc:
+        if exc.code:
+            raise RuntimeError(f"ingestion failed: {out.getvalue().strip()}")
+    finally:
+        sys.argv = argv
+    return json.loads(out.getvalue().splitlines()[0])
+
+
+def check_merge(argo_app, path, batch_size=1000, splits=8):
+    """Problems merging partial summaries of path's batches, [] if none."""
+    accumulator = argo_app["SummaryAccumulator"]
+    batches = list(argo_app["iter_argo_batches"](path, batch_size))
+    whole = accumulator()
+    for batch in batches:
+        whole.add_batch(batch)
+    expected = whole.to_json()
+    problems = []
+    boundaries = np.linspace(1, len(batches) - 1, splits, dtype=int).tolist() if len(batches) > 1 else []
+    for split in sorted(set(boundaries)):
+        head, tail = accumulator(), accumulator()
+        for batch in batches[:split]:
+            head.add_batch(batch)
+        for batch in batches[split:]:
+            tail.add_batch(batch)
+        merged = head.merge(tail)
+        result = merged.to_json()
+        if merged.profiles != whole.profiles:
+            problems.append(f"split {split}: {merged.profiles} profiles, expected {whole.profiles}")
+        if len(result["sample"]) > argo_app["SAMPLE_SIZE"]:
+            problems.append(f"split {split}: sample of {len(result['sample'])} rows")
+        for key, value in expected.items():
+            if key != "sample" and not _same(result[key], value):
+                problems.append(f"split {split}: {key} is {result[key]!r}, expected {value!r}")
+    return problems
+
+
+def _same(value, expected):
+    # Means are sums of per-batch sums, so merging may change their last bits
+    if isinstance(expected, dict):
+        return value.keys() == expected.keys() and all(_same(value[k], expected[k]) for k in expected)
+    if isinstance(expected, float):
+        return value is not None and np.isclose(value, expected, rtol=1e-12)
+    return value == expected
+
+
+def _mad(times):
+    median = statistics.median(times)
+    return statistics.median(abs(t - median) for t in times)
+
+
+def measure(benchmarks, repeat):
+    """Time each of benchmarks' functions repeat times.
+
+    Runs are interleaved round by round, so a slow spell of the machine spreads
+    over every benchmark's runs (and shows in their MAD) instead of shifting
+    all the runs of one benchmark.
+    """
+    times = {name: [] for name in benchmarks}
+    for _ in range(repeat):
+        for name, fn in benchmarks.items():
+            start = time.perf_counter()
+            fn()
+            times[name].append(time.perf_counter() - start)
+    return {name: {"best_s": min(runs), "median_s": statistics.median(runs), "mad_s": _mad(runs), "runs": runs}
+            for name, runs in times.items()}
+
+
+def run_case(case, argo_app, analyzer_app, workdir, repeat):
+    import xarray as xr
+
+    name, n_prof, n_levels, fill, layout = case
+    data_dir = os.path.join(workdir, name, "test")
+    os.makedirs(data_dir, exist_ok=True)
+    path = write_argo_file(os.path.join(data_dir, f"{name}.nc"), n_prof, n_levels, fill, layout)
+    rows = argo_app["process_argo_file"](path)
+    mismatches = [f"{name}: {problem}" for problem in check_merge(argo_app, path)]
+
+    def summarize_dataset():
+        with xr.open_dataset(path) as ds:
+            analyzer_app["summarize_dataset"](ds)
+
+    benchmarks = {
+        "process_argo_file": lambda: argo_app["process_argo_file"](path),
+        "summarize_to_json": lambda: argo_app["summarize_to_json"](rows),
+        "summarize_dataset": summarize_dataset,
+        "ingest_insert": lambda: run_ingestion(os.path.dirname(data_dir), "insert"),
+        "ingest_copy": lambda: run_ingestion(os.path.dirname(data_dir), "copy"),
+    }
+    results = {}
+    for benchmark, result in measure(benchmarks, repeat).items():
+        result["rows"] = len(rows)
+        results[f"{name}/{benchmark}"] = result
+        print(f"{name}/{benchmark}: median {result['median_s']:.4f}s, MAD {result['mad_s']:.4f}s", file=sys.stderr)
+    return results, mismatches
+
+
+def find_regressions(results, baseline, mad_factor, tolerance, min_delta):
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get("results", {}).get(key)
+        if base is None or not base.get("runs"):
+            continue
+        median, base_median = result["median_s"], statistics.median(base["runs"])
+        # Noisy benchmarks get a wider margin: a multiple of the larger spread of the two runs
+        allowed = max(mad_factor * max(_mad(result["runs"]), _mad(base["runs"])),
+                      tolerance * base_median, min_delta)
+        if median - base_median > allowed:
+            regressions.append({
+                "benchmark": key,
+                "median_s": median,
+                "baseline_s": base_median,
+                "allowed_s": allowed,
+                "slowdown": median / base_median - 1 if base_median > 0 else math.inf,
+            })
+    return regressions
+
+
+def parse_case(spec):
+    name, n_prof, n_levels, fill, layout = spec.split(":")
+    if layout not in ("multi", "single"):
+        raise argparse.ArgumentTypeError(f"layout must be multi or single: {spec!r}")
+    return name, int(n_prof), int(n_levels), float(fill), layout
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark extraction, analysis and ingestion on synthetic Argo files.")
+    parser.add_argument("--out", help="write results JSON here instead of stdout")
+    parser.add_argument("--baseline",
+                        help="results JSON of an earlier run to check for regressions, e.g. baseline.json")
+    parser.add_argument("--mad-factor", type=float, default=5,
+                        help="allowed slowdown of the median, in median absolute deviations of the runs")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="slowdowns of the median below this fraction of the baseline's are never regressions")
+    parser.add_argument("--min-delta", type=float, default=0.005,
+                        help="slowdowns smaller than this many seconds are never regressions")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark; their median is compared")
+    parser.add_argument("--case", action="append", type=parse_case, metavar="NAME:N_PROF:N_LEVELS:FILL:LAYOUT",
+                        help="benchmark this case instead of the defaults (repeatable)")
+    args = parser.parse_args()
+
+    install_stand_in_db()
+    argo_app, analyzer_app = load_modules()
+    cases = args.case or CASES
+    results = {}
+    mismatches = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for case in cases:
+            case_results, case_mismatches = run_case(case, argo_app, analyzer_app, workdir, max(1, args.repeat))
+            results.update(case_results)
+            mismatches.extend(case_mismatches)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "repeat": max(1, args.repeat),
+        },
+        "cases": {name: {"n_prof": n_prof, "n_levels": n_levels, "fill": fill, "layout": layout}
+                  for name, n_prof, n_levels, fill, layout in cases},
+        "results": results,
+        "merge_mismatches": mismatches,
+    }
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        differs = [key for key in MACHINE_META if baseline.get("meta", {}).get(key) != report["meta"][key]]
+        if differs:
+            print(f"warning: baseline {args.baseline} was recorded with a different {', '.join(differs)}; "
+                  "timings may not be comparable", file=sys.stderr)
+        report["baseline"] = args.baseline
+        report["mad_factor"] = args.mad_factor
+        report["tolerance"] = args.tolerance
+        report["regressions"] = find_regressions(results, baseline, args.mad_factor, args.tolerance, args.min_delta)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    for regression in report.get("regressions", []):
+        print(f"REGRESSION {regression['benchmark']}: median {regression['median_s']:.4f}s vs baseline "
+              f"{regression['baseline_s']:.4f}s (+{regression['slowdown']:.0%}, allowed +{regression['allowed_s']:.4f}s)",
+              file=sys.stderr)
+    for mismatch in mismatches:
+        print(f"MERGE MISMATCH {mismatch}", file=sys.stderr)
+    return 1 if report.get("regressions") or mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
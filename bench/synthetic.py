@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic Argo-format NetCDF files for benchmarking.
+
+  python3 synthetic.py DST [--n-prof 200] [--n-levels 500] [--fill 0.1] [--layout multi|single] [--seed 0]
+
+Files follow the Argo profile layout read by python/app.py and the analyzer:
+REFERENCE_DATE_TIME, PLATFORM_NUMBER (N_PROF x STRING8), JULD, LATITUDE,
+LONGITUDE and PRES/TEMP/PSAL (N_PROF x N_LEVELS) with _FillValue. The single
+layout drops N_PROF so the level variables are 1-D, like one-cycle files.
+fill is the fraction of levels written as fill values. Profiles cycle through
+a few platforms and are ten days apart. The output is deterministic for a seed.
+"""
+import argparse
+import json
+
+import numpy as np
+import netCDF4 as nc
+
+FILL_VALUE = 99999.0
+PLATFORMS = 3
+
+
+def write_argo_file(path, n_prof=200, n_levels=500, fill=0.1, layout="multi", seed=0):
+    rng = np.random.default_rng(seed)
+    multi = layout == "multi"
+    n = n_prof if multi else 1
+    profile_dims = ("N_PROF",) if multi else ("ONE",)
+    level_dims = ("N_PROF", "N_LEVELS") if multi else ("N_LEVELS",)
+    shape = (n, n_levels) if multi else (n_levels,)
+
+    with nc.Dataset(path, "w") as ds:
+        ds.createDimension("DATE_TIME", 14)
+        ds.createDimension("STRING8", 8)
+        ds.createDimension(profile_dims[0], n)
+        ds.createDimension("N_LEVELS", n_levels)
+
+        ref = ds.createVariable("REFERENCE_DATE_TIME", "S1", ("DATE_TIME",))
+        ref[:] = np.array(list("19500101000000"), dtype="S1")
+        platform = ds.createVariable("PLATFORM_NUMBER", "S1", profile_dims + ("STRING8",))
+        platform[:] = np.array([list(f"{1900000 + i % PLATFORMS:07d}".ljust(8)) for i in range(n)], dtype="S1")
+        juld = ds.createVariable("JULD", "f8", profile_dims, fill_value=999999.0)
+        juld.units = "days since 1950-01-01 00:00:00 UTC"
+        juld[:] = 27000 + np.arange(n) * 10.0 + rng.random(n)
+        lat = ds.createVariable("LATITUDE", "f8", profile_dims, fill_value=FILL_VALUE)
+        lat[:] = rng.random(n) * 40 - 20
+        lon = ds.createVariable("LONGITUDE", "f8", profile_dims, fill_value=FILL_VALUE)
+        lon[:] = rng.random(n) * 60 + 50
+
+        # Pressure increases with depth; temperature cools and salinity drifts with it
+        pressure = np.cumsum(rng.random(shape) * 4000.0 / n_levels, axis=-1)
+        values = {
+            "PRES": pressure,
+            "TEMP": 28.0 * np.exp(-pressure / 800.0) + 2.0 + rng.standard_normal(shape) * 0.1,
+            "PSAL": 34.5 + pressure / 4000.0 + rng.standard_normal(shape) * 0.02,
+        }
+        for name, data in values.items():
+            var = ds.createVariable(name, "f4", level_dims, fill_value=FILL_VALUE)
+            var[:] = np.ma.masked_array(data, mask=rng.random(shape) < fill)
+    return path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Write a synthetic Argo-format NetCDF file.")
+    parser.add_argument("dst", help="output NetCDF file")
+    parser.add_argument("--n-prof", type=int, default=200, help="profiles (multi layout)")
+    parser.add_argument("--n-levels", type=int, default=500, help="levels per profile")
+    parser.add_argument("--fill", type=float, default=0.1, help="fraction of levels written as fill values")
+    parser.add_argument("--layout", choices=["multi", "single"], default="multi")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_argo_file(args.dst, args.n_prof, args.n_levels, args.fill, args.layout, args.seed)
+    print(json.dumps({"ok": True, "path": args.dst}))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,6 +3,9 @@ import sys
 import json
 import re
 import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 import netCDF4 as nc
@@ -14,10 +17,37 @@ try:
 except Exception:  # pragma: no cover
     psycopg2 = None
 
+# The service loop, stage timings and file hashing are shared with the upload analyzer
+ANALYZER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analyzer')
+sys.path.append(ANALYZER_DIR)
+
+from timings import NULL_TIMER, StageTimer, dumps_with_timings, profiled
+from encoding import FORMATS, dumps_json, encode, unavailable, write
+from bulk_load import CopyLoader
+from ingest_manifest import IngestManifest, batch_profile_keys
+from rollups import PRESSURE_BIN_DBAR, RollupAccumulator
+from columnar_store import ColumnarStore
+from spatial_index import SpatialIndex, profile_positions
+from interpolate import (MAX_GAP_DBAR, STANDARD_PRESSURE_GRID, batch_to_matrix, grid_batch,
+                         interpolate_to_grid, parse_grid, profile_starts)
+
 
 # --- Configuration ---
 POSTGRES_CONN_STRING = "dbname='postgres' user='ayush' password='secret123' host='localhost' port=5432"
 DATA_DIR = 'test/'
+INGEST_BATCH_SIZE = 50000
+ANALYSIS_BATCH_SIZE = 100000
+INGEST_WORKERS = 1
+# With --workers, files are parsed in tasks of about this many rows (fill levels counted)
+INGEST_TASK_ROWS = 200000
+COPY_BATCH_ROWS = 200000
+COPY_COMMIT_ROWS = 2000000
+INGEST_MANIFEST = os.path.join(DATA_DIR, '.ingest_manifest.sqlite')
+STD_LEVELS_TABLE = 'floats_std_levels'
+# Multi-profile files: level variables are read this many profiles at a time
+# (rounded to whole chunks along N_PROF), at most READ_BLOCK_BYTES per variable
+READ_BLOCK_PROFILES = 256
+READ_BLOCK_BYTES = 64 * 1024 * 1024
 
 
 def find_variable_case_insensitive(target_vars, available_vars):
@@ -75,15 +105,272 @@ def safe_float_conversion(value):
         raise ValueError(f"Cannot convert {value} to float")
 
 
-def process_argo_file(file_path):
-    """Extract measurements from a single Argo NetCDF file.
+def level_values(array):
+    """Return (values[float], valid[bool]) for a 1-D per-level array.
 
-    Returns list of tuples:
-    (platform_id, measurement_date[pandas.Timestamp], latitude, longitude, pressure, temperature|None, salinity|None)
+    A level is valid when it is neither masked nor NaN, matching what
+    mask_check/safe_isnan decide for a single element. Floating arrays keep
+    their dtype; anything else is widened to float64.
+    """
+    values = np.asarray(np.ma.getdata(array))
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(np.float64)
+    valid = ~np.ma.getmaskarray(array)
+    valid &= ~np.isnan(values)
+    return values, valid
+
+
+def levels_to_array(levels, keep):
+    """Select the kept levels, with NaN where the level is invalid."""
+    values, valid = levels
+    n = min(len(values), len(keep))
+    selected = keep[:n]
+    return np.where(valid[:n][selected], values[:n][selected], np.nan)
+
+
+def nan_to_none(values):
+    """Convert a float array to a list of Python floats with None for NaN."""
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def _extract_levels_rowwise(pressure, temperature, salinity, temp_var, salinity_var,
+                            platform_id, measurement_date, latitude, longitude):
+    """Per-row extraction for level arrays that still carry a leading profile axis."""
+    rows = []
+    for j in range(int(len(pressure))):
+        try:
+            p_val = pressure[j]
+            if mask_check(pressure, j) or safe_isnan(p_val):
+                continue
+            pressure_val = safe_float_conversion(p_val)
+            if pressure_val < 0:
+                continue
+            temp_val = safe_float_conversion(temperature[j]) if temp_var and not (mask_check(temperature, j) or safe_isnan(temperature[j])) else None
+            sal_val = safe_float_conversion(salinity[j]) if salinity_var and not (mask_check(salinity, j) or safe_isnan(salinity[j])) else None
+
+            rows.append((
+                platform_id,
+                measurement_date,
+                latitude,
+                longitude,
+                pressure_val,
+                temp_val,
+                sal_val,
+            ))
+        except Exception:
+            continue
+    return rows
+
+
+def _platform_from_filename(file_path):
+    filename = os.path.basename(file_path)
+    platform_match = re.search(r'([0-9]{7,8})', filename)
+    return platform_match.group(1) if platform_match else filename.replace('.nc', '')
+
+
+def _decode_platform(platform_raw, file_path):
+    """Platform ID of one profile's PLATFORM_NUMBER value (char array or scalar)."""
+    if hasattr(platform_raw, 'data'):
+        if hasattr(platform_raw.data, 'shape') and platform_raw.data.shape == ():
+            platform_id = str(platform_raw.data).strip()
+        else:
+            try:
+                platform_id = ''.join([
+                    b.decode('utf-8') if isinstance(b, bytes) else str(b)
+                    for b in platform_raw.data if b != b' ' and b != ' '
+                ]).strip()
+            except Exception:
+                platform_id = str(platform_raw.data).strip()
+    else:
+        platform_id = str(platform_raw).strip()
+    if not platform_id or platform_id == 'None':
+        platform_id = _platform_from_filename(file_path)
+    return platform_id
+
+
+def decode_platform_ids(platform_raw, file_path):
+    """Platform ID of every profile from PLATFORM_NUMBER read whole.
+
+    (N_PROF, STRING) char arrays and string arrays are decoded once per
+    distinct ID; other layouts fall back to _decode_platform per profile.
+    """
+    data = np.ma.getdata(platform_raw)
+    if data.ndim == 2 and data.dtype == np.dtype('S1'):
+        # One fixed-width byte string per profile (numpy drops trailing NULs)
+        values = np.ascontiguousarray(data).view(f'S{data.shape[1]}')[:, 0]
+    elif data.ndim == 1 and data.dtype.kind == 'U':
+        values = data
+    else:
+        return [_decode_platform(platform_raw[i], file_path) for i in range(len(platform_raw))]
+    uniques, inverse = np.unique(values, return_inverse=True)
+    decoded = []
+    for value in uniques.tolist():
+        if isinstance(value, bytes):
+            try:
+                # Spaces and NULs are dropped wherever they are, as _decode_platform does
+                value = value.replace(b' ', b'').replace(b'\x00', b'').decode('ascii')
+            except UnicodeDecodeError:
+                return [_decode_platform(platform_raw[i], file_path) for i in range(len(platform_raw))]
+        value = value.strip()
+        decoded.append(value if value and value != 'None' else _platform_from_filename(file_path))
+    return [decoded[i] for i in inverse.reshape(-1).tolist()]
+
+
+def _reference_date(ref_date_raw):
+    """REFERENCE_DATE_TIME (YYYYMMDDHHMISS chars) as a Timestamp, or None."""
+    try:
+        if hasattr(ref_date_raw, 'data'):
+            try:
+                ref_date_str = ''.join([
+                    b.decode('utf-8') if isinstance(b, bytes) else str(b)
+                    for b in ref_date_raw.data
+                ]).strip()
+            except Exception:
+                ref_date_str = str(ref_date_raw.data).strip()
+        else:
+            ref_date_str = str(ref_date_raw).strip()
+        return pd.to_datetime(ref_date_str, format='%Y%m%d%H%M%S')
+    except Exception:
+        return None
+
+
+def _juld_to_dates(days, base_date, units):
+    """JULD days as a DatetimeIndex: from base_date, else by JULD's CF units, else from 1950-01-01 UTC."""
+    if base_date is not None:
+        return base_date + pd.to_timedelta(days, unit='D')
+    if units:
+        dates = nc.num2date(days, units, only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+        return pd.to_datetime(list(dates)).tz_localize(None)
+    # Argo convention
+    return pd.Timestamp('1950-01-01T00:00:00Z') + pd.to_timedelta(days, unit='D')
+
+
+def decode_measurement_dates(juld_raw, base_date, units):
+    """Measurement date of every profile from JULD read whole; None where JULD is missing.
+
+    All dates are converted in one step; if that fails (e.g. an out-of-range
+    value), profiles are converted one by one and the bad ones get None.
+    """
+    days = np.ma.getdata(juld_raw).astype(np.float64)
+    valid = ~np.ma.getmaskarray(juld_raw) & ~np.isnan(days)
+    try:
+        dates = _juld_to_dates(np.where(valid, days, 0.0), base_date, units)
+    except Exception:
+        dates = []
+        for day, ok in zip(days.tolist(), valid.tolist()):
+            try:
+                dates.append(_juld_to_dates([day], base_date, units)[0] if ok else None)
+            except Exception:
+                dates.append(None)
+        return dates
+    return [date if ok else None for date, ok in zip(dates, valid.tolist())]
+
+
+def _profile_floats(raw, num_profiles):
+    """float64 per profile (NaN where masked or unreadable) from a per-profile variable read whole."""
+    if np.ndim(raw) == 1 and len(raw) == num_profiles:
+        return np.ma.filled(np.ma.asarray(raw).astype(np.float64), np.nan)
+    values = np.full(num_profiles, np.nan)
+    for i in range(num_profiles):
+        try:
+            values[i] = float(raw[i])
+        except Exception:
+            pass
+    return values
+
+
+def read_profile_metadata(ds, platform_var_name, juld_var_name, lat_var_name, lon_var_name,
+                          ref_date_var_name, num_profiles, is_multi_profile, file_path):
+    """(platform_ids, measurement_dates, latitudes, longitudes) of every profile in ds.
+
+    Each variable is read once and decoded for all profiles together, so
+    metadata costs the same for a thousand profiles as for one.
+    measurement_dates holds None and latitudes/longitudes NaN for profiles
+    that can't be used.
+    """
+    if is_multi_profile:
+        read = lambda name: ds.variables[name][:]
+    else:
+        # Single-profile files: the first element of each variable
+        read = lambda name: (ds.variables[name][0:1] if len(ds.variables[name].shape) > 0
+                             else np.ma.atleast_1d(ds.variables[name][...]))
+    base_date = _reference_date(ds.variables[ref_date_var_name][:]) if ref_date_var_name else None
+    juld_raw = read(juld_var_name)
+    if not (np.ndim(juld_raw) == 1 and len(juld_raw) == num_profiles):
+        juld_raw = np.ma.masked_all(num_profiles)
+    platform_raw = read(platform_var_name)
+    try:
+        platform_ids = decode_platform_ids(platform_raw, file_path)
+    except Exception:
+        platform_ids = []
+    platform_ids += [None] * (num_profiles - len(platform_ids))
+    return (
+        platform_ids[:num_profiles],
+        decode_measurement_dates(juld_raw, base_date, getattr(ds.variables[juld_var_name], 'units', None)),
+        _profile_floats(read(lat_var_name), num_profiles),
+        _profile_floats(read(lon_var_name), num_profiles),
+    )
+
+
+def profile_block_size(variables, profiles=READ_BLOCK_PROFILES, max_bytes=READ_BLOCK_BYTES):
+    """Profiles per block read of (N_PROF, ...) variables, a whole number of their N_PROF chunks."""
+    chunk = 1
+    row_bytes = 1
+    for var in variables:
+        chunking = var.chunking()
+        if isinstance(chunking, list) and chunking:
+            chunk = max(chunk, int(chunking[0]))
+        row_bytes = max(row_bytes, int(np.prod(var.shape[1:], dtype=np.int64)) * np.dtype(var.dtype).itemsize)
+    block = min(profiles, max(1, max_bytes // row_bytes))
+    return max(chunk, block // chunk * chunk)
+
+
+class ProfileBlockReader:
+    """Per-profile rows of (N_PROF, ...) variables, read a block of profiles at a time.
+
+    rows(i) returns what [var[i] for var in variables] would, but each
+    variable is read (and masked/decompressed) once per block of profiles
+    aligned to its chunks rather than once per profile. If a block can't be
+    read whole, its profiles are read one by one.
     """
-    all_profiles_data = []
 
-    with nc.Dataset(file_path, 'r') as ds:
+    def __init__(self, variables, num_profiles, block_profiles=READ_BLOCK_PROFILES):
+        self.variables = variables
+        self.num_profiles = num_profiles
+        self.block = profile_block_size(variables, block_profiles)
+        self._start = self._stop = 0
+        self._blocks = None
+
+    def rows(self, i):
+        if not self._start <= i < self._stop:
+            self._start = i - i % self.block
+            self._stop = min(self._start + self.block, self.num_profiles)
+            try:
+                self._blocks = [var[self._start:self._stop] for var in self.variables]
+            except Exception:
+                self._blocks = None
+        if self._blocks is None:
+            return [var[i] for var in self.variables]
+        return [block[i - self._start] for block in self._blocks]
+
+
+def iter_profile_levels(file_path, timer=NULL_TIMER, profiles=None):
+    """Yield the valid levels of each usable profile in an Argo NetCDF file.
+
+    profiles, a (start, stop) range of profile indices, limits the profiles
+    read (all by default).
+
+    Yields tuples:
+    (platform_id, measurement_date[pandas.Timestamp], latitude, longitude, pressure, temperature, salinity)
+    where pressure/temperature/salinity are float arrays with NaN for missing TEMP/PSAL.
+    timer (see analyzer/timings.py) receives open, variable_lookup, decode (the
+    metadata of all profiles, see read_profile_metadata) and per-profile read
+    and levels stages.
+    """
+    with timer.stage("open"):
+        ds = nc.Dataset(file_path, 'r')
+    timer.mark()
+    with ds:
         if 'N_PROF' in ds.dimensions:
             num_profiles = len(ds.dimensions['N_PROF'])
             is_multi_profile = True
@@ -114,95 +401,31 @@ def process_argo_file(file_path):
         if not lon_var_name:
             missing_vars.append('longitude (LONGITUDE)')
         # REFERENCE_DATE_TIME is optional; if missing we will try JULD units
+        timer.lap("variable_lookup")
         if missing_vars:
-            return []
+            return
 
-        for i in range(num_profiles):
-            try:
-                if is_multi_profile:
-                    platform_raw = ds.variables[platform_var_name][i]
-                    juld_value = ds.variables[juld_var_name][i]
-                    latitude = float(ds.variables[lat_var_name][i])
-                    longitude = float(ds.variables[lon_var_name][i])
-                    pressure = ds.variables[pressure_var][i, :]
-                    temperature = ds.variables[temp_var][i, :] if temp_var else np.ma.masked_all_like(pressure)
-                    salinity = ds.variables[salinity_var][i, :] if salinity_var else np.ma.masked_all_like(pressure)
-                else:
-                    platform_var = ds.variables[platform_var_name]
-                    platform_raw = platform_var[0] if len(platform_var.shape) > 0 else platform_var
-                    juld_var = ds.variables[juld_var_name]
-                    juld_value = juld_var[0] if len(juld_var.shape) > 0 else juld_var
-                    lat_var = ds.variables[lat_var_name]
-                    lon_var = ds.variables[lon_var_name]
-                    latitude = float(lat_var[0]) if len(lat_var.shape) > 0 else float(lat_var)
-                    longitude = float(lon_var[0]) if len(lon_var.shape) > 0 else float(lon_var)
-                    pressure = ds.variables[pressure_var][:]
-                    temperature = ds.variables[temp_var][:] if temp_var else np.ma.masked_all_like(pressure)
-                    salinity = ds.variables[salinity_var][:] if salinity_var else np.ma.masked_all_like(pressure)
-
-                # Platform ID decoding
-                if hasattr(platform_raw, 'data'):
-                    if hasattr(platform_raw.data, 'shape') and platform_raw.data.shape == ():
-                        platform_id = str(platform_raw.data).strip()
-                    else:
-                        try:
-                            platform_id = ''.join([
-                                b.decode('utf-8') if isinstance(b, bytes) else str(b)
-                                for b in platform_raw.data if b != b' ' and b != ' '
-                            ]).strip()
-                        except Exception:
-                            platform_id = str(platform_raw.data).strip()
-                else:
-                    platform_id = str(platform_raw).strip()
-
-                if not platform_id or platform_id == 'None':
-                    filename = os.path.basename(file_path)
-                    platform_match = re.search(r'([0-9]{7,8})', filename)
-                    platform_id = platform_match.group(1) if platform_match else filename.replace('.nc', '')
-
-                # Reference base date and measurement date
-                base_date = None
-                if ref_date_var_name:
-                    try:
-                        ref_date_raw = ds.variables[ref_date_var_name][:]
-                        if hasattr(ref_date_raw, 'data'):
-                            try:
-                                ref_date_str = ''.join([
-                                    b.decode('utf-8') if isinstance(b, bytes) else str(b)
-                                    for b in ref_date_raw.data
-                                ]).strip()
-                            except Exception:
-                                ref_date_str = str(ref_date_raw.data).strip()
-                        else:
-                            ref_date_str = str(ref_date_raw).strip()
-                        base_date = pd.to_datetime(ref_date_str, format='%Y%m%d%H%M%S')
-                    except Exception:
-                        base_date = None
-
-                # Compute measurement date using either base_date or JULD units
-                if np.ma.is_masked(juld_value) or safe_isnan(juld_value):
-                    continue
-                measurement_date = None
-                try:
-                    if base_date is not None:
-                        measurement_date = base_date + pd.to_timedelta(float(juld_value), unit='D')
-                    else:
-                        juld_var = ds.variables[juld_var_name]
-                        units = getattr(juld_var, 'units', None)
-                        if units:
-                            # Use CF units on JULD
-                            dt = nc.num2date(float(juld_value), units)
-                            # Convert to pandas Timestamp (ensure naive UTC)
-                            measurement_date = pd.Timestamp(dt).tz_localize(None)
-                        else:
-                            # Fallback: treat JULD as days since 1950-01-01 per Argo convention
-                            fallback_base = pd.Timestamp('1950-01-01T00:00:00Z')
-                            measurement_date = fallback_base + pd.to_timedelta(float(juld_value), unit='D')
-                except Exception:
-                    continue
+        platform_ids, measurement_dates, latitudes, longitudes = read_profile_metadata(
+            ds, platform_var_name, juld_var_name, lat_var_name, lon_var_name, ref_date_var_name,
+            num_profiles, is_multi_profile, file_path)
+        level_vars = [ds.variables[name] for name in (pressure_var, temp_var, salinity_var) if name]
+        if is_multi_profile:
+            blocks = ProfileBlockReader(level_vars, num_profiles)
+        timer.lap("decode")
 
-                if np.isnan(latitude) or np.isnan(longitude):
-                    continue
+        start, stop = profiles or (0, num_profiles)
+        for i in range(start, min(stop, num_profiles)):
+            timer.mark()
+            platform_id, measurement_date = platform_ids[i], measurement_dates[i]
+            latitude, longitude = float(latitudes[i]), float(longitudes[i])
+            if platform_id is None or measurement_date is None or np.isnan(latitude) or np.isnan(longitude):
+                continue
+            try:
+                levels = iter(blocks.rows(i) if is_multi_profile else [var[:] for var in level_vars])
+                pressure = next(levels)
+                temperature = next(levels) if temp_var else np.ma.masked_all_like(pressure)
+                salinity = next(levels) if salinity_var else np.ma.masked_all_like(pressure)
+                timer.lap("read")
 
                 try:
                     # Build a boolean mask for valid pressure values
@@ -220,146 +443,960 @@ def process_argo_file(file_path):
                 if valid_count == 0:
                     continue
 
-                for j in range(int(len(pressure))):
-                    try:
-                        p_val = pressure[j]
-                        if mask_check(pressure, j) or safe_isnan(p_val):
-                            continue
-                        pressure_val = safe_float_conversion(p_val)
-                        if pressure_val < 0:
-                            continue
-                        temp_val = safe_float_conversion(temperature[j]) if temp_var and not (mask_check(temperature, j) or safe_isnan(temperature[j])) else None
-                        sal_val = safe_float_conversion(salinity[j]) if salinity_var and not (mask_check(salinity, j) or safe_isnan(salinity[j])) else None
-
-                        all_profiles_data.append((
-                            platform_id,
-                            measurement_date,
-                            latitude,
-                            longitude,
-                            pressure_val,
-                            temp_val,
-                            sal_val,
-                        ))
-                    except Exception:
-                        continue
+                if np.ndim(pressure) > 1:
+                    # Level arrays that still carry a profile axis keep the per-row path
+                    rows = _extract_levels_rowwise(pressure, temperature, salinity, temp_var, salinity_var,
+                                                   platform_id, measurement_date, latitude, longitude)
+                    if rows:
+                        columns = np.array([row[4:] for row in rows], dtype=np.float64)
+                        timer.lap("levels")
+                        timer.add_rows("levels", len(rows))
+                        yield (platform_id, measurement_date, latitude, longitude,
+                               columns[:, 0], columns[:, 1], columns[:, 2])
+                    continue
+
+                pressure_vals, keep = level_values(pressure)
+                keep &= ~(pressure_vals < 0)
+                optional = [
+                    level_values(array) if present else None
+                    for array, present in ((temperature, temp_var), (salinity, salinity_var))
+                ]
+                for levels in optional:
+                    # Levels beyond a shorter TEMP/PSAL array were dropped by the per-level reader
+                    if levels is not None and len(levels[0]) < len(keep):
+                        keep[len(levels[0]):] = False
+
+                pressure_out = pressure_vals[keep]
+                count = len(pressure_out)
+                temp_out, sal_out = [
+                    levels_to_array(levels, keep) if levels is not None else np.full(count, np.nan)
+                    for levels in optional
+                ]
+                timer.lap("levels")
+                timer.add_rows("levels", count)
+                yield (platform_id, measurement_date, latitude, longitude, pressure_out, temp_out, sal_out)
             except Exception:
                 continue
 
+
+def process_argo_file(file_path):
+    """Extract measurements from a single Argo NetCDF file.
+
+    Returns list of tuples:
+    (platform_id, measurement_date[pandas.Timestamp], latitude, longitude, pressure, temperature|None, salinity|None)
+    """
+    all_profiles_data = []
+    for platform_id, measurement_date, latitude, longitude, pressure, temperature, salinity in iter_profile_levels(file_path):
+        count = len(pressure)
+        all_profiles_data.extend(zip(
+            [platform_id] * count,
+            [measurement_date] * count,
+            [latitude] * count,
+            [longitude] * count,
+            pressure.tolist(),
+            nan_to_none(temperature),
+            nan_to_none(salinity),
+        ))
     return all_profiles_data
 
 
+BATCH_FLOAT_COLUMNS = ('latitude', 'longitude', 'pressure_dbar', 'temperature_celsius', 'salinity_psu')
+
+
+def _profile_batch(platform_id, measurement_date, latitude, longitude, pressure, temperature, salinity):
+    count = len(pressure)
+    return {
+        "platform_ids": [platform_id],
+        "platform_index": np.zeros(count, dtype=np.int32),
+        "measurement_date": np.full(count, pd.Timestamp(measurement_date).value, dtype=np.int64),
+        "latitude": np.full(count, latitude, dtype=np.float64),
+        "longitude": np.full(count, longitude, dtype=np.float64),
+        "pressure_dbar": pressure,
+        "temperature_celsius": temperature,
+        "salinity_psu": salinity,
+    }
+
+
+def _concat_batches(batches):
+    if len(batches) == 1:
+        return batches[0]
+    platform_ids = {}
+    indexes = []
+    for batch in batches:
+        remap = np.array([platform_ids.setdefault(p, len(platform_ids)) for p in batch["platform_ids"]], dtype=np.int32)
+        indexes.append(remap[batch["platform_index"]])
+    merged = {
+        "platform_ids": list(platform_ids),
+        "platform_index": np.concatenate(indexes),
+        "measurement_date": np.concatenate([b["measurement_date"] for b in batches]),
+    }
+    for column in BATCH_FLOAT_COLUMNS:
+        merged[column] = np.concatenate([b[column] for b in batches])
+    return merged
+
+
+def _slice_batch(batch, start, stop):
+    used, index = np.unique(batch["platform_index"][start:stop], return_inverse=True)
+    sliced = {
+        "platform_ids": [batch["platform_ids"][i] for i in used],
+        "platform_index": index.astype(np.int32),
+        "measurement_date": batch["measurement_date"][start:stop],
+    }
+    for column in BATCH_FLOAT_COLUMNS:
+        sliced[column] = batch[column][start:stop]
+    return sliced
+
+
+def batch_len(batch):
+    return len(batch["pressure_dbar"])
+
+
+def iter_argo_batches(file_path, batch_size=None, timer=NULL_TIMER, profiles=None):
+    """Yield columnar batches of measurements from an Argo NetCDF file.
+
+    With batch_size=None every usable profile becomes one batch; otherwise
+    batches hold batch_size rows (the last one may be shorter) and can span
+    profiles, so peak memory follows batch_size rather than the file size.
+    profiles limits the profiles read, see iter_profile_levels.
+
+    Each batch is a dict:
+      platform_ids          distinct platform IDs in the batch
+      platform_index        int32 index into platform_ids for each row
+      measurement_date      int64 nanoseconds since the Unix epoch (UTC)
+      latitude, longitude   float64
+      pressure_dbar, temperature_celsius, salinity_psu
+                            float arrays, NaN where TEMP/PSAL are missing
+    """
+    pending = []
+    pending_rows = 0
+    for profile in iter_profile_levels(file_path, timer, profiles):
+        if len(profile[4]) == 0:
+            continue
+        batch = _profile_batch(*profile)
+        if batch_size is None:
+            yield batch
+            continue
+        pending.append(batch)
+        pending_rows += batch_len(batch)
+        if pending_rows < batch_size:
+            continue
+        merged = _concat_batches(pending)
+        start = 0
+        while pending_rows - start >= batch_size:
+            yield _slice_batch(merged, start, start + batch_size)
+            start += batch_size
+        pending = [_slice_batch(merged, start, pending_rows)] if start < pending_rows else []
+        pending_rows -= start
+    if pending:
+        yield _concat_batches(pending)
+
+
+def batch_rows(batch):
+    """Expand a columnar batch into process_argo_file-style row tuples."""
+    platform_ids = batch["platform_ids"]
+    dates = pd.to_datetime(batch["measurement_date"], unit='ns')
+    return zip(
+        [platform_ids[i] for i in batch["platform_index"].tolist()],
+        dates,
+        batch["latitude"].tolist(),
+        batch["longitude"].tolist(),
+        batch["pressure_dbar"].tolist(),
+        nan_to_none(batch["temperature_celsius"]),
+        nan_to_none(batch["salinity_psu"]),
+    )
+
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+SAMPLE_SIZE = 1000
+# Fewest levels kept per profile before the preview sample starts dropping whole profiles
+SAMPLE_MIN_LEVELS = 8
+SAMPLE_COLUMNS = ('profile', 'measurement_date', 'pressure_dbar', 'temperature_celsius', 'salinity_psu')
+
+
+def rows_to_batch(data):
+    """Convert process_argo_file rows into a single columnar batch."""
+    def column(index):
+        return [row[index] for row in data]
+
+    platform_index, platform_ids = pd.factorize(pd.Index(column(0), dtype=object))
+    try:
+        dates = np.fromiter((row[1].value for row in data), dtype=np.int64, count=len(data))
+    except AttributeError:
+        dates = pd.to_datetime(column(1), utc=True).as_unit('ns').asi8
+    return {
+        "platform_ids": list(platform_ids),
+        "platform_index": platform_index.astype(np.int32),
+        "measurement_date": dates,
+        "latitude": np.array(column(2), dtype=np.float64),
+        "longitude": np.array(column(3), dtype=np.float64),
+        "pressure_dbar": np.array(column(4), dtype=np.float64),
+        "temperature_celsius": np.array(column(5), dtype=np.float64),
+        "salinity_psu": np.array(column(6), dtype=np.float64),
+    }
+
+
+def decimate_profiles(profile, values, per_profile):
+    """Row positions keeping at most per_profile rows of each profile.
+
+    profile holds non-decreasing profile numbers, one per row. Longer profiles
+    are cut into per_profile // 2 buckets of consecutive levels and keep the
+    rows holding each bucket's minimum and maximum of values (NaN-only buckets
+    keep their first and last row), so spikes and inversions survive.
+    """
+    profile = np.asarray(profile)
+    values = np.asarray(values, dtype=np.float64)
+    if len(profile) == 0:
+        return np.zeros(0, dtype=np.intp)
+    starts = np.flatnonzero(np.concatenate([[True], profile[1:] != profile[:-1]]))
+    counts = np.diff(np.append(starts, len(profile)))
+    group = np.repeat(np.arange(len(starts)), counts)
+    rank = np.arange(len(profile)) - starts[group]
+    buckets = max(1, per_profile // 2)
+    # Short profiles get one bucket per row, so every row is kept
+    bucket = np.where(counts[group] <= per_profile, rank,
+                      rank * buckets // counts[group]) + group.astype(np.int64) * max(per_profile, 1)
+    # Buckets are runs of consecutive rows, so their extremes come from reduceat
+    new_bucket = np.concatenate([[True], bucket[1:] != bucket[:-1]])
+    bucket_starts = np.flatnonzero(new_bucket)
+    bucket_index = np.cumsum(new_bucket) - 1
+    low = np.where(np.isnan(values), np.inf, values)
+    high = np.where(np.isnan(values), -np.inf, values)
+    is_low = np.flatnonzero(low == np.minimum.reduceat(low, bucket_starts)[bucket_index])
+    is_high = np.flatnonzero(high == np.maximum.reduceat(high, bucket_starts)[bucket_index])
+    # First row at each bucket's minimum, last row at its maximum
+    first = is_low[np.concatenate([[True], bucket_index[is_low][1:] != bucket_index[is_low][:-1]])]
+    last = is_high[np.concatenate([bucket_index[is_high][1:] != bucket_index[is_high][:-1], [True]])]
+    keep = np.zeros(len(profile), dtype=bool)
+    keep[first] = True
+    keep[last] = True
+    return np.flatnonzero(keep)
+
+
+class SummaryAccumulator:
+    """Single-pass, mergeable summary of extracted measurements.
+
+    Feed it columnar batches (see iter_argo_batches) with add_batch() or
+    combine partial summaries with merge(); to_json() renders the payload
+    returned by summarize_to_json without keeping the rows around.
+
+    The plotting sample covers the whole input in at most SAMPLE_SIZE rows:
+    profiles are decimated to per-profile min/max buckets of temperature, the
+    level budget halves as more profiles arrive, and once it reaches
+    SAMPLE_MIN_LEVELS only every _sample_stride-th profile is kept.
+    """
+
+    def __init__(self):
+        self.points = 0
+        self.platform_counts = {}
+        self.date_min = None
+        self.date_max = None
+        # column -> [count, total, min, max] over non-NaN values
+        self.stats = {}
+        self.profiles = 0
+        # (platform_id, measurement_date) of the first and last rows, to join a
+        # profile split between batches or partial summaries
+        self._first_profile = None
+        self._last_profile = None
+        # Sample rows are labelled per profile from _sample_next on; merge() may
+        # skip labels to keep the stride, so labels can run ahead of profiles
+        self._sample_next = 0
+        self._sample = {column: np.zeros(0, dtype=np.int64 if column in ('profile', 'measurement_date') else np.float64)
+                        for column in SAMPLE_COLUMNS}
+        self._sample_levels = SAMPLE_SIZE
+        self._sample_stride = 1
+
+    def _add_stats(self, column, count, total, low, high):
+        current = self.stats.get(column)
+        if current is None:
+            self.stats[column] = [count, total, low, high]
+        else:
+            current[0] += count
+            current[1] += total
+            current[2] = min(current[2], low)
+            current[3] = max(current[3], high)
+
+    def _add_date_range(self, low, high):
+        self.date_min = low if self.date_min is None else min(self.date_min, low)
+        self.date_max = high if self.date_max is None else max(self.date_max, high)
+
+    def add_batch(self, batch):
+        count = batch_len(batch)
+        if count == 0:
+            return self
+        self.points += count
+
+        platform_ids = batch["platform_ids"]
+        counts = np.bincount(batch["platform_index"], minlength=len(platform_ids))
+        for platform_id, platform_count in zip(platform_ids, counts.tolist()):
+            if platform_count:
+                self.platform_counts[platform_id] = self.platform_counts.get(platform_id, 0) + platform_count
+
+        dates = batch["measurement_date"]
+        self._add_date_range(int(dates.min()), int(dates.max()))
+
+        for column in BATCH_FLOAT_COLUMNS:
+            values = batch[column]
+            values = values[~np.isnan(values)].astype(np.float64)
+            if values.size:
+                self._add_stats(column, int(values.size), float(values.sum()), float(values.min()), float(values.max()))
+
+        # Number profiles across batches; a profile split between batches keeps its number
+        starts = profile_starts(batch)
+        first = (platform_ids[batch["platform_index"][0]], int(dates[0]))
+        joined = first == self._last_profile
+        offset = self._sample_next - 1 if joined else self._sample_next
+        profile = np.repeat(offset + np.arange(len(starts)), np.diff(np.append(starts, count)))
+        self.profiles += len(starts) - joined
+        self._sample_next = int(profile[-1]) + 1
+        if self._first_profile is None:
+            self._first_profile = first
+        self._last_profile = (platform_ids[batch["platform_index"][-1]], int(dates[-1]))
+
+        columns = {"profile": profile}
+        columns.update((column, batch[column]) for column in SAMPLE_COLUMNS[1:])
+        self._add_sample(columns)
+        return self
+
+    def _add_sample(self, columns):
+        keep = columns["profile"] % self._sample_stride == 0
+        sample = {c: np.concatenate([self._sample[c], columns[c][keep]]) for c in SAMPLE_COLUMNS}
+        while True:
+            keep = decimate_profiles(sample["profile"], sample["temperature_celsius"], self._sample_levels)
+            sample = {c: values[keep] for c, values in sample.items()}
+            if len(sample["profile"]) <= SAMPLE_SIZE:
+                break
+            if self._sample_levels > SAMPLE_MIN_LEVELS:
+                self._sample_levels //= 2
+            else:
+                self._sample_stride *= 2
+                keep = sample["profile"] % self._sample_stride == 0
+                sample = {c: values[keep] for c, values in sample.items()}
+        self._sample = sample
+
+    @property
+    def sample(self):
+        dates = pd.to_datetime(self._sample["measurement_date"], unit='ns').strftime(TIME_FORMAT)
+        return [
+            {
+                "measurement_date": date,
+                "pressure_dbar": pressure,
+                "temperature_celsius": temperature,
+                "salinity_psu": salinity,
+            }
+            for date, pressure, temperature, salinity in zip(
+                dates,
+                self._sample["pressure_dbar"].tolist(),
+                nan_to_none(self._sample["temperature_celsius"]),
+                nan_to_none(self._sample["salinity_psu"]),
+            )
+        ]
+
+    @property
+    def sample_columns(self):
+        """The sample as one array per column, NaN where a value is missing (see encoding.py)."""
+        dates = pd.to_datetime(self._sample["measurement_date"], unit='ns').strftime(TIME_FORMAT)
+        return {
+            "measurement_date": dates.tolist(),
+            "pressure_dbar": self._sample["pressure_dbar"],
+            "temperature_celsius": self._sample["temperature_celsius"],
+            "salinity_psu": self._sample["salinity_psu"],
+        }
+
+    def merge(self, other):
+        """Fold another accumulator into this one (its rows count as coming after ours)."""
+        if other.points == 0:
+            return self
+        self.points += other.points
+        for platform_id, platform_count in other.platform_counts.items():
+            self.platform_counts[platform_id] = self.platform_counts.get(platform_id, 0) + platform_count
+        self._add_date_range(other.date_min, other.date_max)
+        for column, (count, total, low, high) in other.stats.items():
+            self._add_stats(column, count, total, low, high)
+
+        # Relabel other's profiles from a multiple of the coarser stride so the
+        # profiles it sampled stay aligned with that stride. A profile split
+        # between the two keeps our label for its rows from other, as in add_batch
+        joined = other._first_profile == self._last_profile
+        self._sample_stride = max(self._sample_stride, other._sample_stride)
+        self._sample_levels = min(self._sample_levels, other._sample_levels)
+        offset = -(-self._sample_next // self._sample_stride) * self._sample_stride
+        profile = other._sample["profile"] + offset
+        if joined:
+            profile[other._sample["profile"] == 0] = self._sample_next - 1
+        columns = dict(other._sample, profile=profile)
+        keep = self._sample["profile"] % self._sample_stride == 0
+        self._sample = {c: values[keep] for c, values in self._sample.items()}
+        self._add_sample(columns)
+        self.profiles += other.profiles - joined
+        self._sample_next = offset + other._sample_next
+        if self._first_profile is None:
+            self._first_profile = other._first_profile
+        self._last_profile = other._last_profile
+        return self
+
+    def _stat(self, column, index):
+        current = self.stats.get(column)
+        return current[index] if current else None
+
+    def _mean(self, column):
+        current = self.stats.get(column)
+        return current[1] / current[0] if current else None
+
+    def to_json(self, columnar=False):
+        if self.points == 0:
+            return {"points": 0, "message": "No valid measurements found"}
+
+        # First-seen platform wins ties
+        platform_id = max(self.platform_counts.items(), key=lambda item: item[1])[0]
+        return {
+            "points": self.points,
+            "platform_id": platform_id,
+            "lat": self._mean('latitude'),
+            "lon": self._mean('longitude'),
+            "time_range": [
+                pd.Timestamp(self.date_min, unit='ns').strftime(TIME_FORMAT),
+                pd.Timestamp(self.date_max, unit='ns').strftime(TIME_FORMAT),
+            ],
+            "pressure": {
+                "min": self._stat('pressure_dbar', 2),
+                "max": self._stat('pressure_dbar', 3),
+            },
+            "temperature": {
+                "min": self._stat('temperature_celsius', 2),
+                "max": self._stat('temperature_celsius', 3),
+                "avg": self._mean('temperature_celsius'),
+            },
+            "salinity": {
+                "min": self._stat('salinity_psu', 2),
+                "max": self._stat('salinity_psu', 3),
+                "avg": self._mean('salinity_psu'),
+            },
+            # Provide a small sample for plotting preview
+            "sample": self.sample_columns if columnar else self.sample,
+        }
+
+
 def summarize_to_json(data):
     if not data:
         return {"points": 0, "message": "No valid measurements found"}
+    return SummaryAccumulator().add_batch(rows_to_batch(data)).to_json()
 
-    platform_ids = [row[0] for row in data]
-    latitudes = [row[2] for row in data]
-    longitudes = [row[3] for row in data]
-    pressures = [row[4] for row in data]
-    temps = [row[5] for row in data if row[5] is not None]
-    sals = [row[6] for row in data if row[6] is not None]
-    dates = [pd.Timestamp(row[1]) for row in data]
 
-    def most_common(seq):
-        try:
-            return max(set(seq), key=seq.count)
-        except Exception:
-            return seq[0]
-
-    summary = {
-        "points": len(data),
-        "platform_id": most_common(platform_ids),
-        "lat": float(np.nanmean(latitudes)) if latitudes else None,
-        "lon": float(np.nanmean(longitudes)) if longitudes else None,
-        "time_range": [
-            min(dates).strftime("%Y-%m-%dT%H:%M:%SZ") if dates else None,
-            max(dates).strftime("%Y-%m-%dT%H:%M:%SZ") if dates else None,
-        ],
-        "pressure": {
-            "min": float(np.nanmin(pressures)) if pressures else None,
-            "max": float(np.nanmax(pressures)) if pressures else None,
-        },
-        "temperature": {
-            "min": float(np.nanmin(temps)) if temps else None,
-            "max": float(np.nanmax(temps)) if temps else None,
-            "avg": float(np.nanmean(temps)) if temps else None,
-        },
-        "salinity": {
-            "min": float(np.nanmin(sals)) if sals else None,
-            "max": float(np.nanmax(sals)) if sals else None,
-            "avg": float(np.nanmean(sals)) if sals else None,
-        },
-        # Provide a small sample for plotting preview
-        "sample": [
-            {
-                "measurement_date": pd.Timestamp(row[1]).strftime("%Y-%m-%dT%H:%M:%SZ"),
-                "pressure_dbar": row[4],
-                "temperature_celsius": row[5],
-                "salinity_psu": row[6],
-            }
-            for row in data[:1000]
-        ],
-    }
-    return summary
+def analyze_file(file_path, timer=NULL_TIMER, columnar=False):
+    """Analysis-mode summary of one file, streamed through SummaryAccumulator."""
+    accumulator = SummaryAccumulator()
+    for batch in iter_argo_batches(file_path, ANALYSIS_BATCH_SIZE, timer):
+        with timer.stage("summarize"):
+            accumulator.add_batch(batch)
+        timer.add_rows("summarize", batch_len(batch))
+    with timer.stage("summary_json"):
+        return accumulator.to_json(columnar)
+
+
+def _serve_analyze(request):
+    file_path = request["path"]
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    columnar = request.get("format") == "columnar"
+    if not request.get("timings"):
+        return analyze_file(file_path, columnar=columnar)
+    timer = StageTimer()
+    result = analyze_file(file_path, timer, columnar)
+    return dict(result, timings=timer.to_json())
+
+
+def ingest_task_ranges(file_path, max_rows=INGEST_TASK_ROWS):
+    """(start, stop) profile ranges splitting a multi-profile file into parse tasks.
+
+    A task covers at most max_rows rows counting fill levels (N_PROF x
+    N_LEVELS), rounded down to whole ProfileBlockReader blocks so tasks don't
+    read the same block twice; a task is never smaller than one block.
+    Single-profile and unreadable files are one task, [None].
+    """
+    try:
+        with nc.Dataset(file_path, 'r') as ds:
+            if 'N_PROF' not in ds.dimensions:
+                return [None]
+            num_profiles = len(ds.dimensions['N_PROF'])
+            available_vars = list(ds.variables.keys())
+            names = [find_variable_case_insensitive(candidates, available_vars)
+                     for candidates in (['PRES_ADJUSTED', 'PRES'], ['TEMP_ADJUSTED', 'TEMP'], ['PSAL_ADJUSTED', 'PSAL'])]
+            level_vars = [ds.variables[name] for name in names if name]
+            if not level_vars:
+                return [None]
+            block = profile_block_size(level_vars)
+            levels = max(1, max(int(np.prod(var.shape[1:], dtype=np.int64)) for var in level_vars))
+    except Exception:
+        return [None]
+    step = max(block, max_rows // levels // block * block)
+    return [(start, min(start + step, num_profiles)) for start in range(0, num_profiles, step)] or [None]
+
+
+def _parse_batches(file_path, profiles):
+    """Worker entry point: extract a profile range of one file into in-memory columnar batches."""
+    return list(iter_argo_batches(file_path, INGEST_BATCH_SIZE, profiles=profiles))
+
+
+def iter_parsed_files(nc_files, workers=1):
+    """Yield (file_path, batches) for each file in order, parsing with up to `workers` processes.
+
+    With one worker files are parsed lazily in order. With more, each file is
+    split into profile ranges (see ingest_task_ranges) parsed concurrently,
+    and batches is an iterator over the file's tasks in order, which the
+    caller should exhaust before the next file. At most two tasks per worker
+    are in flight, parsed or being parsed, so parsed batches held in memory
+    stay below workers * 2 * INGEST_TASK_ROWS rows (or one read block per task
+    for very long profiles) whatever the file sizes.
+    """
+    if workers <= 1:
+        for file_path in nc_files:
+            yield file_path, iter_argo_batches(file_path, INGEST_BATCH_SIZE)
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        tasks = ((index, file_path, profiles)
+                 for index, file_path in enumerate(nc_files)
+                 for profiles in ingest_task_ranges(file_path))
+        # (file index, future) in submission order
+        pending = deque()
+
+        def submit_more():
+            while len(pending) < workers * 2:
+                task = next(tasks, None)
+                if task is None:
+                    return
+                index, file_path, profiles = task
+                pending.append((index, pool.submit(_parse_batches, file_path, profiles)))
+
+        def file_batches(index):
+            while pending and pending[0][0] == index:
+                future = pending.popleft()[1]
+                submit_more()
+                yield from future.result()
+
+        submit_more()
+        while pending:
+            index = pending[0][0]
+            batches = file_batches(index)
+            yield nc_files[index], batches
+            for _ in batches:
+                pass
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def delete_profile_rows(cursor, profile_keys, table='floats'):
+    """Delete the rows of the given (platform_id, measurement_date ns) profiles from table."""
+    psycopg2.extras.execute_values(
+        cursor,
+        f"""DELETE FROM {table} AS f
+           USING (VALUES %s) AS k(platform_id, measurement_date)
+           WHERE f.platform_id = k.platform_id AND f.measurement_date = k.measurement_date""",
+        [(platform_id, pd.Timestamp(date, unit='ns').isoformat()) for platform_id, date in profile_keys],
+        template="(%s, %s::timestamp)",
+    )
+
+
+class StdLevelWriter:
+    """Interpolate ingested batches onto a pressure grid into floats_std_levels.
+
+    Ingestion batches can split a profile, so the last profile of each batch
+    is held back and joined with the next one; end_file() writes the rest.
+    Rows go through the caller's cursor and commit with the floats rows.
+    """
+
+    def __init__(self, cursor, grid=STANDARD_PRESSURE_GRID, max_gap=MAX_GAP_DBAR):
+        self.cursor = cursor
+        self.grid = grid
+        self.max_gap = max_gap
+        self.rows = 0
+        self._carry = None
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {STD_LEVELS_TABLE} (LIKE floats INCLUDING DEFAULTS)")
+
+    def add(self, batch):
+        if self._carry is not None:
+            batch = _concat_batches([self._carry, batch])
+        count = batch_len(batch)
+        last = int(profile_starts(batch)[-1]) if count else 0
+        self._carry = _slice_batch(batch, last, count)
+        if last:
+            self._write(_slice_batch(batch, 0, last))
+
+    def end_file(self):
+        if self._carry is not None and batch_len(self._carry):
+            self._write(self._carry)
+        self._carry = None
+
+    def _write(self, batch):
+        gridded = grid_batch(batch, self.grid, self.max_gap)
+        if not batch_len(gridded):
+            return
+        psycopg2.extras.execute_values(
+            self.cursor,
+            f"""INSERT INTO {STD_LEVELS_TABLE}
+               (platform_id, measurement_date, latitude, longitude,
+                pressure_dbar, temperature_celsius, salinity_psu)
+               VALUES %s""",
+            batch_rows(gridded),
+        )
+        self.rows += batch_len(gridded)
+
+
+def compare_floats(cursor, platform_ids, grid=STANDARD_PRESSURE_GRID, max_gap=MAX_GAP_DBAR):
+    """Mean temperature/salinity profiles of each float on a common pressure grid."""
+    cursor.execute(
+        """SELECT platform_id, measurement_date, latitude, longitude,
+                  pressure_dbar, temperature_celsius, salinity_psu
+           FROM floats WHERE platform_id = ANY(%s)
+           ORDER BY platform_id, measurement_date""",
+        (list(platform_ids),),
+    )
+    batch = rows_to_batch(cursor.fetchall())
+    starts = profile_starts(batch)
+    profile_platforms = np.asarray(batch["platform_ids"], dtype=object)[batch["platform_index"][starts]] \
+        if len(starts) else np.zeros(0, dtype=object)
+    pressure = batch_to_matrix(batch, "pressure_dbar", starts)
+
+    result = {"grid": np.asarray(grid).tolist(), "floats": {}}
+    means = {}
+    for column, name in (("temperature_celsius", "temperature"), ("salinity_psu", "salinity")):
+        gridded = interpolate_to_grid(pressure, batch_to_matrix(batch, column, starts), grid, max_gap)
+        for platform_id in platform_ids:
+            values = gridded[profile_platforms == platform_id]
+            counts = (~np.isnan(values)).sum(axis=0)
+            mean = np.divide(np.nansum(values, axis=0), counts, out=np.full(len(grid), np.nan), where=counts > 0)
+            means[platform_id, name] = mean
+            entry = result["floats"].setdefault(platform_id, {
+                "profiles": int((profile_platforms == platform_id).sum()),
+            })
+            entry[name] = nan_to_none(mean)
+            entry[f"{name}_profiles"] = counts.tolist()
+    if len(platform_ids) == 2:
+        first, second = platform_ids
+        result["difference"] = {
+            name: nan_to_none(means[first, name] - means[second, name]) for name in ("temperature", "salinity")
+        }
+    return result
+
+
+def find_nc_files(data_dir):
+    if not os.path.exists(data_dir):
+        raise FileNotFoundError(f"Directory '{data_dir}' not found")
+    nc_files = []
+    for root, _, files in os.walk(data_dir):
+        for f in files:
+            if f.endswith('.nc'):
+                nc_files.append(os.path.join(root, f))
+    if not nc_files:
+        raise FileNotFoundError(f"No .nc files found in '{data_dir}'")
+    return nc_files
+
+
+def ingest_to_store(args):
+    """Directory ingestion into a ColumnarStore (see columnar_store.py) rather than Postgres."""
+    try:
+        nc_files = find_nc_files(DATA_DIR)
+        store = ColumnarStore(args.store)
+        spatial = SpatialIndex(args.spatial_index) if args.spatial_index else None
+
+        manifest = None
+        file_hashes = {}
+        files_to_ingest = nc_files
+        if not args.no_manifest:
+            manifest = IngestManifest(args.manifest or os.path.join(args.store, '.ingest_manifest.sqlite'))
+            to_ingest, stale = manifest.plan(nc_files)
+            file_hashes = dict(to_ingest)
+            files_to_ingest = [path for path, _ in to_ingest]
+            if stale:
+                stale_keys = sorted({key for keys in stale.values() for key in keys})
+                store.delete_profiles(stale_keys)
+                if spatial is not None:
+                    spatial.remove_profiles(stale_keys)
+                manifest.forget(stale)
+
+        total_rows = 0
+        for file_path, batches in iter_parsed_files(files_to_ingest, args.workers):
+            file_rows = 0
+            profile_keys = set()
+            for batch in batches:
+                store.add(batch)
+                if spatial is not None:
+                    spatial.add(batch)
+                file_rows += batch_len(batch)
+                if manifest is not None:
+                    profile_keys |= batch_profile_keys(batch)
+            store.flush()
+            if manifest is not None:
+                manifest.record(file_path, file_hashes[file_path], file_rows, profile_keys)
+            total_rows += file_rows
+        if spatial is not None:
+            spatial.save()
+
+        print(json.dumps({
+            "ingested_rows": total_rows,
+            "files": len(nc_files),
+            "skipped_files": len(nc_files) - len(files_to_ingest),
+            "store": args.store,
+        }))
+        return 0
+    except Exception as e:
+        print(json.dumps({"error": str(e)}))
+        return 1
+
+
+def rebuild_spatial_index(args):
+    """Rebuild the --spatial-index file from the --store columnar store, or from the floats table."""
+    try:
+        if not args.spatial_index:
+            raise ValueError("--rebuild-spatial-index needs --spatial-index FILE")
+        index = SpatialIndex(args.spatial_index)
+        if args.store:
+            frame = ColumnarStore(args.store).scan(['platform_id', 'measurement_date', 'latitude', 'longitude'])
+            rows = frame.drop_duplicates(['platform_id', 'measurement_date']).itertuples(index=False, name=None)
+        else:
+            if psycopg2 is None:
+                raise RuntimeError("psycopg2 not available")
+            pg_conn = psycopg2.connect(POSTGRES_CONN_STRING)
+            cursor = pg_conn.cursor()
+            cursor.execute(
+                """SELECT platform_id, measurement_date, MIN(latitude), MIN(longitude)
+                   FROM floats
+                   WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                   GROUP BY platform_id, measurement_date"""
+            )
+            rows = cursor.fetchall()
+        index.rebuild(rows)
+        index.save()
+        print(json.dumps({"rebuilt": args.spatial_index, "profiles": len(index)}))
+        return 0
+    except Exception as e:
+        print(json.dumps({"error": str(e)}))
+        return 1
 
 
-def main():
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Summarize one Argo NetCDF file as JSON, or ingest DATA_DIR into Postgres "
+                    "(or a local columnar store with --store) when no file is given."
+    )
+    parser.add_argument('file', nargs='?', help="NetCDF file to analyze (analysis mode)")
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS,
+                        help="worker processes parsing files during directory ingestion, or serving requests with --serve")
+    parser.add_argument('--serve', action='store_true',
+                        help="run analysis mode as a long-lived JSON-lines service on stdin/stdout")
+    parser.add_argument('--timings', action='store_true',
+                        help='analysis mode: add per-stage wall time, peak RSS and row counts as a "timings" block')
+    parser.add_argument('--profile', metavar='FILE',
+                        help="analysis mode: write cProfile stats of the analysis to FILE (pstats format)")
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help="analysis mode: json (per-row sample, default), columnar (one array per field) "
+                             "or msgpack (columnar as MessagePack)")
+    parser.add_argument('--loader', choices=['insert', 'copy'], default='insert',
+                        help="ingestion backend: INSERT ... VALUES per file, or COPY FROM STDIN")
+    parser.add_argument('--copy-batch-rows', type=int, default=COPY_BATCH_ROWS,
+                        help="rows buffered per COPY statement (copy loader)")
+    parser.add_argument('--commit-rows', type=int, default=COPY_COMMIT_ROWS,
+                        help="rows per transaction (copy loader)")
+    parser.add_argument('--staging', action='store_true',
+                        help="COPY into an UNLOGGED staging table and merge into floats on commit")
+    parser.add_argument('--store', metavar='DIR',
+                        help="ingest into a platform/month partitioned columnar store in DIR instead of Postgres")
+    parser.add_argument('--manifest',
+                        help="SQLite manifest of ingested files used to skip unchanged and duplicate files "
+                             f"(default {INGEST_MANIFEST}, or .ingest_manifest.sqlite inside --store)")
+    parser.add_argument('--no-manifest', action='store_true',
+                        help="ingest every file, ignoring and not updating the manifest")
+    parser.add_argument('--rebuild-rollups', action='store_true',
+                        help="recompute the monthly rollup tables from floats and exit")
+    parser.add_argument('--pressure-bin', type=float, default=PRESSURE_BIN_DBAR,
+                        help="pressure bin width (dbar) of floats_monthly_pressure (default $ROLLUP_PRESSURE_BIN_DBAR or 10, "
+                             "which the server reads too); changing it needs --rebuild-rollups")
+    parser.add_argument('--spatial-index', metavar='FILE',
+                        help="keep a spatial index of profile positions in FILE up to date while ingesting "
+                             "(see spatial_index.py)")
+    parser.add_argument('--rebuild-spatial-index', action='store_true',
+                        help="rebuild --spatial-index from floats (or from --store) and exit")
+    parser.add_argument('--std-levels', action='store_true',
+                        help=f"also load profiles interpolated onto the pressure grid into {STD_LEVELS_TABLE}")
+    parser.add_argument('--compare', nargs=2, metavar='PLATFORM_ID',
+                        help="print mean profiles of two floats from the database on the pressure grid and exit")
+    parser.add_argument('--grid', type=parse_grid, default=STANDARD_PRESSURE_GRID,
+                        help='standard pressure levels, e.g. "0:100:10,100:2000:50" (default 10/25/50 dbar steps to 2000)')
+    parser.add_argument('--max-gap', type=float, default=MAX_GAP_DBAR,
+                        help="do not interpolate across levels further apart than this (dbar); 0 disables the limit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.serve:
+        from service import serve
+        return serve({"analyze": _serve_analyze}, workers=args.workers, dumps=dumps_json)
+
     # Analysis mode: a file path is provided by the server (frontend upload)
-    if len(sys.argv) >= 2:
-        file_path = sys.argv[1]
+    if args.file is not None:
+        file_path = args.file
         if not os.path.exists(file_path):
             print(json.dumps({"error": f"File not found: {file_path}"}))
             return 1
+        if unavailable(args.format):
+            print(json.dumps({"error": unavailable(args.format)}))
+            return 1
         try:
-            data = process_argo_file(file_path)
-            result = summarize_to_json(data)
-            print(json.dumps(result))
+            timer = StageTimer() if args.timings else NULL_TIMER
+            with profiled(args.profile):
+                result = analyze_file(file_path, timer, columnar=args.format != 'json')
+            if args.format == 'json':
+                print(dumps_with_timings(result, timer, json.dumps))
+            else:
+                write(dumps_with_timings(result, timer, lambda payload: encode(payload, args.format)))
             return 0
         except Exception as e:
             print(json.dumps({"error": str(e)}))
             return 1
 
+    if args.rebuild_spatial_index:
+        return rebuild_spatial_index(args)
+
+    if args.store:
+        return ingest_to_store(args)
+
     # Legacy ingestion mode: no args -> walk DATA_DIR and insert into DB
     if psycopg2 is None:
         print(json.dumps({"error": "psycopg2 not available and no input file provided"}))
         return 1
 
-    try:
-        if not os.path.exists(DATA_DIR):
-            print(json.dumps({"error": f"Directory '{DATA_DIR}' not found"}))
+    max_gap = args.max_gap if args.max_gap > 0 else None
+    if args.compare:
+        try:
+            pg_conn = psycopg2.connect(POSTGRES_CONN_STRING)
+            print(json.dumps(compare_floats(pg_conn.cursor(), args.compare, args.grid, max_gap)))
+            return 0
+        except Exception as e:
+            print(json.dumps({"error": str(e)}))
             return 1
 
-        nc_files = []
-        for root, _, files in os.walk(DATA_DIR):
-            for f in files:
-                if f.endswith('.nc'):
-                    nc_files.append(os.path.join(root, f))
-        if not nc_files:
-            print(json.dumps({"error": f"No .nc files found in '{DATA_DIR}'"}))
+    rollups = RollupAccumulator(args.pressure_bin)
+    if args.rebuild_rollups:
+        try:
+            pg_conn = psycopg2.connect(POSTGRES_CONN_STRING)
+            rollups.rebuild(pg_conn.cursor())
+            pg_conn.commit()
+            print(json.dumps({"rebuilt": ["floats_monthly", "floats_monthly_pressure"]}))
+            return 0
+        except Exception as e:
+            print(json.dumps({"error": str(e)}))
             return 1
 
+    spatial = None
+    try:
+        nc_files = find_nc_files(DATA_DIR)
+        spatial = SpatialIndex(args.spatial_index) if args.spatial_index else None
+
+        manifest = None
+        file_hashes = {}
+        stale = {}
+        files_to_ingest = nc_files
+        if not args.no_manifest:
+            manifest = IngestManifest(args.manifest or INGEST_MANIFEST)
+            to_ingest, stale = manifest.plan(nc_files)
+            file_hashes = dict(to_ingest)
+            files_to_ingest = [path for path, _ in to_ingest]
+
         pg_conn = psycopg2.connect(POSTGRES_CONN_STRING)
         cursor = pg_conn.cursor()
+        rollups.create_tables(cursor)
+        std_levels = StdLevelWriter(cursor, args.grid, max_gap) if args.std_levels else None
+        pg_conn.commit()
+        if stale:
+            # Rows of files that changed since they were ingested are replaced
+            stale_keys = sorted({key for keys in stale.values() for key in keys})
+            rollups.subtract_profiles(cursor, stale_keys)
+            delete_profile_rows(cursor, stale_keys)
+            cursor.execute("SELECT to_regclass(%s)", (STD_LEVELS_TABLE,))
+            if cursor.fetchone()[0] is not None:
+                delete_profile_rows(cursor, stale_keys, STD_LEVELS_TABLE)
+            pg_conn.commit()
+            if spatial is not None:
+                spatial.remove_profiles(stale_keys)
+            manifest.forget(stale)
+
+        loader = None
+        if args.loader == 'copy':
+            loader = CopyLoader(pg_conn, batch_rows=args.copy_batch_rows,
+                                commit_rows=args.commit_rows, staging=args.staging,
+                                before_commit=rollups.flush)
+
+        uncommitted_files = []
+        # Profile positions join the spatial index once their rows are committed
+        uncommitted_positions = []
+
+        def record_committed():
+            if manifest is not None:
+                for path, rows, keys in uncommitted_files:
+                    manifest.record(path, file_hashes[path], rows, keys)
+            uncommitted_files.clear()
+            if spatial is not None:
+                for positions in uncommitted_positions:
+                    spatial.add(positions)
+            uncommitted_positions.clear()
 
         total_rows = 0
-        for file_path in nc_files:
-            data = process_argo_file(file_path)
-            if not data:
-                continue
-            psycopg2.extras.execute_values(
-                cursor,
-                """INSERT INTO floats
-                   (platform_id, measurement_date, latitude, longitude,
-                    pressure_dbar, temperature_celsius, salinity_psu)
-                   VALUES %s""",
-                data,
-            )
-            pg_conn.commit()
-            total_rows += len(data)
+        for file_path, batches in iter_parsed_files(files_to_ingest, args.workers):
+            file_rows = 0
+            profile_keys = set()
+            for batch in batches:
+                if loader is not None:
+                    loader.write(batch)
+                else:
+                    psycopg2.extras.execute_values(
+                        cursor,
+                        """INSERT INTO floats
+                           (platform_id, measurement_date, latitude, longitude,
+                            pressure_dbar, temperature_celsius, salinity_psu)
+                           VALUES %s""",
+                        batch_rows(batch),
+                    )
+                rollups.add(batch)
+                if std_levels is not None:
+                    std_levels.add(batch)
+                if spatial is not None:
+                    uncommitted_positions.append(profile_positions(batch))
+                file_rows += batch_len(batch)
+                if manifest is not None:
+                    profile_keys |= batch_profile_keys(batch)
+            if std_levels is not None:
+                std_levels.end_file()
+            uncommitted_files.append((file_path, file_rows, profile_keys))
+            total_rows += file_rows
+            if loader is None:
+                if file_rows:
+                    rollups.flush(cursor)
+                    pg_conn.commit()
+                record_committed()
+            elif loader.end_file():
+                record_committed()
+        if loader is not None:
+            loader.finish()
+        record_committed()
+        if spatial is not None:
+            spatial.save()
 
-        print(json.dumps({"ingested_rows": total_rows, "files": len(nc_files)}))
+        summary = {
+            "ingested_rows": total_rows,
+            "files": len(nc_files),
+            "skipped_files": len(nc_files) - len(files_to_ingest),
+        }
+        if std_levels is not None:
+            summary["std_level_rows"] = std_levels.rows
+        print(json.dumps(summary))
         return 0
     except Exception as e:
+        if spatial is not None:
+            # Holds only committed files, so it stays in step with floats
+            spatial.save()
         print(json.dumps({"error": str(e)}))
         return 1
 
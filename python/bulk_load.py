@@ -0,0 +1,237 @@
+"""COPY-based bulk loading of columnar batches into the floats table."""
+import io
+
+import numpy as np
+
+
+TABLE_COLUMNS = (
+    'platform_id',
+    'measurement_date',
+    'latitude',
+    'longitude',
+    'pressure_dbar',
+    'temperature_celsius',
+    'salinity_psu',
+)
+
+
+class _Null:
+    """Formats as an empty CSV field, which COPY reads as NULL."""
+
+    def __repr__(self):
+        return ''
+
+
+NULL = _Null()
+
+
+def _csv_text(value):
+    if any(c in value for c in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _floats(values):
+    """float64 values of an array as a list, NULL where NaN."""
+    values = np.asarray(values, dtype=np.float64)
+    listed = values.tolist()
+    for i in np.flatnonzero(np.isnan(values)).tolist():
+        listed[i] = NULL
+    return listed
+
+
+def _round_to_us(dates_ns):
+    """int64 ns -> datetime64[us], rounding half to even like pandas' round('us')."""
+    dates_ns = np.asarray(dates_ns, dtype=np.int64)
+    us, rest = np.divmod(dates_ns, 1000)
+    us += (rest > 500) | ((rest == 500) & (us % 2 == 1))
+    return us.astype('datetime64[us]')
+
+
+def batch_to_csv(batch):
+    """Render a columnar batch (see app.iter_argo_batches) as floats-shaped CSV rows.
+
+    Platform, date and position are formatted once per profile, so each row
+    costs three float reprs. Floats are written as the repr of their float64
+    value (float32 levels widened first) and dates rounded to microseconds,
+    so the stored values match the row-based insert; NaN becomes NULL.
+    """
+    platform_index = np.asarray(batch["platform_index"])
+    count = len(platform_index)
+    if count == 0:
+        return ''
+    dates = np.asarray(batch["measurement_date"])
+    latitude = np.asarray(batch["latitude"], dtype=np.float64)
+    longitude = np.asarray(batch["longitude"], dtype=np.float64)
+    new = np.ones(count, dtype=bool)
+    new[1:] = ((platform_index[1:] != platform_index[:-1]) | (dates[1:] != dates[:-1])
+               | (latitude[1:] != latitude[:-1]) | (longitude[1:] != longitude[:-1]))
+    starts = np.flatnonzero(new)
+
+    platform_ids = [_csv_text(str(platform_id)) for platform_id in batch["platform_ids"]]
+    date_text = np.datetime_as_string(_round_to_us(dates[starts]), unit='us').tolist()
+    prefixes = [
+        '%s,%s,%r,%r,' % (platform_ids[index], date, lat, lon)
+        for index, date, lat, lon in zip(platform_index[starts].tolist(), date_text,
+                                         _floats(latitude[starts]), _floats(longitude[starts]))
+    ]
+    row_prefix = np.repeat(np.array(prefixes, dtype=object), np.diff(np.append(starts, count))).tolist()
+    rows = zip(row_prefix, _floats(batch["pressure_dbar"]), _floats(batch["temperature_celsius"]),
+               _floats(batch["salinity_psu"]))
+    return ''.join(['%s%r,%r,%r\n' % row for row in rows])
+
+
+# PGCOPY signature, flags and header extension length
+BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + np.zeros(2, dtype='>i4').tobytes()
+BINARY_TRAILER = np.array([-1], dtype='>i2').tobytes()
+# Column types batch_to_binary writes; other schemas are loaded as CSV
+BINARY_TYPES = {
+    'platform_id': ('text', 'character varying'),
+    'measurement_date': ('timestamp without time zone',),
+    'latitude': ('double precision',),
+    'longitude': ('double precision',),
+    'pressure_dbar': ('double precision',),
+    'temperature_celsius': ('double precision',),
+    'salinity_psu': ('double precision',),
+}
+# timestamp values are microseconds since 2000-01-01
+POSTGRES_EPOCH_US = 946684800 * 1000000
+
+
+def batch_to_binary(batch):
+    """Render a columnar batch as COPY BINARY tuples (no header or trailer).
+
+    Each row is laid out at its widest, every field present, in a packed
+    big-endian record array filled column by column; the bytes of NULL floats
+    (NaN) and of platform IDs shorter than the longest are then masked out.
+    Values match batch_to_csv's.
+    """
+    platform_index = np.asarray(batch["platform_index"])
+    count = len(platform_index)
+    if count == 0:
+        return b''
+    platform_bytes = [str(platform_id).encode('utf-8') for platform_id in batch["platform_ids"]]
+    width = max(1, max(len(value) for value in platform_bytes))
+    lengths = np.array([len(value) for value in platform_bytes], dtype=np.int32)[platform_index]
+    floats = TABLE_COLUMNS[2:]
+    dtype = np.dtype([('fields', '>i2'), ('platform_len', '>i4'), ('platform_id', f'S{width}'),
+                      ('date_len', '>i4'), ('date', '>i8')]
+                     + [field for column in floats for field in ((f'{column}_len', '>i4'), (column, '>f8'))])
+    records = np.empty(count, dtype=dtype)
+    records['fields'] = len(TABLE_COLUMNS)
+    records['platform_len'] = lengths
+    records['platform_id'] = np.array(platform_bytes, dtype=f'S{width}')[platform_index]
+    records['date_len'] = 8
+    records['date'] = _round_to_us(batch["measurement_date"]).astype(np.int64) - POSTGRES_EPOCH_US
+
+    keep = np.ones((count, dtype.itemsize), dtype=bool)
+    offset = dtype.fields['platform_id'][1]
+    keep[:, offset:offset + width] = np.arange(width) < lengths[:, None]
+    for column in floats:
+        values = np.asarray(batch[column], dtype=np.float64)
+        valid = ~np.isnan(values)
+        records[f'{column}_len'] = np.where(valid, 8, -1)
+        records[column] = values
+        offset = dtype.fields[column][1]
+        keep[:, offset:offset + 8] = valid[:, None]
+    return records.view(np.uint8).reshape(count, dtype.itemsize)[keep].tobytes()
+
+
+def binary_compatible(cursor, table):
+    """Whether table's columns have the types batch_to_binary writes."""
+    cursor.execute(
+        """SELECT attname, format_type(atttypid, NULL) FROM pg_attribute
+           WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped""",
+        (table,),
+    )
+    types = dict(cursor.fetchall())
+    return all(types.get(column) in allowed for column, allowed in BINARY_TYPES.items())
+
+
+class CopyLoader:
+    """Stream batches into Postgres with COPY ... FROM STDIN.
+
+    Rows are buffered in memory and sent once `batch_rows` have accumulated,
+    in COPY's binary format when the table's column types allow it (see
+    binary_compatible) and as CSV otherwise. Transactions only end between files: call end_file() after
+    each file and it commits once `commit_rows` rows are pending; finish()
+    commits the rest. With staging=True rows are copied into an UNLOGGED staging table
+    and merged into the target with a single INSERT ... SELECT per commit.
+    before_commit(cursor), if given, runs inside each transaction just before it
+    commits (the ingestion uses it to merge rollups, see rollups.py).
+    """
+
+    def __init__(self, pg_conn, table='floats', batch_rows=200000, commit_rows=2000000,
+                 staging=False, staging_table=None, before_commit=None):
+        self.pg_conn = pg_conn
+        self.cursor = pg_conn.cursor()
+        self.table = table
+        self.batch_rows = batch_rows
+        self.commit_rows = commit_rows
+        self.staging_table = (staging_table or f"{table}_staging") if staging else None
+        self.before_commit = before_commit
+        self.copied_rows = 0
+        self._chunks = []
+        self._buffered_rows = 0
+        self._uncommitted_rows = 0
+        self.binary = binary_compatible(self.cursor, table)
+        self._render = batch_to_binary if self.binary else batch_to_csv
+
+        if self.staging_table:
+            self.cursor.execute(
+                f"CREATE UNLOGGED TABLE IF NOT EXISTS {self.staging_table} (LIKE {self.table} INCLUDING DEFAULTS)"
+            )
+            self.cursor.execute(f"TRUNCATE {self.staging_table}")
+            self.pg_conn.commit()
+
+    def write(self, batch):
+        rows = len(batch["platform_index"])
+        if rows == 0:
+            return
+        self._chunks.append(self._render(batch))
+        self._buffered_rows += rows
+        if self._buffered_rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._chunks:
+            return
+        if self.binary:
+            buffer = io.BytesIO(b''.join([BINARY_HEADER] + self._chunks + [BINARY_TRAILER]))
+        else:
+            buffer = io.StringIO(''.join(self._chunks))
+        target = self.staging_table or self.table
+        self.cursor.copy_expert(
+            f"COPY {target} ({', '.join(TABLE_COLUMNS)}) FROM STDIN "
+            f"WITH (FORMAT {'binary' if self.binary else 'csv'})",
+            buffer,
+        )
+        self.copied_rows += self._buffered_rows
+        self._uncommitted_rows += self._buffered_rows
+        self._chunks = []
+        self._buffered_rows = 0
+
+    def end_file(self):
+        """Commit if at least commit_rows rows are pending; returns True when it did."""
+        if self._uncommitted_rows + self._buffered_rows < self.commit_rows:
+            return False
+        self.flush()
+        self.commit()
+        return True
+
+    def commit(self):
+        if self.staging_table and self._uncommitted_rows:
+            columns = ', '.join(TABLE_COLUMNS)
+            self.cursor.execute(
+                f"INSERT INTO {self.table} ({columns}) SELECT {columns} FROM {self.staging_table}"
+            )
+            self.cursor.execute(f"TRUNCATE {self.staging_table}")
+        if self.before_commit is not None:
+            self.before_commit(self.cursor)
+        self.pg_conn.commit()
+        self._uncommitted_rows = 0
+
+    def finish(self):
+        self.flush()
+        self.commit()
+        return self.copied_rows
@@ -0,0 +1,241 @@
+"""Partitioned columnar store of floats rows on local disk.
+
+An alternative ingestion target to the Postgres floats table (app.py --store).
+Rows are partitioned by platform and month:
+
+  <root>/platform=<id>/month=<YYYY-MM>/part-<n>.npz
+  <root>/platform=<id>/month=<YYYY-MM>/_stats.json
+
+Each part is an uncompressed .npz with one array per floats column
+(measurement_date as int64 ns since the epoch). Members of an .npz are read
+individually, so a scan only reads the columns it needs. _stats.json lists the
+partition's parts with their row count and min/max of time, latitude and
+longitude. scan() prunes partitions by platform and month from the directory
+names, then parts by those stats, before reading any column data.
+"""
+import json
+import os
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+
+STORE_COLUMNS = (
+    'platform_id',
+    'measurement_date',
+    'latitude',
+    'longitude',
+    'pressure_dbar',
+    'temperature_celsius',
+    'salinity_psu',
+)
+STATS_FILE = '_stats.json'
+# Buffered rows are written out (one part per partition) once this many accumulate
+PART_ROWS = 500000
+
+
+def _month_key(dates_ns):
+    return np.asarray(dates_ns, dtype='datetime64[ns]').astype('datetime64[M]').astype(str)
+
+
+def _to_ns(value):
+    return None if value is None else pd.Timestamp(value).value
+
+
+def _read_stats(directory):
+    path = os.path.join(directory, STATS_FILE)
+    if not os.path.exists(path):
+        return {"parts": {}}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def _write_stats(directory, stats):
+    path = os.path.join(directory, STATS_FILE)
+    with open(path + '.tmp', 'w') as fh:
+        json.dump(stats, fh)
+    os.replace(path + '.tmp', path)
+
+
+def _part_stats(columns):
+    def bounds(values):
+        values = values[~np.isnan(values)] if values.dtype.kind == 'f' else values
+        return [values.min().item(), values.max().item()] if len(values) else None
+    return {
+        "rows": len(columns['measurement_date']),
+        "measurement_date": bounds(columns['measurement_date']),
+        "latitude": bounds(columns['latitude']),
+        "longitude": bounds(columns['longitude']),
+    }
+
+
+def _overlaps(bounds, low, high):
+    if bounds is None:
+        return False
+    return (low is None or bounds[1] >= low) and (high is None or bounds[0] <= high)
+
+
+class ColumnarStore:
+    """Write columnar batches (see app.iter_argo_batches) to, and scan them from, root."""
+
+    def __init__(self, root, part_rows=PART_ROWS):
+        self.root = root
+        self.part_rows = part_rows
+        self.rows = 0
+        self._pending = {}
+        self._pending_rows = 0
+        os.makedirs(root, exist_ok=True)
+
+    def partition_dir(self, platform_id, month):
+        return os.path.join(self.root, f"platform={quote(str(platform_id), safe='')}", f"month={month}")
+
+    # --- writing ---
+
+    def add(self, batch):
+        """Buffer a batch, split by partition; everything is written once part_rows are buffered."""
+        if not len(batch["platform_index"]):
+            return
+        platform_index = np.asarray(batch["platform_index"])
+        months = _month_key(batch["measurement_date"])
+        keys = pd.MultiIndex.from_arrays([platform_index, months])
+        codes, uniques = pd.factorize(keys)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        for i, (index, month) in enumerate(uniques):
+            rows = order[bounds[i]:bounds[i + 1]]
+            key = (batch["platform_ids"][index], month)
+            part = {'measurement_date': np.asarray(batch["measurement_date"])[rows]}
+            for column in STORE_COLUMNS[2:]:
+                part[column] = np.asarray(batch[column], dtype=np.float64)[rows]
+            self._pending.setdefault(key, []).append(part)
+        self._pending_rows += len(platform_index)
+        if self._pending_rows >= self.part_rows:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered partition (call at least once per ingested file)."""
+        for key in list(self._pending):
+            self._write_part(key, self._pending.pop(key))
+        self._pending_rows = 0
+
+    def _write_part(self, key, parts):
+        platform_id, month = key
+        directory = self.partition_dir(platform_id, month)
+        os.makedirs(directory, exist_ok=True)
+        columns = {c: np.concatenate([p[c] for p in parts]) for c in STORE_COLUMNS[1:]}
+        stats = _read_stats(directory)
+        number = max((int(name[5:-4]) for name in stats["parts"]), default=-1) + 1
+        name = f"part-{number:05d}.npz"
+        # np.savez appends .npz unless the name already ends with it
+        tmp = os.path.join(directory, f".{name}.tmp.npz")
+        np.savez(tmp, **columns)
+        os.replace(tmp, os.path.join(directory, name))
+        stats["parts"][name] = _part_stats(columns)
+        _write_stats(directory, stats)
+        self.rows += len(columns['measurement_date'])
+
+    def delete_profiles(self, profile_keys):
+        """Remove the rows of the given (platform_id, measurement_date ns) profiles."""
+        by_partition = {}
+        for platform_id, date in profile_keys:
+            month = str(_month_key([date])[0])
+            by_partition.setdefault((platform_id, month), set()).add(int(date))
+        for (platform_id, month), dates in by_partition.items():
+            directory = self.partition_dir(platform_id, month)
+            if not os.path.isdir(directory):
+                continue
+            stats = _read_stats(directory)
+            for name in list(stats["parts"]):
+                path = os.path.join(directory, name)
+                with np.load(path) as part:
+                    columns = {c: part[c] for c in part.files}
+                drop = np.isin(columns['measurement_date'], np.fromiter(dates, dtype=np.int64))
+                if not drop.any():
+                    continue
+                if drop.all():
+                    os.remove(path)
+                    del stats["parts"][name]
+                    continue
+                columns = {c: values[~drop] for c, values in columns.items()}
+                tmp = os.path.join(directory, f".{name}.tmp.npz")
+                np.savez(tmp, **columns)
+                os.replace(tmp, path)
+                stats["parts"][name] = _part_stats(columns)
+            _write_stats(directory, stats)
+
+    # --- reading ---
+
+    def partitions(self, platforms=None, start=None, end=None):
+        """(platform_id, month, directory) of partitions that can hold matching rows."""
+        first = str(np.datetime64(pd.Timestamp(start), 'M')) if start is not None else None
+        last = str(np.datetime64(pd.Timestamp(end), 'M')) if end is not None else None
+        wanted = None if platforms is None else {str(p) for p in platforms}
+        for platform_dir in sorted(os.listdir(self.root)):
+            if not platform_dir.startswith('platform='):
+                continue
+            platform_id = unquote(platform_dir[len('platform='):])
+            if wanted is not None and platform_id not in wanted:
+                continue
+            for month_dir in sorted(os.listdir(os.path.join(self.root, platform_dir))):
+                month = month_dir[len('month='):]
+                # YYYY-MM strings compare in time order
+                if (first is not None and month < first) or (last is not None and month > last):
+                    continue
+                yield platform_id, month, os.path.join(self.root, platform_dir, month_dir)
+
+    def iter_scan(self, columns=None, platforms=None, start=None, end=None, bbox=None):
+        """Yield one DataFrame per matching part, holding only the requested columns.
+
+        start/end bound measurement_date (inclusive); bbox is
+        (min_lon, min_lat, max_lon, max_lat).
+        """
+        columns = list(STORE_COLUMNS if columns is None else columns)
+        unknown = set(columns) - set(STORE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown columns: {sorted(unknown)}")
+        low, high = _to_ns(start), _to_ns(end)
+        min_lon, min_lat, max_lon, max_lat = bbox if bbox is not None else (None,) * 4
+        predicates = []
+        if low is not None or high is not None:
+            predicates.append(('measurement_date', low, high))
+        if bbox is not None:
+            predicates += [('latitude', min_lat, max_lat), ('longitude', min_lon, max_lon)]
+        needed = [c for c in columns if c != 'platform_id']
+        needed += [c for c, _, _ in predicates if c not in needed]
+
+        for platform_id, _, directory in self.partitions(platforms, start, end):
+            for name, stats in sorted(_read_stats(directory)["parts"].items()):
+                if not all(_overlaps(stats[c], lo, hi) for c, lo, hi in predicates):
+                    continue
+                with np.load(os.path.join(directory, name)) as part:
+                    data = {c: part[c] for c in needed}
+                rows = len(next(iter(data.values()))) if data else stats["rows"]
+                keep = np.ones(rows, dtype=bool)
+                for c, lo, hi in predicates:
+                    if lo is not None:
+                        keep &= data[c] >= lo
+                    if hi is not None:
+                        keep &= data[c] <= hi
+                count = int(keep.sum())
+                if not count:
+                    continue
+                frame = {}
+                for c in columns:
+                    if c == 'platform_id':
+                        frame[c] = np.full(count, platform_id, dtype=object)
+                    elif c == 'measurement_date':
+                        frame[c] = data[c][keep].astype('datetime64[ns]')
+                    else:
+                        frame[c] = data[c][keep]
+                yield pd.DataFrame(frame, columns=columns)
+
+    def scan(self, columns=None, platforms=None, start=None, end=None, bbox=None):
+        """All matching rows as one DataFrame (see iter_scan)."""
+        frames = list(self.iter_scan(columns, platforms, start, end, bbox))
+        if not frames:
+            cols = list(STORE_COLUMNS if columns is None else columns)
+            return pd.DataFrame({c: pd.Series(dtype='datetime64[ns]' if c == 'measurement_date'
+                                              else object if c == 'platform_id' else np.float64)
+                                 for c in cols})
+        return pd.concat(frames, ignore_index=True)
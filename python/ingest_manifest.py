@@ -0,0 +1,140 @@
+"""Persistent record of ingested NetCDF files, keyed by content hash.
+
+The manifest is a small SQLite database. `files` remembers the size, mtime and
+SHA-256 of every path seen, so unchanged files are recognised without being
+read. `contents` lists the content hashes whose rows are in the database,
+together with the (platform_id, measurement_date) profile keys they produced,
+so the rows of a file that later changes can be deleted before re-ingesting,
+along with those of other files holding the same profiles (see plan()).
+"""
+import json
+import os
+import sqlite3
+
+# Same content hash as the analyzer's result cache (analyzer/ is on sys.path via app.py)
+from cache import file_sha256
+
+
+def batch_profile_keys(batch):
+    """Distinct (platform_id, measurement_date ns) pairs present in a columnar batch."""
+    platform_ids = batch["platform_ids"]
+    pairs = set(zip(batch["platform_index"].tolist(), batch["measurement_date"].tolist()))
+    return {(platform_ids[index], date) for index, date in pairs}
+
+
+class IngestManifest:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS contents (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                profiles TEXT NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _current_hash(self, path):
+        """Hash for `path`, reusing the stored one when size and mtime are unchanged."""
+        stat = os.stat(path)
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, sha256 FROM files WHERE path = ?", (os.path.abspath(path),)
+        ).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2], row[2]
+        return file_sha256(path), row[2] if row else None
+
+    def plan(self, paths):
+        """Decide what an ingestion run over `paths` has to do.
+
+        Returns (to_ingest, stale) where to_ingest is a list of (path, sha256)
+        for content not yet in the database (byte-identical duplicates are
+        listed once) and stale maps the hash of each replaced file version to
+        its profile keys, whose rows should be deleted before re-ingesting.
+
+        Rows are deleted by profile key, which takes the rows of every file
+        holding that profile with them (an R and a D version of one cycle, or
+        an aggregate *_prof.nc next to per-cycle files). Contents sharing a key
+        with stale ones are therefore stale too, and re-ingested when one of
+        `paths` still holds them.
+        """
+        ingested = {sha for (sha,) in self.conn.execute("SELECT sha256 FROM contents")}
+        current = {}
+        previous = {}
+        for path in paths:
+            sha, old_sha = self._current_hash(path)
+            current[path] = sha
+            if old_sha is not None and old_sha != sha:
+                previous[path] = old_sha
+
+        current_hashes = set(current.values())
+        stale = {}
+        for old_sha in set(previous.values()) - current_hashes:
+            row = self.conn.execute("SELECT profiles FROM contents WHERE sha256 = ?", (old_sha,)).fetchone()
+            if row:
+                stale[old_sha] = [tuple(key) for key in json.loads(row[0])]
+        if stale:
+            self._add_overlapping(stale)
+        ingested -= stale.keys()
+
+        to_ingest = []
+        planned = set()
+        for path, sha in current.items():
+            if sha in ingested or sha in planned:
+                self._remember_file(path, sha)
+                continue
+            planned.add(sha)
+            to_ingest.append((path, sha))
+        self.conn.commit()
+        return to_ingest, stale
+
+    def _add_overlapping(self, stale):
+        """Add to `stale` every content entry sharing a profile key with it, transitively."""
+        others = {
+            sha: {tuple(key) for key in json.loads(profiles)}
+            for sha, profiles in self.conn.execute("SELECT sha256, profiles FROM contents")
+            if sha not in stale
+        }
+        keys = {key for profile_keys in stale.values() for key in profile_keys}
+        while True:
+            overlapping = [sha for sha, profile_keys in others.items() if not keys.isdisjoint(profile_keys)]
+            if not overlapping:
+                return
+            for sha in overlapping:
+                profile_keys = others.pop(sha)
+                stale[sha] = sorted(profile_keys)
+                keys |= profile_keys
+
+    def _remember_file(self, path, sha):
+        stat = os.stat(path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, sha),
+        )
+
+    def forget(self, hashes):
+        """Drop content entries whose rows have been deleted from the database."""
+        self.conn.executemany("DELETE FROM contents WHERE sha256 = ?", [(sha,) for sha in hashes])
+        self.conn.commit()
+
+    def record(self, path, sha, rows, profile_keys):
+        """Mark `path` as ingested; call only after its rows are committed."""
+        self._remember_file(path, sha)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO contents (sha256, path, rows, profiles) VALUES (?, ?, ?, ?)",
+            (sha, os.path.abspath(path), rows, json.dumps(sorted(profile_keys))),
+        )
+        self.conn.commit()
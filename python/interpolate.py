@@ -0,0 +1,143 @@
+"""Interpolation of profiles onto a standard pressure grid.
+
+Profiles are handled as 2D arrays (profiles x levels) and interpolated all at
+once: each grid pressure takes the value linearly interpolated between the
+two nearest valid levels around it (NaN pressures or values are skipped).
+Grid points shallower than a profile's first valid level or deeper than its
+last are NaN, with no extrapolation. So are points whose bracketing levels
+are more than max_gap dbar apart.
+
+grid_batch() applies this to the columnar batches from app.iter_argo_batches
+and returns a batch with one row per profile and grid level. Ingestion uses
+it for floats_std_levels, and app.py --compare uses it to line up two floats.
+"""
+import numpy as np
+
+
+STANDARD_PRESSURE_GRID = np.concatenate([
+    np.arange(0.0, 100.0, 10.0),
+    np.arange(100.0, 500.0, 25.0),
+    np.arange(500.0, 2000.0 + 1.0, 50.0),
+])
+MAX_GAP_DBAR = 250.0
+
+
+def parse_grid(spec):
+    """Grid from "10,20,50" and/or "start:stop:step" ranges (stop inclusive), e.g. "0:100:10,100:2000:50"."""
+    points = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if ':' in part:
+            start, stop, step = (float(x) for x in part.split(':'))
+            points.extend(np.arange(start, stop + step / 2, step))
+        else:
+            points.append(float(part))
+    grid = np.unique(np.asarray(points, dtype=np.float64))
+    if grid.size == 0:
+        raise ValueError(f"Empty pressure grid: {spec!r}")
+    return grid
+
+
+def interpolate_to_grid(pressure, values, grid=STANDARD_PRESSURE_GRID, max_gap=MAX_GAP_DBAR):
+    """Interpolate values (profiles x levels) given at pressure onto grid.
+
+    Levels need not be sorted. Returns a (profiles x len(grid)) float64 array.
+    """
+    pressure = np.atleast_2d(np.asarray(pressure, dtype=np.float64))
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    grid = np.asarray(grid, dtype=np.float64)
+    n_profiles, n_levels = pressure.shape
+    out = np.full((n_profiles, len(grid)), np.nan)
+    if out.size == 0 or n_levels == 0:
+        return out
+
+    # Valid levels first, sorted by pressure; invalid ones go to the end as +inf
+    valid = ~(np.isnan(pressure) | np.isnan(values))
+    order = np.argsort(np.where(valid, pressure, np.inf), axis=1, kind='stable')
+    p = np.take_along_axis(np.where(valid, pressure, np.inf), order, axis=1)
+    v = np.take_along_axis(values, order, axis=1)
+    n_valid = valid.sum(axis=1)
+    if n_levels < 2:
+        p = np.hstack([p, np.full((n_profiles, 1), np.inf)])
+        v = np.hstack([v, np.full((n_profiles, 1), np.nan)])
+
+    # below[i, k] = number of valid levels of profile i with pressure <= grid[k],
+    # counted exactly from each level's rank in the grid (no per-profile loop)
+    rank = np.searchsorted(grid, p, side='left')
+    below = np.bincount(
+        (np.arange(n_profiles)[:, None] * (len(grid) + 1) + rank).ravel(),
+        minlength=n_profiles * (len(grid) + 1),
+    ).reshape(n_profiles, len(grid) + 1)[:, :-1].cumsum(axis=1)
+
+    upper = np.clip(below, 1, np.maximum(n_valid - 1, 1)[:, None])
+    lower = upper - 1
+    p0 = np.take_along_axis(p, lower, axis=1)
+    p1 = np.take_along_axis(p, upper, axis=1)
+    v0 = np.take_along_axis(v, lower, axis=1)
+    v1 = np.take_along_axis(v, upper, axis=1)
+
+    with np.errstate(invalid='ignore'):
+        dp = p1 - p0
+        inside = (n_valid[:, None] >= 2) & (grid >= p0) & (grid <= p1)
+        if max_gap is not None:
+            inside &= dp <= max_gap
+        weight = np.divide(grid - p0, dp, out=np.zeros_like(dp), where=inside & (dp > 0))
+        out = np.where(inside, v0 + weight * (v1 - v0), np.nan)
+    # A profile with a single valid level only matches a grid point exactly on it
+    single = (n_valid[:, None] == 1) & (grid == p[:, :1])
+    out[single] = np.broadcast_to(v[:, :1], out.shape)[single]
+    return out
+
+
+def profile_starts(batch):
+    """Row offsets where each profile (run of equal platform and date) of a batch begins."""
+    platform_index = np.asarray(batch["platform_index"])
+    dates = np.asarray(batch["measurement_date"])
+    if len(platform_index) == 0:
+        return np.zeros(0, dtype=np.intp)
+    changed = (np.diff(platform_index) != 0) | (np.diff(dates) != 0)
+    return np.concatenate([[0], np.flatnonzero(changed) + 1])
+
+
+def batch_to_matrix(batch, column, starts=None):
+    """Pad one column of a batch into a (profiles x max levels) array, NaN-filled."""
+    starts = profile_starts(batch) if starts is None else starts
+    values = np.asarray(batch[column], dtype=np.float64)
+    counts = np.diff(np.append(starts, len(values)))
+    matrix = np.full((len(starts), counts.max() if len(counts) else 0), np.nan)
+    profile = np.repeat(np.arange(len(starts)), counts)
+    matrix[profile, np.arange(len(values)) - np.repeat(starts, counts)] = values
+    return matrix
+
+
+def grid_batch(batch, grid=STANDARD_PRESSURE_GRID, max_gap=MAX_GAP_DBAR,
+               columns=("temperature_celsius", "salinity_psu")):
+    """Interpolate every profile of a columnar batch onto grid.
+
+    Returns a batch of the same shape with pressure_dbar set to grid levels,
+    keeping only levels where at least one of columns has a value. Profiles
+    must not be split across batches (see app.StdLevelWriter).
+    """
+    grid = np.asarray(grid, dtype=np.float64)
+    starts = profile_starts(batch)
+    pressure = batch_to_matrix(batch, "pressure_dbar", starts)
+    gridded = {c: interpolate_to_grid(pressure, batch_to_matrix(batch, c, starts), grid, max_gap)
+               for c in columns}
+    keep = np.zeros((len(starts), len(grid)), dtype=bool)
+    for values in gridded.values():
+        keep |= ~np.isnan(values)
+    profile, level = np.nonzero(keep)
+    rows = starts[profile]
+    result = {
+        "platform_ids": batch["platform_ids"],
+        "platform_index": np.asarray(batch["platform_index"])[rows],
+        "measurement_date": np.asarray(batch["measurement_date"])[rows],
+        "latitude": np.asarray(batch["latitude"])[rows],
+        "longitude": np.asarray(batch["longitude"])[rows],
+        "pressure_dbar": grid[level],
+    }
+    for c in ("temperature_celsius", "salinity_psu"):
+        result[c] = gridded[c][profile, level] if c in gridded else np.full(len(rows), np.nan)
+    return result
@@ -0,0 +1,228 @@
+"""Monthly rollups of the floats table, maintained during ingestion.
+
+floats_monthly holds per platform and month the row count and, for pressure,
+temperature and salinity, the count of non-null values, their sum and their
+sum of squares. floats_monthly_pressure holds the same for temperature and
+salinity per PRESSURE_BIN_DBAR-wide pressure bin (keyed by the bin's lower
+edge; ROLLUP_PRESSURE_BIN_DBAR, default 10). Counts and sums add, so each commit merges its totals into the tables
+with INSERT ... ON CONFLICT DO UPDATE, and rows deleted for a changed file are
+subtracted the same way. mean = sum / count, variance = sumsq / count - mean^2.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import psycopg2
+    import psycopg2.extras
+except Exception:  # pragma: no cover
+    psycopg2 = None
+
+
+# Shared with server/index.js, whose heatmap falls back to binning floats the same way
+PRESSURE_BIN_DBAR = float(os.environ.get("ROLLUP_PRESSURE_BIN_DBAR", "10"))
+MONTHLY_TABLE = 'floats_monthly'
+PRESSURE_TABLE = 'floats_monthly_pressure'
+
+# (rollup column prefix, floats column)
+MONTHLY_VALUES = (
+    ('pressure', 'pressure_dbar'),
+    ('temperature', 'temperature_celsius'),
+    ('salinity', 'salinity_psu'),
+)
+PRESSURE_VALUES = (
+    ('temperature', 'temperature_celsius'),
+    ('salinity', 'salinity_psu'),
+)
+MONTHLY_KEYS = ('platform_id', 'month')
+PRESSURE_KEYS = ('platform_id', 'month', 'pressure_bin')
+
+# Pending rollup rows are re-aggregated once at least this many have been buffered
+COMPACT_ROWS = 200000
+
+
+def stat_columns(values):
+    return [f"{name}_{stat}" for name, _ in values for stat in ('count', 'sum', 'sumsq')]
+
+
+def _table_sql(table, keys, values):
+    key_types = {'platform_id': 'TEXT', 'month': 'TIMESTAMP', 'pressure_bin': 'DOUBLE PRECISION'}
+    columns = [f"{key} {key_types[key]} NOT NULL" for key in keys] + ["n_rows BIGINT NOT NULL"]
+    for column in stat_columns(values):
+        kind = 'BIGINT' if column.endswith('_count') else 'DOUBLE PRECISION'
+        columns.append(f"{column} {kind} NOT NULL")
+    columns.append(f"PRIMARY KEY ({', '.join(keys)})")
+    return f"CREATE TABLE IF NOT EXISTS {table} (\n    " + ",\n    ".join(columns) + "\n)"
+
+
+def _aggregate_sql(values):
+    """SELECT-list aggregates over floats rows matching stat_columns(values)."""
+    parts = ["COUNT(*) AS n_rows"]
+    for name, column in values:
+        parts += [
+            f"COUNT({column}) AS {name}_count",
+            f"COALESCE(SUM({column}), 0) AS {name}_sum",
+            f"COALESCE(SUM({column} * {column}), 0) AS {name}_sumsq",
+        ]
+    return ", ".join(parts)
+
+
+def _group_sql(keys, bin_size, alias='floats'):
+    """SELECT-list expressions for keys followed by 'GROUP BY' positions."""
+    exprs = {
+        'platform_id': f"{alias}.platform_id",
+        'month': f"DATE_TRUNC('month', {alias}.measurement_date) AS month",
+        'pressure_bin': f"FLOOR({alias}.pressure_dbar / {float(bin_size)!r}) * {float(bin_size)!r} AS pressure_bin",
+    }
+    positions = ", ".join(str(i + 1) for i in range(len(keys)))
+    return ", ".join(exprs[key] for key in keys), positions
+
+
+def _aggregate(frame, keys, values):
+    """Group a dict of equal-length column arrays by keys into rollup rows."""
+    data = {key: frame[key] for key in keys}
+    data['n_rows'] = np.ones(len(frame[keys[0]]), dtype=np.int64)
+    for name, column in values:
+        v = frame[column]
+        valid = ~np.isnan(v)
+        v = np.where(valid, v, 0.0)
+        data[f"{name}_count"] = valid.astype(np.int64)
+        data[f"{name}_sum"] = v
+        data[f"{name}_sumsq"] = v * v
+    return pd.DataFrame(data).groupby(list(keys), sort=False).sum().reset_index()
+
+
+class RollupAccumulator:
+    """Aggregate columnar batches (see app.iter_argo_batches) into rollup rows.
+
+    add() aggregates a batch in memory; flush(cursor) merges everything pending
+    into the rollup tables on the caller's transaction, so rollups commit
+    together with the floats rows they describe.
+    """
+
+    def __init__(self, bin_size=PRESSURE_BIN_DBAR):
+        self.bin_size = float(bin_size)
+        self._monthly = []
+        self._pressure = []
+        self._pending_rows = 0
+        self._compact_at = COMPACT_ROWS
+
+    @staticmethod
+    def create_tables(cursor):
+        cursor.execute(_table_sql(MONTHLY_TABLE, MONTHLY_KEYS, MONTHLY_VALUES))
+        cursor.execute(_table_sql(PRESSURE_TABLE, PRESSURE_KEYS, PRESSURE_VALUES))
+
+    def add(self, batch):
+        if not len(batch["platform_index"]):
+            return
+        # Same microsecond rounding as the stored timestamps, then truncate to the month
+        dates = np.asarray(batch["measurement_date"], dtype='datetime64[ns]')
+        dates = pd.DatetimeIndex(dates).round('us').to_numpy()
+        frame = {
+            'platform_id': np.asarray(batch["platform_index"]),
+            'month': dates.astype('datetime64[M]').astype('datetime64[ns]'),
+        }
+        for _, column in MONTHLY_VALUES:
+            frame[column] = np.asarray(batch[column], dtype=np.float64)
+        platform_ids = np.asarray(batch["platform_ids"], dtype=object)
+
+        monthly = _aggregate(frame, MONTHLY_KEYS, MONTHLY_VALUES)
+        monthly['platform_id'] = platform_ids[monthly['platform_id'].to_numpy()]
+        self._monthly.append(monthly)
+
+        binned = ~np.isnan(frame['pressure_dbar'])
+        frame = {key: values[binned] for key, values in frame.items()}
+        frame['pressure_bin'] = np.floor(frame['pressure_dbar'] / self.bin_size) * self.bin_size
+        pressure = _aggregate(frame, PRESSURE_KEYS, PRESSURE_VALUES)
+        pressure['platform_id'] = platform_ids[pressure['platform_id'].to_numpy()]
+        self._pressure.append(pressure)
+
+        self._pending_rows += len(monthly) + len(pressure)
+        if self._pending_rows >= self._compact_at:
+            self._compact()
+            # Grow the threshold when groups don't merge, so compaction stays linear
+            self._compact_at = max(COMPACT_ROWS, 2 * self._pending_rows)
+
+    def _compact(self):
+        if self._monthly:
+            self._monthly = [pd.concat(self._monthly).groupby(list(MONTHLY_KEYS), sort=False).sum().reset_index()]
+        if self._pressure:
+            self._pressure = [pd.concat(self._pressure).groupby(list(PRESSURE_KEYS), sort=False).sum().reset_index()]
+        self._pending_rows = sum(len(f) for f in self._monthly + self._pressure)
+
+    def flush(self, cursor):
+        """Merge pending totals into the rollup tables (no commit)."""
+        self._compact()
+        for table, keys, values, frames in (
+            (MONTHLY_TABLE, MONTHLY_KEYS, MONTHLY_VALUES, self._monthly),
+            (PRESSURE_TABLE, PRESSURE_KEYS, PRESSURE_VALUES, self._pressure),
+        ):
+            if frames and len(frames[0]):
+                _upsert(cursor, table, keys, values, frames[0])
+        self._monthly = []
+        self._pressure = []
+        self._pending_rows = 0
+        self._compact_at = COMPACT_ROWS
+
+    def subtract_profiles(self, cursor, profile_keys):
+        """Remove the contribution of floats rows about to be deleted by app.delete_profile_rows."""
+        rows = [(platform_id, pd.Timestamp(date, unit='ns').isoformat()) for platform_id, date in profile_keys]
+        for table, keys, values in (
+            (MONTHLY_TABLE, MONTHLY_KEYS, MONTHLY_VALUES),
+            (PRESSURE_TABLE, PRESSURE_KEYS, PRESSURE_VALUES),
+        ):
+            where = "WHERE f.pressure_dbar IS NOT NULL" if 'pressure_bin' in keys else ""
+            select, group_by = _group_sql(keys, self.bin_size, alias='f')
+            updates = ", ".join(f"{c} = r.{c} - g.{c}" for c in ['n_rows'] + stat_columns(values))
+            matches = " AND ".join(f"r.{key} = g.{key}" for key in keys)
+            psycopg2.extras.execute_values(
+                cursor,
+                f"""WITH g AS (
+                        SELECT {select}, {_aggregate_sql(values)}
+                        FROM floats AS f
+                        JOIN (VALUES %s) AS k(platform_id, measurement_date)
+                          ON f.platform_id = k.platform_id AND f.measurement_date = k.measurement_date
+                        {where}
+                        GROUP BY {group_by}
+                    )
+                    UPDATE {table} AS r SET {updates} FROM g WHERE {matches}""",
+                rows,
+                template="(%s, %s::timestamp)",
+            )
+            cursor.execute(f"DELETE FROM {table} WHERE n_rows <= 0")
+
+    def rebuild(self, cursor):
+        """Recompute both rollup tables from the floats table (no commit)."""
+        self.create_tables(cursor)
+        for table, keys, values in (
+            (MONTHLY_TABLE, MONTHLY_KEYS, MONTHLY_VALUES),
+            (PRESSURE_TABLE, PRESSURE_KEYS, PRESSURE_VALUES),
+        ):
+            where = "WHERE pressure_dbar IS NOT NULL" if 'pressure_bin' in keys else ""
+            columns = ", ".join(list(keys) + ['n_rows'] + stat_columns(values))
+            select, group_by = _group_sql(keys, self.bin_size)
+            cursor.execute(f"TRUNCATE {table}")
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT {select}, {_aggregate_sql(values)} FROM floats {where} GROUP BY {group_by}"
+            )
+
+
+def _upsert(cursor, table, keys, values, frame):
+    stats = ['n_rows'] + stat_columns(values)
+    columns = list(keys) + stats
+    frame = frame.assign(month=pd.DatetimeIndex(frame['month']).strftime('%Y-%m-%d %H:%M:%S'))
+    records = [
+        tuple(row) for row in frame[columns].astype(object).itertuples(index=False, name=None)
+    ]
+    template = "(" + ", ".join("%s::timestamp" if c == 'month' else "%s" for c in columns) + ")"
+    psycopg2.extras.execute_values(
+        cursor,
+        f"""INSERT INTO {table} ({', '.join(columns)}) VALUES %s
+            ON CONFLICT ({', '.join(keys)}) DO UPDATE SET
+            {', '.join(f'{c} = {table}.{c} + EXCLUDED.{c}' for c in stats)}""",
+        records,
+        template=template,
+        page_size=1000,
+    )
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""Spatial index of profile positions for bbox, radius and nearest-float queries.
+
+  python3 spatial_index.py INDEX --bbox MIN_LON MIN_LAT MAX_LON MAX_LAT [--start DATE] [--end DATE] [--latest]
+  python3 spatial_index.py INDEX --near LAT LON (--radius-km KM | --k K) [--start DATE] [--end DATE] [--latest]
+
+The index holds one entry per profile: platform, measurement date, latitude
+and longitude, as taken from ingested batches (see app.iter_argo_batches).
+Entries are bucketed into CELL_DEG x CELL_DEG latitude/longitude cells and
+kept sorted by cell. A query gathers the cells its area overlaps with a few
+binary searches, then filters those candidates exactly: by great-circle
+(haversine) distance for radius and nearest queries. nearest() widens its
+radius until it holds k entries.
+
+start/end restrict entries to a time window; with latest, only each
+platform's most recent profile in the window is considered, so a float that
+has since moved away is not reported near its old position.
+
+Entries added during ingestion are buffered and merged on the next query or
+save(). The index is saved as one uncompressed .npz file, so loading it is a
+few array reads.
+"""
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from interpolate import profile_starts
+
+
+CELL_DEG = 1.0
+EARTH_RADIUS_KM = 6371.0088
+INDEX_COLUMNS = ('platform', 'measurement_date', 'latitude', 'longitude')
+
+
+def _to_ns(value):
+    return None if value is None else pd.Timestamp(value).value
+
+
+def _wrap_lon(lon):
+    """Longitudes in [-180, 180)."""
+    return (np.asarray(lon, dtype=np.float64) + 180.0) % 360.0 - 180.0
+
+
+def _bound_lon(lon):
+    # Bounds already in [-180, 180] are kept, so 180 stays the eastern edge
+    return float(lon) if -180.0 <= lon <= 180.0 else float(_wrap_lon(lon))
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distance in km from (lat, lon) to each of (lats, lons)."""
+    lat, lon = math.radians(lat), math.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def profile_positions(batch):
+    """One row per profile of a columnar batch: its platform, date and position."""
+    starts = profile_starts(batch)
+    positions = {
+        "platform_ids": batch["platform_ids"],
+        "platform_index": np.asarray(batch["platform_index"])[starts],
+        "measurement_date": np.asarray(batch["measurement_date"])[starts],
+    }
+    for column in ('latitude', 'longitude'):
+        positions[column] = np.asarray(batch[column], dtype=np.float64)[starts]
+    return positions
+
+
+class SpatialIndex:
+    """Profile positions bucketed by latitude/longitude cell, loaded from and saved to path."""
+
+    def __init__(self, path=None, cell_deg=CELL_DEG):
+        self.path = path
+        self.cell_deg = cell_deg
+        self._platform_ids = []
+        self._platform_lookup = {}
+        self._columns = {
+            'platform': np.zeros(0, dtype=np.int32),
+            'measurement_date': np.zeros(0, dtype=np.int64),
+            'latitude': np.zeros(0, dtype=np.float64),
+            'longitude': np.zeros(0, dtype=np.float64),
+        }
+        self._cells = np.zeros(0, dtype=np.int64)
+        self._pending = []
+        self._latest = None
+        if path is not None and os.path.exists(path):
+            self._load(path)
+
+    @property
+    def n_cols(self):
+        return int(round(360.0 / self.cell_deg))
+
+    @property
+    def n_rows(self):
+        return int(round(180.0 / self.cell_deg))
+
+    def __len__(self):
+        self._compact()
+        return len(self._cells)
+
+    def _row(self, lat):
+        return np.clip(np.floor((np.asarray(lat) + 90.0) / self.cell_deg), 0, self.n_rows - 1).astype(np.int64)
+
+    def _col(self, lon):
+        return np.clip(np.floor((_wrap_lon(lon) + 180.0) / self.cell_deg), 0, self.n_cols - 1).astype(np.int64)
+
+    # --- building ---
+
+    def add(self, batch):
+        """Add the profiles of a columnar batch; a profile already present gets the new position."""
+        positions = profile_positions(batch)
+        valid = np.isfinite(positions['latitude']) & np.isfinite(positions['longitude'])
+        if not valid.any():
+            return
+        remap = np.array([self._platform_lookup.setdefault(p, len(self._platform_lookup))
+                          for p in positions["platform_ids"]], dtype=np.int32)
+        self._platform_ids = list(self._platform_lookup)
+        self._pending.append({
+            'platform': remap[positions['platform_index'][valid]],
+            'measurement_date': positions['measurement_date'][valid].astype(np.int64),
+            'latitude': positions['latitude'][valid],
+            'longitude': positions['longitude'][valid],
+        })
+
+    def remove_profiles(self, profile_keys):
+        """Drop the given (platform_id, measurement_date ns) profiles."""
+        self._compact()
+        keys = {}
+        for platform_id, date in profile_keys:
+            index = self._platform_lookup.get(platform_id)
+            if index is not None:
+                keys.setdefault(index, []).append(int(date))
+        if not keys:
+            return
+        drop = np.zeros(len(self._cells), dtype=bool)
+        platform = self._columns['platform']
+        for index, dates in keys.items():
+            rows = np.flatnonzero(platform == index)
+            drop[rows[np.isin(self._columns['measurement_date'][rows], dates)]] = True
+        self._take(~drop)
+
+    def _take(self, selector):
+        self._columns = {c: values[selector] for c, values in self._columns.items()}
+        self._cells = self._cells[selector]
+        self._latest = None
+
+    def _compact(self):
+        if not self._pending:
+            return
+        parts = [self._columns] + self._pending
+        self._pending = []
+        self._columns = {c: np.concatenate([p[c] for p in parts]) for c in INDEX_COLUMNS}
+        platform, dates = self._columns['platform'], self._columns['measurement_date']
+        # Keep the last-added entry of each (platform, date), then order by cell
+        order = np.lexsort((-np.arange(len(dates)), dates, platform))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (np.diff(platform[order]) != 0) | (np.diff(dates[order]) != 0)
+        keep = order[first]
+        cells = self._row(self._columns['latitude'][keep]) * self.n_cols + self._col(self._columns['longitude'][keep])
+        by_cell = np.argsort(cells, kind='stable')
+        self._columns = {c: values[keep[by_cell]] for c, values in self._columns.items()}
+        self._cells = cells[by_cell]
+        self._latest = None
+
+    def rebuild(self, rows):
+        """Replace the contents with (platform_id, measurement_date, latitude, longitude) rows."""
+        frame = pd.DataFrame(list(rows), columns=['platform_id', 'measurement_date', 'latitude', 'longitude'])
+        self._platform_ids, self._platform_lookup, self._pending = [], {}, []
+        self._columns = {c: values[:0] for c, values in self._columns.items()}
+        self._cells = self._cells[:0]
+        self._latest = None
+        if len(frame):
+            codes, platform_ids = pd.factorize(frame['platform_id'].astype(str))
+            self.add({
+                "platform_ids": list(platform_ids),
+                "platform_index": codes.astype(np.int32),
+                "measurement_date": pd.to_datetime(frame['measurement_date']).to_numpy('datetime64[ns]').astype(np.int64),
+                "latitude": frame['latitude'].to_numpy(np.float64),
+                "longitude": frame['longitude'].to_numpy(np.float64),
+            })
+        self._compact()
+
+    # --- persistence ---
+
+    def _load(self, path):
+        with np.load(path) as data:
+            self.cell_deg = float(data['cell_deg'])
+            self._platform_ids = data['platform_ids'].tolist()
+            self._columns = {c: data[c] for c in INDEX_COLUMNS}
+            self._cells = data['cells']
+        self._platform_lookup = {p: i for i, p in enumerate(self._platform_ids)}
+
+    def save(self, path=None):
+        path = path or self.path
+        self._compact()
+        # np.savez appends .npz unless the name already ends with it
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, cell_deg=np.float64(self.cell_deg), cells=self._cells,
+                 platform_ids=np.array(self._platform_ids, dtype=str), **self._columns)
+        os.replace(tmp, path)
+
+    # --- queries ---
+
+    def _eligible(self, start, end, latest):
+        """Boolean mask of entries inside the time window (and latest per platform within it)."""
+        low, high = _to_ns(start), _to_ns(end)
+        dates = self._columns['measurement_date']
+        mask = np.ones(len(dates), dtype=bool)
+        if low is not None:
+            mask &= dates >= low
+        if high is not None:
+            mask &= dates <= high
+        if not latest:
+            return mask
+        if self._latest is not None and self._latest[0] == (low, high):
+            return self._latest[1]
+        rows = np.flatnonzero(mask)
+        platform = self._columns['platform'][rows]
+        order = np.lexsort((dates[rows], platform))
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = np.diff(platform[order]) != 0
+        mask = np.zeros(len(dates), dtype=bool)
+        mask[rows[order[last]]] = True
+        self._latest = ((low, high), mask)
+        return mask
+
+    def _candidates(self, lat_low, lat_high, lon_ranges):
+        """Entry indices in the cells overlapping the latitude band and longitude ranges."""
+        rows = np.arange(self._row(max(lat_low, -90.0)), self._row(min(lat_high, 90.0)) + 1)
+        starts, stops = [], []
+        for lon_low, lon_high in lon_ranges:
+            first = rows * self.n_cols + self._col(lon_low)
+            last = rows * self.n_cols + (self.n_cols - 1 if lon_high >= 180.0 else self._col(lon_high))
+            starts.append(np.searchsorted(self._cells, first, 'left'))
+            stops.append(np.searchsorted(self._cells, last, 'right'))
+        starts, stops = np.concatenate(starts), np.concatenate(stops)
+        return np.concatenate([np.arange(a, b) for a, b in zip(starts.tolist(), stops.tolist())] +
+                              [np.zeros(0, dtype=np.intp)])
+
+    def _frame(self, rows, distance=None):
+        frame = pd.DataFrame({
+            'platform_id': np.array(self._platform_ids, dtype=object)[self._columns['platform'][rows]]
+            if len(self._platform_ids) else np.zeros(0, dtype=object),
+            'measurement_date': self._columns['measurement_date'][rows].astype('datetime64[ns]'),
+            'latitude': self._columns['latitude'][rows],
+            'longitude': self._columns['longitude'][rows],
+        })
+        if distance is None:
+            return frame.sort_values(['platform_id', 'measurement_date'], ignore_index=True)
+        frame['distance_km'] = distance
+        return frame.sort_values('distance_km', kind='stable', ignore_index=True)
+
+    def bbox(self, bbox, start=None, end=None, latest=False):
+        """Entries inside bbox = (min_lon, min_lat, max_lon, max_lat), as a DataFrame.
+
+        min_lon > max_lon selects a box across the antimeridian.
+        """
+        self._compact()
+        min_lon, min_lat, max_lon, max_lat = bbox
+        min_lon, max_lon = _bound_lon(min_lon), _bound_lon(max_lon)
+        lon_ranges = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+        rows = self._candidates(min_lat, max_lat, lon_ranges)
+        rows = rows[self._eligible(start, end, latest)[rows]]
+        lats, lons = self._columns['latitude'][rows], _wrap_lon(self._columns['longitude'][rows])
+        inside = (lats >= min_lat) & (lats <= max_lat)
+        inside &= np.logical_or.reduce([(lons >= low) & (lons <= high) for low, high in lon_ranges])
+        return self._frame(rows[inside])
+
+    def latest_positions(self, start=None, end=None):
+        """Each platform's most recent position in the time window."""
+        return self.bbox((-180.0, -90.0, 180.0, 90.0), start, end, latest=True)
+
+    def radius(self, lat, lon, radius_km, start=None, end=None, latest=False):
+        """Entries within radius_km (great-circle) of (lat, lon), nearest first, with distance_km."""
+        self._compact()
+        angle = radius_km / EARTH_RADIUS_KM
+        dlat = math.degrees(angle)
+        lon_ranges = [(-180.0, 180.0)]
+        if lat - dlat > -90.0 and lat + dlat < 90.0 and math.sin(angle) < math.cos(math.radians(lat)):
+            # Widest longitude span of a cap that doesn't contain a pole
+            dlon = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+            low, high = float(_wrap_lon(lon - dlon)), float(_wrap_lon(lon + dlon))
+            lon_ranges = [(low, high)] if low <= high else [(low, 180.0), (-180.0, high)]
+        rows = self._candidates(lat - dlat, lat + dlat, lon_ranges)
+        rows = rows[self._eligible(start, end, latest)[rows]]
+        distance = haversine_km(lat, lon, self._columns['latitude'][rows], self._columns['longitude'][rows])
+        inside = distance <= radius_km
+        return self._frame(rows[inside], distance[inside])
+
+    def nearest(self, lat, lon, k=10, start=None, end=None, latest=False):
+        """The k entries nearest to (lat, lon), nearest first, with distance_km."""
+        radius_km = EARTH_RADIUS_KM * math.radians(self.cell_deg)
+        while True:
+            found = self.radius(lat, lon, radius_km, start, end, latest)
+            if len(found) >= k or radius_km >= math.pi * EARTH_RADIUS_KM:
+                return found.head(k)
+            radius_km *= 4
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Query a spatial index of float positions.")
+    parser.add_argument("index", help="index file written by app.py --spatial-index")
+    parser.add_argument("--bbox", nargs=4, type=float, metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"))
+    parser.add_argument("--near", nargs=2, type=float, metavar=("LAT", "LON"))
+    parser.add_argument("--radius-km", type=float, help="with --near: every entry within this distance")
+    parser.add_argument("--k", type=int, default=10, help="with --near and no --radius-km: nearest entries")
+    parser.add_argument("--start", help="only profiles on or after this date")
+    parser.add_argument("--end", help="only profiles on or before this date")
+    parser.add_argument("--latest", action="store_true", help="only each platform's latest profile in the window")
+    args = parser.parse_args()
+
+    try:
+        if not os.path.exists(args.index):
+            raise FileNotFoundError(f"Index not found: {args.index}")
+        index = SpatialIndex(args.index)
+        if args.near is not None and args.radius_km is not None:
+            result = index.radius(*args.near, args.radius_km, args.start, args.end, args.latest)
+        elif args.near is not None:
+            result = index.nearest(*args.near, args.k, args.start, args.end, args.latest)
+        else:
+            result = index.bbox(args.bbox or (-180.0, -90.0, 180.0, 90.0), args.start, args.end, args.latest)
+        print(result.to_json(orient="records", date_format="iso"))
+        return 0
+    except Exception as exc:
+        print(json.dumps({"error": str(exc)}))
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+// analyzer-client.js
+// Keeps one `python3 <script> --serve` process alive and talks to it over
+// JSON lines (see analyzer/service.py), so uploads don't pay interpreter and
+// numpy/pandas/xarray startup on every request.
+import { spawn } from "child_process";
+import readline from "readline";
+
+export class AnalyzerService {
+  constructor(scriptPath, { workers = 2, timeoutMs = 120000, python = "python3" } = {}) {
+    this.scriptPath = scriptPath;
+    this.workers = workers;
+    this.timeoutMs = timeoutMs;
+    this.python = python;
+    this.child = null;
+    this.nextId = 0;
+    this.pending = new Map();
+    this.restarts = 0;
+  }
+
+  start() {
+    if (this.child) return this.child;
+    const child = spawn(this.python, [this.scriptPath, "--serve", "--workers", String(this.workers)], {
+      stdio: ["pipe", "pipe", "pipe"],
+    });
+    this.child = child;
+
+    readline.createInterface({ input: child.stdout }).on("line", (line) => this.handleLine(line));
+    child.stderr.on("data", (chunk) => console.error(`[analyzer] ${chunk.toString().trimEnd()}`));
+    child.on("error", (err) => this.handleExit(child, err));
+    child.on("exit", (code, signal) =>
+      this.handleExit(child, new Error(`Analyzer service exited (code ${code}, signal ${signal})`))
+    );
+    return child;
+  }
+
+  // A dead service fails its pending requests; the next request spawns a new one
+  handleExit(child, err) {
+    if (this.child !== child) return;
+    this.child = null;
+    this.restarts += 1;
+    for (const { reject, timer } of this.pending.values()) {
+      clearTimeout(timer);
+      reject(err);
+    }
+    this.pending.clear();
+  }
+
+  handleLine(line) {
+    let message;
+    try {
+      message = JSON.parse(line);
+    } catch (err) {
+      console.error("Analyzer sent invalid JSON:", line.slice(0, 200));
+      return;
+    }
+    const entry = this.pending.get(message.id);
+    if (!entry) return;
+    this.pending.delete(message.id);
+    clearTimeout(entry.timer);
+    if (message.error) entry.reject(new Error(message.error));
+    else entry.resolve(message.result);
+  }
+
+  request(payload) {
+    const child = this.start();
+    const id = ++this.nextId;
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        reject(new Error(`Analyzer request timed out after ${this.timeoutMs} ms`));
+        // A worker is still stuck on the request and holds one of the service's
+        // slots: restart the service (failing its other in-flight requests) so
+        // the next request gets a fresh one
+        if (this.child === child) {
+          console.error(`Analyzer request ${id} timed out; restarting the analyzer service`);
+          this.restart(`Analyzer service restarted after request ${id} timed out`);
+        }
+      }, this.timeoutMs);
+      this.pending.set(id, { resolve, reject, timer });
+      child.stdin.write(JSON.stringify({ id, ...payload }) + "\n");
+    });
+  }
+
+  // timings: ask for a per-stage "timings" block in the result (analyzer/timings.py)
+  // format: "columnar" returns records as one array per field (analyzer/encoding.py)
+  analyze(filePath, { timings = false, format } = {}) {
+    return this.request({
+      op: "analyze",
+      path: filePath,
+      ...(timings ? { timings: true } : {}),
+      ...(format === "columnar" ? { format } : {}),
+    });
+  }
+
+  // Header-only format check and size estimates (analyzer/sniff.py)
+  sniff(filePath) {
+    return this.request({ op: "sniff", path: filePath });
+  }
+
+  cacheStats() {
+    return this.request({ op: "cache_stats" });
+  }
+
+  async health() {
+    const result = await this.request({ op: "health" });
+    return { ...result, client_restarts: this.restarts };
+  }
+
+  // Kill the service; in-flight requests fail now and the next request respawns it
+  restart(reason = "Analyzer service restarted") {
+    const child = this.child;
+    if (!child) return;
+    this.handleExit(child, new Error(reason));
+    child.kill();
+  }
+}
@@ -6,7 +6,9 @@ import multer from "multer";
 import path from "path";
 import fs from "fs";
 import { fileURLToPath } from "url";
-import { execFile } from "child_process";
+import { execFile, spawn } from "child_process";
+import { once } from "events";
+import { AnalyzerService } from "./analyzer-client.js";
 
 const { Pool } = pkg;
 
@@ -30,6 +32,15 @@ const storage = multer.diskStorage({
   },
 });
 
+// Long-lived analyzer process (python3 analyzer/app.py --serve)
+const analyzerScript = path.join(__dirname, "../analyzer/app.py");
+const subsetScript = path.join(__dirname, "../analyzer/subset.py");
+const exportScript = path.join(__dirname, "../analyzer/export.py");
+const analyzer = new AnalyzerService(analyzerScript, {
+  workers: Number(process.env.ANALYZER_WORKERS) || 2,
+  timeoutMs: 120000,
+});
+
 const upload = multer({
   storage,
   fileFilter: (req, file, cb) => {
@@ -64,30 +75,69 @@ app.post("/api/analyze-nc", express.urlencoded({ extended: true }), async (req,
     const filePath = path.join(uploadDir, filename);
     if (!fs.existsSync(filePath)) return res.status(404).json({ error: "File not found" });
 
-    const pythonScript = path.join(__dirname, "../analyzer/app.py");
-    if (!fs.existsSync(pythonScript)) {
+    if (!fs.existsSync(analyzerScript)) {
       return res.status(500).json({ error: "Python analyzer not found at analyzer/app.py" });
     }
 
-    execFile("python3", [pythonScript, filePath], { timeout: 120000 }, (error, stdout, stderr) => {
-      if (error) {
-        console.error("Python error:", error, stderr);
-        return res.status(500).json({ error: "Analysis failed", details: stderr?.toString() });
+    try {
+      // Files that are not NetCDF, or are Argo files missing required fields, are turned away before any data is read
+      const sniff = await analyzer.sniff(filePath);
+      if (sniff.route === "reject") {
+        return res.status(422).json({ error: "Unsupported file", details: sniff.error, sniff });
       }
-      try {
-        const result = JSON.parse(stdout.toString());
-        return res.status(200).json(result);
-      } catch (parseErr) {
-        console.error("Failed to parse python output as JSON:", parseErr, stdout);
-        return res.status(500).json({ error: "Invalid analysis output" });
-      }
-    });
+      // ?timings=1 (or timings=1 in the body) adds per-stage wall time / peak RSS to the result
+      const timings = [req.body.timings, req.query.timings].some((v) => v === "1" || v === "true");
+      // ?format=columnar returns records as one array per field instead of per-row objects
+      const format = req.body.format || req.query.format;
+      const result = await analyzer.analyze(filePath, { timings, format });
+      return res.status(200).json(result);
+    } catch (analysisErr) {
+      console.error("Python error:", analysisErr);
+      return res.status(500).json({ error: "Analysis failed", details: analysisErr.message });
+    }
   } catch (err) {
     console.error("Analyze error:", err);
     return res.status(500).json({ error: "Failed to analyze file" });
   }
 });
 
+// Header-only check of an upload: format, Argo layout, row/byte estimates and a
+// suggested route ("interactive", "background" or "reject"), in milliseconds
+app.post("/api/sniff-nc", express.urlencoded({ extended: true }), async (req, res) => {
+  try {
+    const { filename } = req.body;
+    if (!filename) return res.status(400).json({ error: "filename is required" });
+    const filePath = path.join(uploadDir, filename);
+    if (!fs.existsSync(filePath)) return res.status(404).json({ error: "File not found" });
+    return res.status(200).json(await analyzer.sniff(filePath));
+  } catch (err) {
+    console.error("Sniff error:", err);
+    return res.status(500).json({ error: "Failed to inspect file", details: err.message });
+  }
+});
+
+// Analyzer service health / manual restart
+app.get("/api/analyzer/health", async (req, res) => {
+  try {
+    return res.status(200).json(await analyzer.health());
+  } catch (err) {
+    return res.status(503).json({ ok: false, error: err.message });
+  }
+});
+
+app.get("/api/analyzer/cache", async (req, res) => {
+  try {
+    return res.status(200).json(await analyzer.cacheStats());
+  } catch (err) {
+    return res.status(503).json({ error: err.message });
+  }
+});
+
+app.post("/api/analyzer/restart", (req, res) => {
+  analyzer.restart();
+  return res.status(202).json({ ok: true });
+});
+
 // PostgreSQL connection (Docker configuration)
 const pool = new Pool({
   user: process.env.DB_USER || "ayush", // your postgres username
@@ -312,69 +362,12 @@ app.get("/export-netcdf", async (req, res) => {
     // Create temp output file path
     const tmpOut = path.join(uploadDir, `export_${Date.now()}.nc`);
 
-    // Use a small Python script with xarray to subset and write NetCDF
-    const pyCode = `
-import sys, json, os
-import pandas as pd
-try:
-    import xarray as xr
-except Exception as exc:
-    print(json.dumps({"error": f"xarray not available: {exc}"}))
-    sys.exit(1)
-
-src = sys.argv[1]
-dst = sys.argv[2]
-var = sys.argv[3] if sys.argv[3] != "__NONE__" else None
-start = sys.argv[4] if sys.argv[4] != "__NONE__" else None
-end = sys.argv[5] if sys.argv[5] != "__NONE__" else None
-
-try:
-    ds = xr.open_dataset(src)
-    # Try to find a time coordinate
-    time_key = None
-    for k in ["time", "TIME", "JULD", "juld"]:
-        if k in ds.variables or k in ds.coords:
-            time_key = k
-            break
-
-    # Apply time filter if available
-    if time_key and (start or end):
-        t = pd.to_datetime(ds[time_key].to_pandas(), errors='coerce')
-        mask = pd.Series([True]*len(t))
-        if start:
-            mask &= t >= pd.to_datetime(start)
-        if end:
-            # include entire end day
-            mask &= t <= pd.to_datetime(end) + pd.Timedelta(days=1)
-        # index along time dim
-        dim_name = ds[time_key].dims[0] if ds[time_key].dims else time_key
-        ds = ds.sel({dim_name: mask.values})
-
-    # If variable specified, keep it plus coordinates
-    if var and var in ds:
-        keep = {var: ds[var]}
-        # Keep likely coords
-        for ck in ["lat", "latitude", "LATITUDE", "lon", "longitude", "LONGITUDE", "PRES", "PRES_ADJUSTED", time_key]:
-            if ck and ck in ds and ck not in keep:
-                keep[ck] = ds[ck]
-        ds = xr.Dataset(keep)
-
-    ds.to_netcdf(dst)
-    print(json.dumps({"ok": True, "path": dst}))
-except Exception as exc:
-    print(json.dumps({"error": str(exc)}))
-    sys.exit(1)
-`;
-
-    const args = [
-      "-c",
-      pyCode,
-      srcPath,
-      tmpOut,
-      variable ? String(variable) : "__NONE__",
-      start ? String(start) : "__NONE__",
-      end ? String(end) : "__NONE__",
-    ];
+    // analyzer/subset.py reads only the selected variables and time slices and
+    // writes compressed, chunked NetCDF (EXPORT_NC_COMPLEVEL / EXPORT_NC_CHUNK_ROWS)
+    const args = [subsetScript, srcPath, tmpOut];
+    if (variable) args.push("--variable", String(variable));
+    if (start) args.push("--start", String(start));
+    if (end) args.push("--end", String(end));
 
     execFile("python3", args, { timeout: 120000 }, (error, stdout, stderr) => {
       const cleanup = () => {
@@ -408,8 +401,63 @@ except Exception as exc:
   }
 });
 
+// Stream a SELECT to the response as CSV, NDJSON or a JSON array, fetching
+// EXPORT_FETCH_ROWS rows at a time from a server-side cursor (no row cap)
+const EXPORT_FETCH_ROWS = 10000;
+const escapeCsv = (value) => {
+  if (value === null || value === undefined) return "";
+  const str = String(value);
+  if (/[",\n]/.test(str)) {
+    return '"' + str.replace(/"/g, '""') + '"';
+  }
+  return str;
+};
+
+async function streamQuery(res, fmt, sql, params, sendHeaders) {
+  const client = await pool.connect();
+  try {
+    await client.query("BEGIN");
+    await client.query(`DECLARE export_cursor NO SCROLL CURSOR FOR ${sql}`, params);
+    res.status(200);
+    sendHeaders();
+    if (fmt === "json") res.write("[");
+    let headers = null;
+    let count = 0;
+    while (!res.destroyed) {
+      const { rows } = await client.query(`FETCH ${EXPORT_FETCH_ROWS} FROM export_cursor`);
+      if (!rows.length) break;
+      let text = "";
+      for (const row of rows) {
+        if (fmt === "csv") {
+          if (!headers) {
+            headers = Object.keys(row);
+            text += headers.join(",");
+          }
+          text += (text || count ? "\n" : "") + headers.map((h) => escapeCsv(row[h])).join(",");
+        } else if (fmt === "ndjson") {
+          text += JSON.stringify(row) + "\n";
+        } else {
+          text += (count ? "," : "") + JSON.stringify(row);
+        }
+        count += 1;
+      }
+      if (!res.write(text)) await Promise.race([once(res, "drain"), once(res, "close")]);
+    }
+    if (!res.destroyed) {
+      if (fmt === "json") res.write("]");
+      res.end();
+    }
+    await client.query("COMMIT");
+  } catch (err) {
+    await client.query("ROLLBACK").catch(() => {});
+    throw err;
+  } finally {
+    client.release();
+  }
+}
+
 // Export human-readable data (CSV or JSON) using the same filters
-// GET /export-readable?format=csv|json&filename=...&variable=...&startDate=...&endDate=...&month=...&year=...
+// GET /export-readable?format=csv|json|ndjson&filename=...&variable=...&startDate=...&endDate=...&month=...&year=...
 app.get("/export-readable", async (req, res) => {
   try {
     const { filename, variable, startDate, endDate, month, year } = req.query;
@@ -444,210 +492,107 @@ app.get("/export-readable", async (req, res) => {
       end = end || endStr;
     }
 
-    // Python that prints CSV/JSON to stdout
-    const pyCode = `
-import sys, json, pandas as pd
-try:
-    import xarray as xr
-except Exception as exc:
-    print(json.dumps({"error": f"xarray not available: {exc}"}))
-    sys.exit(1)
-
-src = sys.argv[1]
-fmt = sys.argv[2]
-var = sys.argv[3] if sys.argv[3] != "__NONE__" else None
-start = sys.argv[4] if sys.argv[4] != "__NONE__" else None
-end = sys.argv[5] if sys.argv[5] != "__NONE__" else None
-
-try:
-    ds = xr.open_dataset(src)
-    # detect time/lat/lon/pressure/temp/sal variables
-    def find(keys):
-        for k in keys:
-            if k in ds.variables or k in ds.coords:
-                return k
-        lower = {k.lower(): k for k in ds.variables.keys()}
-        for k in keys:
-            if k.lower() in lower:
-                return lower[k.lower()]
-        return None
-
-    time_key = find(["time","TIME","JULD","juld"]) 
-    lat_key = find(["latitude","LATITUDE","lat","LAT"]) 
-    lon_key = find(["longitude","LONGITUDE","lon","LON"]) 
-    pres_key = find(["pressure","PRES","PRES_ADJUSTED"]) 
-    temp_key = find(["TEMP","TEMP_ADJUSTED","temperature"]) 
-    sal_key = find(["PSAL","PSAL_ADJUSTED","salinity"]) 
-    platform_key = find(["platform_number","PLATFORM_NUMBER","float_serial_no","FLOAT_SERIAL_NO","platform"]) 
-
-    if time_key and (start or end):
-        t = pd.to_datetime(ds[time_key].to_pandas(), errors='coerce')
-        mask = pd.Series([True]*len(t))
-        if start:
-            mask &= t >= pd.to_datetime(start)
-        if end:
-            mask &= t <= pd.to_datetime(end) + pd.Timedelta(days=1)
-        dim_name = ds[time_key].dims[0] if ds[time_key].dims else time_key
-        ds = ds.sel({dim_name: mask.values})
-
-    cols = []
-    if platform_key and platform_key in ds: cols.append((platform_key, 'platform'))
-    if time_key and time_key in ds: cols.append((time_key, 'time'))
-    if lat_key and lat_key in ds: cols.append((lat_key, 'lat'))
-    if lon_key and lon_key in ds: cols.append((lon_key, 'lon'))
-    if pres_key and pres_key in ds: cols.append((pres_key, 'pressure'))
-    if temp_key and temp_key in ds: cols.append((temp_key, 'temperature'))
-    if sal_key and sal_key in ds: cols.append((sal_key, 'salinity'))
-    # include requested variable if provided and not already in list
-    if var and var in ds and all(var != c[0] for c in cols):
-        cols.append((var, var))
-
-    if not cols:
-        print(json.dumps({"error": "No recognizable variables to export"}))
-        sys.exit(1)
-
-    df_parts = []
-    for k, alias in cols:
-        s = ds[k].to_pandas()
-        s = s.reset_index()
-        s = s.rename(columns={k: alias})
-        # keep only alias column and any index columns like time dims
-        df_parts.append(s)
-
-    # merge on common index columns if possible
-    from functools import reduce
-    def smart_merge(a,b):
-        common = [c for c in a.columns if c in b.columns and c not in [col for _, col in cols]]
-        if not common:
-            return pd.concat([a, b], axis=1)
-        return pd.merge(a, b, on=common, how='outer')
-
-    df = reduce(smart_merge, df_parts)
-
-    # thin to reasonable size
-    if len(df) > 100000:
-        df = df.sample(100000, random_state=0).sort_index()
-
-    if fmt == 'json':
-        print(df.to_json(orient='records'))
-    else:
-        # csv
-        print(df.to_csv(index=False))
-except Exception as exc:
-    print(json.dumps({"error": str(exc)}))
-    sys.exit(1)
-`;
-
-    const args = ["-c", pyCode, srcPath, format, variable ? String(variable) : "__NONE__", start ? String(start) : "__NONE__", end ? String(end) : "__NONE__"];
-
-    execFile("python3", args, { timeout: 120000 }, async (error, stdout, stderr) => {
-      if (error) {
-        console.error("Readable export error (python path):", error, stderr);
-        // Fallback to database export if python/xarray not available
-        try {
-          const colMap = {
-            salinity: "salinity_psu",
-            temperature: "temperature_celsius",
-            pressure: "pressure_dbar",
-          };
-
-          const selected = [];
-          const wheres = [];
-          const params = [];
-
-          // Select a reasonable set of columns
-          if (variable && colMap[String(variable).toLowerCase()]) {
-            selected.push(colMap[String(variable).toLowerCase()] + " AS " + String(variable).toLowerCase());
-          }
-          selected.push(
-            "platform_id",
-            "measurement_date",
-            "latitude",
-            "longitude",
-            "pressure_dbar",
-            "temperature_celsius",
-            "salinity_psu"
-          );
-
-          // Time filters
-          let start = startDate;
-          let end = endDate;
-          if (month && year && (!start || !end)) {
-            const m = String(month).padStart(2, "0");
-            const y = String(year);
-            start = start || `${y}-${m}-01`;
-            const endDateObj = new Date(Number(y), Number(m), 0);
-            const endStr = `${endDateObj.getFullYear()}-${String(endDateObj.getMonth() + 1).padStart(2, "0")}-${String(endDateObj.getDate()).padStart(2, "0")}`;
-            end = end || endStr;
-          }
-          if (start) {
-            params.push(start);
-            wheres.push(`measurement_date >= $${params.length}`);
-          }
-          if (end) {
-            params.push(end + " 23:59:59");
-            wheres.push(`measurement_date <= $${params.length}`);
-          }
-
-          const sql = `SELECT ${[...new Set(selected)].join(",")} FROM floats ${wheres.length ? "WHERE " + wheres.join(" AND ") : ""} ORDER BY platform_id, measurement_date LIMIT 100000`;
-          const result = await pool.query(sql, params);
+    const contentTypes = {
+      csv: "text/csv; charset=utf-8",
+      json: "application/json; charset=utf-8",
+      ndjson: "application/x-ndjson; charset=utf-8",
+    };
+    const fmt = contentTypes[format] ? format : "csv";
+    const sendHeaders = () => {
+      res.setHeader("Content-Type", contentTypes[fmt]);
+      res.setHeader("Content-Disposition", `attachment; filename="argo_data.${fmt}"`);
+    };
 
-          if (format === "json") {
-            res.setHeader("Content-Type", "application/json; charset=utf-8");
-            res.setHeader("Content-Disposition", `attachment; filename="argo_data.json"`);
-            return res.status(200).send(JSON.stringify(result.rows));
-          }
+    // analyzer/export.py writes rows in fixed-size chunks; pass them straight through
+    const args = [exportScript, srcPath, "--format", fmt];
+    if (variable) args.push("--variable", String(variable));
+    if (start) args.push("--start", String(start));
+    if (end) args.push("--end", String(end));
+
+    const child = spawn("python3", args, { stdio: ["ignore", "pipe", "pipe"] });
+    let stderr = "";
+    let started = false;
+    let finished = false;
+    child.stderr.on("data", (chunk) => {
+      stderr += chunk;
+    });
+    child.stdout.on("data", (chunk) => {
+      if (!started) {
+        started = true;
+        res.status(200);
+        sendHeaders();
+      }
+      if (!res.write(chunk)) {
+        child.stdout.pause();
+        res.once("drain", () => child.stdout.resume());
+      }
+    });
+    res.on("close", () => {
+      if (child.exitCode === null) child.kill();
+    });
 
-          // CSV fallback
-          const rows = result.rows || [];
-          if (rows.length === 0) {
-            res.setHeader("Content-Type", "text/csv; charset=utf-8");
-            res.setHeader("Content-Disposition", `attachment; filename="argo_data.csv"`);
-            return res.status(200).send("");
-          }
-          const headers = Object.keys(rows[0]);
-          const escapeCsv = (value) => {
-            if (value === null || value === undefined) return "";
-            const str = String(value);
-            if (/[",\n]/.test(str)) {
-              return '"' + str.replace(/"/g, '""') + '"';
-            }
-            return str;
-          };
-          const csvLines = [headers.join(",")];
-          for (const row of rows) {
-            csvLines.push(headers.map((h) => escapeCsv(row[h])).join(","));
-          }
-          const csv = csvLines.join("\n");
-          res.setHeader("Content-Type", "text/csv; charset=utf-8");
-          res.setHeader("Content-Disposition", `attachment; filename="argo_data.csv"`);
-          return res.status(200).send(csv);
-        } catch (dbErr) {
-          console.error("Readable export DB fallback error:", dbErr);
-          return res.status(500).json({ error: "Failed to export readable data" });
+    const finish = async (code, err) => {
+      if (finished) return;
+      finished = true;
+      if (started) {
+        if (res.destroyed) return; // client went away; child already killed
+        if (code !== 0) {
+          console.error("Readable export failed mid-stream:", err || stderr);
+          return res.destroy();
         }
+        return res.end();
       }
-      const out = stdout.toString();
-      // If output looks like a JSON error payload
-      if (out.trim().startsWith("{")) {
-        try {
-          const j = JSON.parse(out);
-          if (j && j.error) {
-            return res.status(400).json(j);
-          }
-        } catch {}
+      if (code === 0) {
+        sendHeaders();
+        return res.status(200).end();
       }
 
-      if (format === "json") {
-        res.setHeader("Content-Type", "application/json; charset=utf-8");
-        res.setHeader("Content-Disposition", `attachment; filename="argo_data.json"`);
-        return res.status(200).send(out);
+      console.error("Readable export error (python path):", err || stderr);
+      // Fallback to database export if python/xarray not available
+      try {
+        const colMap = {
+          salinity: "salinity_psu",
+          temperature: "temperature_celsius",
+          pressure: "pressure_dbar",
+        };
+
+        const selected = [];
+        const wheres = [];
+        const params = [];
+
+        // Select a reasonable set of columns
+        if (variable && colMap[String(variable).toLowerCase()]) {
+          selected.push(colMap[String(variable).toLowerCase()] + " AS " + String(variable).toLowerCase());
+        }
+        selected.push(
+          "platform_id",
+          "measurement_date",
+          "latitude",
+          "longitude",
+          "pressure_dbar",
+          "temperature_celsius",
+          "salinity_psu"
+        );
+
+        if (start) {
+          params.push(start);
+          wheres.push(`measurement_date >= $${params.length}`);
+        }
+        if (end) {
+          params.push(end + " 23:59:59");
+          wheres.push(`measurement_date <= $${params.length}`);
+        }
+
+        const sql = `SELECT ${[...new Set(selected)].join(",")} FROM floats ${wheres.length ? "WHERE " + wheres.join(" AND ") : ""} ORDER BY platform_id, measurement_date`;
+        await streamQuery(res, fmt, sql, params, sendHeaders);
+      } catch (dbErr) {
+        console.error("Readable export DB fallback error:", dbErr);
+        if (res.headersSent) return res.destroy();
+        return res.status(500).json({ error: "Failed to export readable data" });
       }
-      // default CSV
-      res.setHeader("Content-Type", "text/csv; charset=utf-8");
-      res.setHeader("Content-Disposition", `attachment; filename="argo_data.csv"`);
-      return res.status(200).send(out);
-    });
+    };
+    child.on("error", (err) => finish(1, err));
+    child.on("close", (code) => finish(code));
   } catch (err) {
     console.error("Export Readable error:", err);
     return res.status(500).json({ error: "Failed to export readable data" });
@@ -655,21 +600,37 @@ except Exception as exc:
 });
 
 // Monthly average salinity & pressure for a float
+// Reads floats_monthly (maintained by python/app.py ingestion, see python/rollups.py);
+// platforms not rolled up yet fall back to aggregating raw rows
 app.get("/api/floats/:platform_id/monthly-avg", async (req, res) => {
   const { platform_id } = req.params;
   console.log(`Fetching monthly averages for platform: ${platform_id}`);
   try {
-    const result = await pool.query(
-      `SELECT 
-         DATE_TRUNC('month', measurement_date) AS month,
-         AVG(salinity_psu) AS avg_salinity,
-         AVG(pressure_dbar) AS avg_pressure
-       FROM floats
-       WHERE platform_id = $1
-       GROUP BY month
-       ORDER BY month`,
-      [platform_id]
-    );
+    let result = await pool
+      .query(
+        `SELECT
+           month,
+           salinity_sum / NULLIF(salinity_count, 0) AS avg_salinity,
+           pressure_sum / NULLIF(pressure_count, 0) AS avg_pressure
+         FROM floats_monthly
+         WHERE platform_id = $1
+         ORDER BY month`,
+        [platform_id]
+      )
+      .catch(() => ({ rows: [] }));
+    if (result.rows.length === 0) {
+      result = await pool.query(
+        `SELECT 
+           DATE_TRUNC('month', measurement_date) AS month,
+           AVG(salinity_psu) AS avg_salinity,
+           AVG(pressure_dbar) AS avg_pressure
+         FROM floats
+         WHERE platform_id = $1
+         GROUP BY month
+         ORDER BY month`,
+        [platform_id]
+      );
+    }
 
     console.log(`Monthly averages query returned ${result.rows.length} rows`);
     res.json(result.rows);
@@ -683,24 +644,44 @@ app.get("/api/floats/:platform_id/monthly-avg", async (req, res) => {
 
 
 
-// Monthly average temperature per pressure for a float
+// Monthly average temperature per pressure bin for a float
+// pressure_dbar is the lower edge of the floats_monthly_pressure bin. Its width
+// is ROLLUP_PRESSURE_BIN_DBAR, as for python/app.py --pressure-bin, and is
+// returned in the X-Pressure-Bin-Dbar header
+const PRESSURE_BIN_DBAR = Number(process.env.ROLLUP_PRESSURE_BIN_DBAR) || 10;
+
 app.get("/api/floats/:platform_id/monthly-heatmap", async (req, res) => {
   const { platform_id } = req.params;
   console.log(`Fetching monthly heatmap for platform: ${platform_id}`);
   try {
-    const result = await pool.query(
-      `SELECT 
-         DATE_TRUNC('month', measurement_date) AS month,
-         pressure_dbar,
-         AVG(temperature_celsius) AS avg_temperature
-       FROM floats
-       WHERE platform_id = $1
-       GROUP BY month, pressure_dbar
-       ORDER BY month, pressure_dbar`,
-      [platform_id]
-    );
+    let result = await pool
+      .query(
+        `SELECT
+           month,
+           pressure_bin AS pressure_dbar,
+           temperature_sum / NULLIF(temperature_count, 0) AS avg_temperature
+         FROM floats_monthly_pressure
+         WHERE platform_id = $1
+         ORDER BY month, pressure_bin`,
+        [platform_id]
+      )
+      .catch(() => ({ rows: [] }));
+    if (result.rows.length === 0) {
+      result = await pool.query(
+        `SELECT 
+           DATE_TRUNC('month', measurement_date) AS month,
+           FLOOR(pressure_dbar / $2::double precision) * $2::double precision AS pressure_dbar,
+           AVG(temperature_celsius) AS avg_temperature
+         FROM floats
+         WHERE platform_id = $1 AND pressure_dbar IS NOT NULL
+         GROUP BY 1, 2
+         ORDER BY 1, 2`,
+        [platform_id, PRESSURE_BIN_DBAR]
+      );
+    }
 
     console.log(`Monthly heatmap query returned ${result.rows.length} rows`);
+    res.set("X-Pressure-Bin-Dbar", String(PRESSURE_BIN_DBAR));
     res.json(result.rows);
   } catch (err) {
     console.error("Error fetching monthly heatmap data:", err);